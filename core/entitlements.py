@@ -0,0 +1,43 @@
+#pylint:disable=all
+"""Cached per-company access to compiled subscription entitlements.
+
+Entries are dropped by ``core.signals`` whenever a Subscription is saved
+(e.g. a renewal in ``PaymentSuccessView``); the TTL bounds staleness for
+changes made by other processes.
+"""
+import threading
+import time
+
+from .models import Subscription
+
+ENTITLEMENTS_CACHE_TTL = 60  # seconds
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def get_entitlements(company_id):
+    """Return the company's ``Entitlements`` or None when it has no subscription."""
+    entry = _cache.get(company_id)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    subscription = Subscription.objects.filter(company_id=company_id).first()
+    entitlements = subscription.entitlements if subscription else None
+    with _lock:
+        _cache[company_id] = (entitlements, time.monotonic() + ENTITLEMENTS_CACHE_TTL)
+    return entitlements
+
+
+async def aget_entitlements(company_id):
+    """Async :func:`get_entitlements`; cache hits never leave the event loop."""
+    from asgiref.sync import sync_to_async
+
+    entry = _cache.get(company_id)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return await sync_to_async(get_entitlements)(company_id)
+
+
+def invalidate_entitlements(company_id):
+    with _lock:
+        _cache.pop(company_id, None)
@@ -52,25 +52,89 @@ class Subscription(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._entitlements = Entitlements(self)
+
+    @property
+    def entitlements(self):
+        """Compiled feature set and quota snapshot of this subscription."""
+        if getattr(self, "_entitlements", None) is None:
+            self._entitlements = Entitlements(self)
+        return self._entitlements
+
     def is_active(self):
         return self.status == "active" and self.end_date > timezone.now()
     
     def lead_quota_exceeded(self):
         return (self.leads_used >= self.lead_quota)
+
+    def _quota_left(self):
+        return Subscription.objects.filter(pk=self.pk, leads_used__lt=models.F("lead_quota"))
+
+    def reserve_lead(self):
+        """Count one new lead against the quota.
+
+        A single conditional ``UPDATE ... SET leads_used = leads_used + 1
+        WHERE leads_used < lead_quota``, so concurrent webhooks can neither
+        lose increments nor overwrite other columns. Returns False when the
+        quota is already used up.
+        """
+        return self._quota_left().update(leads_used=models.F("leads_used") + 1) == 1
+
+    async def areserve_lead(self):
+        return await self._quota_left().aupdate(leads_used=models.F("leads_used") + 1) == 1
+
+    def has_lead_quota(self):
+        """Quota check against the database rather than this (possibly cached) instance."""
+        return self._quota_left().exists()
+
+    async def ahas_lead_quota(self):
+        return await self._quota_left().aexists()
     
     def has_permission(self, feature_name):
-        features_allowed = self.data.get("features_allowed", [])
-        for feature in features_allowed:
-            if feature.get("name") == feature_name:
-                return True
-        return False
+        return self.entitlements.has_permission(feature_name)
     
     def get_feature(self, feature_name):
-        features_allowed = self.data.get("features_allowed", [])
-        for feature in features_allowed:
-            if feature.get("name") == feature_name:
-                return feature
-        return None
+        return self.entitlements.get_feature(feature_name)
+
+
+class Entitlements:
+    """Read-only snapshot of a subscription's features and lead quota.
+
+    ``features_allowed`` is compiled once into a frozenset and a name -> config
+    map, so permission checks on hot paths are set lookups instead of scans
+    over the JSON list.
+    """
+
+    __slots__ = ("subscription_id", "company_id", "plan_id", "status", "end_date",
+                 "lead_quota", "leads_used", "features", "feature_config")
+
+    def __init__(self, subscription):
+        self.subscription_id = subscription.id
+        self.company_id = subscription.company_id
+        self.plan_id = subscription.plan_id
+        self.status = subscription.status
+        self.end_date = subscription.end_date
+        self.lead_quota = subscription.lead_quota
+        self.leads_used = subscription.leads_used
+        self.feature_config = {
+            feature.get("name"): feature
+            for feature in (subscription.data or {}).get("features_allowed", [])
+        }
+        self.features = frozenset(self.feature_config)
+
+    def is_active(self):
+        return self.status == "active" and self.end_date > timezone.now()
+
+    def lead_quota_exceeded(self):
+        return self.leads_used >= self.lead_quota
+
+    def has_permission(self, feature_name):
+        return feature_name in self.features
+
+    def get_feature(self, feature_name):
+        return self.feature_config.get(feature_name)
 
 
 class Transaction(models.Model):
@@ -114,7 +178,8 @@ class EventRegister(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['event_id', 'processed_at']),
+            # event_id is already unique; purging expired ids scans by age
+            models.Index(fields=['processed_at']),
         ]
     
     def __str__(self):
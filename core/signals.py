@@ -0,0 +1,12 @@
+#pylint:disable=all
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .entitlements import invalidate_entitlements
+from .models import Subscription
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscription_entitlements(sender, instance, **kwargs):
+    invalidate_entitlements(instance.company_id)
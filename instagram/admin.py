@@ -1,6 +1,39 @@
 from django.contrib import admin
-from instagram.models import InstagramAccount
+from instagram.models import (
+    CommentReplyCache, CommentTriggerStat, EmbeddingCache, InstagramAccount, PrefilterStat, WebhookJob,
+)
 # Register your models here.
 @admin.register(InstagramAccount)
 class InstagramAccountAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    pass
+
+
+@admin.register(WebhookJob)
+class WebhookJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "event_type", "status", "attempts", "run_after", "created_at")
+    list_filter = ("status", "event_type")
+
+
+@admin.register(EmbeddingCache)
+class EmbeddingCacheAdmin(admin.ModelAdmin):
+    list_display = ("text", "model", "dimensions", "hits", "last_used_at")
+    list_filter = ("model", "dimensions")
+    exclude = ("embedding",)
+
+
+@admin.register(CommentReplyCache)
+class CommentReplyCacheAdmin(admin.ModelAdmin):
+    list_display = ("listing", "intent", "language", "hits", "expires_at")
+    list_filter = ("intent", "language")
+
+
+@admin.register(CommentTriggerStat)
+class CommentTriggerStatAdmin(admin.ModelAdmin):
+    list_display = ("company", "listing", "day", "comments", "matched")
+    list_filter = ("day",)
+
+
+@admin.register(PrefilterStat)
+class PrefilterStatAdmin(admin.ModelAdmin):
+    list_display = ("company", "day", "channel", "verdict", "reason", "count")
+    list_filter = ("channel", "verdict", "reason")
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InstagramConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'instagram'
+
+
+    def ready(self):
+        import instagram.signals  # noqa
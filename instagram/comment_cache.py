@@ -0,0 +1,211 @@
+#pylint:disable=all
+"""Reply cache for repetitive comments on a listing's post.
+
+Comments on a popular post are mostly the same few questions ("price",
+"details pls", "dm", "location?"). ``comment_cache_key`` maps such a comment
+to a normalized intent plus the language it is written in; comments that
+say anything more specific get no key and always go to the LLM.
+
+For each (listing, intent, language) the first few LLM replies are stored as
+a variation pool (``Company.detail["comment_reply_variations"]``, default 3);
+once the pool is full, later comments get a random variant from it. Entries
+expire after ``Company.detail["comment_reply_cache_minutes"]`` (default 360,
+0 disables the cache) and are keyed by a hash of the listing's property
+context, so editing the listing invalidates them.
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CommentReplyCache
+
+DEFAULT_CACHE_MINUTES = 360
+DEFAULT_VARIATIONS = 3
+# Longer comments are questions of their own, not one of the stock intents
+MAX_INTENT_WORDS = 4
+PURGE_INTERVAL = 60 * 60  # seconds
+STATS_LOG_EVERY = 50
+
+INTENT_KEYWORDS = {
+    "price": [
+        "price", "pricing", "rate", "cost", "how much", "budget", "kitna", "kitne", "kitni", "daam",
+        "evlo", "evvalavu", "ethra", "vila", "entha", "kimmat", "कीमत", "दाम", "क़ीमत", "कितना", "कितने",
+        "விலை", "எவ்வளவு", "എത്ര", "വില", "ధర", "ಬೆಲೆ", "দাম", "કિંમત",
+    ],
+    "details": ["details", "detail", "info", "information", "more", "full", "brochure", "specs", "विवरण"],
+    "dm": ["dm", "inbox", "pm", "msg", "message", "text", "whatsapp", "contact", "call"],
+    "location": [
+        "location", "loc", "where", "place", "area", "address", "map", "kahan", "kaha", "enga", "evide",
+        "ekkada", "elli", "कहाँ", "कहां", "எங்கே", "എവിടെ", "ఎక్కడ", "ಎಲ್ಲಿ",
+    ],
+    "availability": ["available", "availability", "sold", "vacant"],
+    "media": ["photos", "photo", "pics", "pic", "video", "videos", "interior", "plan", "walkthrough"],
+    "interested": ["interested", "intrested", "interest", "want", "need", "book", "buy"],
+}
+FILLER_WORDS = {
+    "pls", "plz", "please", "pl", "sir", "mam", "maam", "madam", "bro", "dear", "ji", "bhai", "anna",
+    "chetta", "chechi", "hi", "hello", "hey", "share", "send", "me", "the", "of", "this", "that", "it",
+    "what", "is", "whats", "kya", "hai", "enna", "yenna", "and", "for", "a", "i", "am", "u", "you",
+    "check", "your", "my", "property", "flat", "house", "villa", "plot",
+    "क्या", "है", "जी", "என்ன", "எந்த", "എന്താ", "ఏంటి", "ఎంత",
+}
+# Words that mark romanised Hindi / Tamil, which AGENT_2 answers in kind
+HINGLISH_WORDS = {"kya", "hai", "kitna", "kitne", "kitni", "kahan", "kaha", "bhai", "batao", "chahiye", "daam", "ji"}
+TANGLISH_WORDS = {"enna", "yenna", "evlo", "enga", "iruku", "irukku", "venum", "anna", "sollunga"}
+SCRIPT_LANGUAGES = {
+    "DEVANAGARI": "hindi",
+    "TAMIL": "tamil",
+    "MALAYALAM": "malayalam",
+    "TELUGU": "telugu",
+    "KANNADA": "kannada",
+    "BENGALI": "bengali",
+    "GUJARATI": "gujarati",
+}
+
+_stats = {"hits": 0, "misses": 0, "uncacheable": 0}
+_stats_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def _words(text):
+    text = re.sub(r"(.)\1{2,}", r"\1", str(text or "").lower())  # "priceee" -> "price"
+    words = []
+    for token in text.split():
+        # Letters and combining marks only: keeps Indic words whole, drops emoji and punctuation
+        word = "".join(char for char in token if unicodedata.category(char)[0] in "LM")
+        if word:
+            words.append(word)
+    return words
+
+
+def comment_language(text: str) -> str:
+    """Language of a comment from its script, or romanised-Hindi/Tamil marker words."""
+    for char in str(text or ""):
+        if char.isalpha() and not char.isascii():
+            script = unicodedata.name(char, "").split(" ")[0]
+            if script in SCRIPT_LANGUAGES:
+                return SCRIPT_LANGUAGES[script]
+    words = set(_words(text))
+    if words & HINGLISH_WORDS:
+        return "hinglish"
+    if words & TANGLISH_WORDS:
+        return "tanglish"
+    return "english"
+
+
+def comment_intent(text: str):
+    """The stock intent of a short comment, or None when it asks something specific."""
+    words = [word for word in _words(text) if word not in FILLER_WORDS]
+    if len(words) > MAX_INTENT_WORDS:
+        return None
+    joined = " ".join(words)
+    intents = set()
+    unexplained = []
+    for word in words:
+        matched = [intent for intent, keywords in INTENT_KEYWORDS.items() if word in keywords]
+        if matched:
+            intents.update(matched)
+        else:
+            unexplained.append(word)
+    if "how much" in joined:
+        intents.add("price")
+        unexplained = [word for word in unexplained if word not in ("how", "much")]
+    if not words:
+        # Emoji-only or "pls?" style comments
+        return "generic"
+    if len(intents) != 1 or unexplained:
+        return None
+    return intents.pop()
+
+
+def comment_cache_key(text: str):
+    """Return (intent, language) for a cacheable comment, else None."""
+    intent = comment_intent(text)
+    if intent is None:
+        _count("uncacheable")
+        return None
+    return intent, comment_language(text)
+
+
+def context_hash(property_context: str) -> str:
+    return hashlib.sha256(str(property_context or "").encode("utf-8")).hexdigest()
+
+
+def cache_settings(company):
+    """(ttl minutes, pool size) from ``Company.detail``; ttl 0 means disabled."""
+    detail = company.detail or {}
+    try:
+        minutes = max(0, int(detail.get("comment_reply_cache_minutes", DEFAULT_CACHE_MINUTES)))
+        variations = max(1, int(detail.get("comment_reply_variations", DEFAULT_VARIATIONS)))
+    except (TypeError, ValueError):
+        return DEFAULT_CACHE_MINUTES, DEFAULT_VARIATIONS
+    return minutes, variations
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+        total = sum(_stats.values())
+    if total % STATS_LOG_EVERY == 0:
+        stats = comment_cache_stats()
+        print(
+            f"Comment reply cache: {stats['hit_rate']:.0%} of cacheable comments served from cache "
+            f"({stats['hits']} hits, {stats['misses']} LLM calls, {stats['uncacheable']} specific comments)"
+        )
+
+
+def get_cached_reply(listing_id, property_context, intent, language, variations):
+    """A cached AGENT_2 response once the variation pool is full, else None."""
+    pool = list(
+        CommentReplyCache.objects.filter(
+            listing_id=listing_id,
+            context_hash=context_hash(property_context),
+            intent=intent,
+            language=language,
+            expires_at__gt=timezone.now(),
+        ).values_list("id", "response")[:variations]
+    )
+    if len(pool) < variations:
+        _count("misses")
+        return None
+    entry_id, response = random.choice(pool)
+    CommentReplyCache.objects.filter(id=entry_id).update(hits=F("hits") + 1)
+    _count("hits")
+    return response
+
+
+def store_reply(listing_id, property_context, intent, language, response, minutes):
+    CommentReplyCache.objects.create(
+        listing_id=listing_id,
+        context_hash=context_hash(property_context),
+        intent=intent,
+        language=language,
+        response=response,
+        expires_at=timezone.now() + timedelta(minutes=minutes),
+    )
+
+
+def comment_cache_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    cacheable = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / cacheable if cacheable else 0.0
+    return stats
+
+
+def purge_comment_reply_cache(force=False) -> int:
+    """Delete expired entries (at most once per interval)."""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+    deleted, _ = CommentReplyCache.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
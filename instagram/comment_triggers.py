@@ -0,0 +1,289 @@
+#pylint:disable=all
+"""Keyword trigger rules for comment auto-replies.
+
+A listing's trigger keywords (``metadata["instagram_comment_dm_reply_trigger_keyword"]``)
+and the company's default rules (``Company.detail["comment_trigger_rules"]``)
+are compiled once into a ``TriggerMatcher`` and cached by the hash of their
+configuration, so editing either recompiles on the next comment in every
+process. A comment matching a rule is answered with the rule's canned
+comment reply and DM, without the LLM.
+
+Match modes:
+
+- ``word``: a keyword appears as whole word(s) ("price please" matches "price")
+- ``substring``: a keyword appears anywhere ("prices?" matches "price")
+- ``exact``: the whole comment equals a keyword (the old behaviour)
+- ``fuzzy``: whole words within a small edit distance ("prise", "detials")
+- ``transliteration``: like fuzzy, on a phonetic key that also reads Indic
+  scripts, so "प्राइस" or "preis" match "price"
+
+Word and substring rules are one compiled alternation regex per rule. Match
+counts per listing and day are kept in ``CommentTriggerStat``.
+"""
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import CommentTriggerStat
+
+MATCH_MODES = ["word", "substring", "exact", "fuzzy", "transliteration"]
+DEFAULT_MATCH_MODE = "word"
+MATCHER_CACHE_SIZE = 1000
+
+# Indic scripts share Devanagari's code point layout, block by block
+INDIC_BLOCKS = range(0x0900, 0x0D80, 0x80)
+DEVANAGARI_CONSONANTS = {
+    0x15: "k", 0x16: "kh", 0x17: "g", 0x18: "gh", 0x19: "ng", 0x1A: "ch", 0x1B: "chh", 0x1C: "j",
+    0x1D: "jh", 0x1E: "ny", 0x1F: "t", 0x20: "th", 0x21: "d", 0x22: "dh", 0x23: "n", 0x24: "t",
+    0x25: "th", 0x26: "d", 0x27: "dh", 0x28: "n", 0x29: "n", 0x2A: "p", 0x2B: "ph", 0x2C: "b",
+    0x2D: "bh", 0x2E: "m", 0x2F: "y", 0x30: "r", 0x31: "r", 0x32: "l", 0x33: "l", 0x34: "zh",
+    0x35: "v", 0x36: "sh", 0x37: "sh", 0x38: "s", 0x39: "h",
+}
+DEVANAGARI_VOWELS = {
+    0x05: "a", 0x06: "aa", 0x07: "i", 0x08: "ii", 0x09: "u", 0x0A: "uu", 0x0B: "ri", 0x0E: "e",
+    0x0F: "e", 0x10: "ai", 0x12: "o", 0x13: "o", 0x14: "au",
+}
+DEVANAGARI_VOWEL_SIGNS = {
+    0x3E: "aa", 0x3F: "i", 0x40: "ii", 0x41: "u", 0x42: "uu", 0x43: "ri", 0x46: "e", 0x47: "e",
+    0x48: "ai", 0x4A: "o", 0x4B: "o", 0x4C: "au",
+}
+DEVANAGARI_NASALS = {0x01: "n", 0x02: "n", 0x03: "h"}
+VIRAMA = 0x4D
+PHONETIC_RULES = [
+    (r"tion", "shan"), (r"ph", "f"), (r"w", "v"), (r"z", "j"), (r"q", "k"), (r"x", "ks"), (r"ck", "k"),
+    (r"c(?=[eiy])", "s"), (r"c", "k"), (r"([kgtdbcs])h", r"\1"), (r"y", "i"),
+    (r"ee|ii", "i"), (r"oo|uu", "u"), (r"aa", "a"), (r"(.)\1+", r"\1"),
+]
+
+_matchers = OrderedDict()
+_matchers_lock = threading.Lock()
+
+
+def transliterate(text: str) -> str:
+    """Rough Latin spelling of Indic-script text; other characters pass through."""
+    out = []
+    pending_vowel = False
+    for char in text:
+        code = ord(char)
+        block = next((base for base in INDIC_BLOCKS if base <= code < base + 0x80), None)
+        if block is None:
+            if pending_vowel:
+                out.append("a")
+                pending_vowel = False
+            out.append(char)
+            continue
+        offset = code - block
+        if offset in DEVANAGARI_VOWEL_SIGNS:
+            out.append(DEVANAGARI_VOWEL_SIGNS[offset])
+            pending_vowel = False
+            continue
+        if offset == VIRAMA:
+            pending_vowel = False
+            continue
+        if pending_vowel:
+            out.append("a")
+            pending_vowel = False
+        if offset in DEVANAGARI_CONSONANTS:
+            out.append(DEVANAGARI_CONSONANTS[offset])
+            pending_vowel = True
+        elif offset in DEVANAGARI_VOWELS:
+            out.append(DEVANAGARI_VOWELS[offset])
+        elif offset in DEVANAGARI_NASALS:
+            out.append(DEVANAGARI_NASALS[offset])
+    if pending_vowel:
+        out.append("a")
+    return "".join(out)
+
+
+def normalize_comment(text: str) -> str:
+    """Lower-case, NFC, punctuation and emoji to spaces, whitespace collapsed."""
+    text = unicodedata.normalize("NFC", str(text or "")).lower()
+    text = "".join(char if unicodedata.category(char)[0] in "LMN" else " " for char in text)
+    return " ".join(text.split())
+
+
+def phonetic_key(word: str) -> str:
+    key = transliterate(word)
+    for pattern, replacement in PHONETIC_RULES:
+        key = re.sub(pattern, replacement, key)
+    # Final schwa / silent e ("kimata", "price")
+    return key[:-1] if len(key) > 3 and key[-1] in "ae" else key
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance counting a swap of neighbours as one edit ("detials"), capped at ``limit + 1``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def allowed_edits(word: str) -> int:
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def split_keywords(keywords) -> list:
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    return [normalize_comment(keyword) for keyword in keywords or [] if normalize_comment(keyword)]
+
+
+class TriggerRule:
+    __slots__ = ("keywords", "mode", "comment_reply", "dm_reply", "source", "pattern", "phrases")
+
+    def __init__(self, keywords, mode, comment_reply, dm_reply, source):
+        self.keywords = keywords
+        self.mode = mode if mode in MATCH_MODES else DEFAULT_MATCH_MODE
+        self.comment_reply = comment_reply or ""
+        self.dm_reply = dm_reply or ""
+        self.source = source
+        self.pattern = None
+        self.phrases = []
+        # Longest first so "more details" wins over "details"
+        alternation = "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+        if not keywords:
+            pass
+        elif self.mode == "word":
+            self.pattern = re.compile(rf"(?<!\w)(?:{alternation})(?!\w)")
+        elif self.mode == "substring":
+            self.pattern = re.compile(alternation)
+        elif self.mode == "exact":
+            self.pattern = re.compile(rf"(?:{alternation})")
+        else:
+            convert = phonetic_key if self.mode == "transliteration" else str
+            self.phrases = [[convert(word) for word in keyword.split()] for keyword in keywords]
+
+    def match(self, comment: str, words: list):
+        """The keyword that matched ``comment`` (normalized), else None."""
+        if not self.keywords:
+            return None
+        if self.mode == "exact":
+            found = self.pattern.fullmatch(comment)
+            return found.group(0) if found else None
+        if self.pattern is not None:
+            found = self.pattern.search(comment)
+            return found.group(0) if found else None
+        if self.mode == "transliteration":
+            words = [phonetic_key(word) for word in words]
+        for keyword, phrase in zip(self.keywords, self.phrases):
+            size = len(phrase)
+            for start in range(len(words) - size + 1):
+                window = words[start:start + size]
+                if all(edit_distance(a, b, allowed_edits(b)) <= allowed_edits(b) for a, b in zip(window, phrase)):
+                    return keyword
+        return None
+
+
+class TriggerMatcher:
+    def __init__(self, rules):
+        self.rules = rules
+
+    def match(self, comment_text: str):
+        """Return (rule, keyword) of the first matching rule, or (None, None)."""
+        comment = normalize_comment(comment_text)
+        if not comment:
+            return None, None
+        words = comment.split()
+        for rule in self.rules:
+            keyword = rule.match(comment, words)
+            if keyword:
+                return rule, keyword
+        return None, None
+
+
+def listing_rule_config(listing):
+    metadata = (listing.metadata or {}) if listing else {}
+    comment_reply = metadata.get("instagram_comment_reply", "")
+    dm_reply = metadata.get("instagram_comment_dm_reply", "")
+    keywords = split_keywords(metadata.get("instagram_comment_dm_reply_trigger_keyword", ""))
+    # Like company defaults, a listing rule needs keywords; it must not answer every comment
+    if not keywords or (not comment_reply and not dm_reply):
+        return []
+    return [
+        {
+            "keywords": keywords,
+            "mode": metadata.get("instagram_comment_trigger_match_mode", DEFAULT_MATCH_MODE),
+            "comment_reply": comment_reply,
+            "dm_reply": dm_reply,
+            "source": "listing",
+        }
+    ]
+
+
+def company_rule_config(company):
+    rules = []
+    for rule in (company.detail or {}).get("comment_trigger_rules") or []:
+        keywords = split_keywords(rule.get("keywords"))
+        # Company defaults need keywords too
+        if keywords and (rule.get("comment_reply") or rule.get("dm_reply")):
+            rules.append(
+                {
+                    "keywords": keywords,
+                    "mode": rule.get("mode", DEFAULT_MATCH_MODE),
+                    "comment_reply": rule.get("comment_reply", ""),
+                    "dm_reply": rule.get("dm_reply", ""),
+                    "source": "company",
+                }
+            )
+    return rules
+
+
+def get_trigger_matcher(company, listing=None) -> TriggerMatcher:
+    """Compiled rules of ``listing`` followed by the company defaults, cached by configuration."""
+    config = listing_rule_config(listing) + company_rule_config(company)
+    key = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+    with _matchers_lock:
+        matcher = _matchers.get(key)
+        if matcher is not None:
+            _matchers.move_to_end(key)
+            return matcher
+    matcher = TriggerMatcher([TriggerRule(**rule) for rule in config])
+    with _matchers_lock:
+        _matchers[key] = matcher
+        while len(_matchers) > MATCHER_CACHE_SIZE:
+            _matchers.popitem(last=False)
+    return matcher
+
+
+def record_trigger_result(company_id, listing_id, matched: bool):
+    """Count a comment (and whether a trigger answered it) for the match-rate report."""
+    stat, _ = CommentTriggerStat.objects.get_or_create(
+        company_id=company_id, listing_id=listing_id, day=timezone.localdate()
+    )
+    CommentTriggerStat.objects.filter(id=stat.id).update(
+        comments=F("comments") + 1, matched=F("matched") + int(matched)
+    )
+
+
+def trigger_match_rates(company_id=None, days=7) -> list:
+    """Comments and trigger matches per company and listing over the last ``days`` days."""
+    stats = CommentTriggerStat.objects.filter(day__gt=timezone.localdate() - timedelta(days=days))
+    if company_id:
+        stats = stats.filter(company_id=company_id)
+    rows = list(
+        stats.values("company_id", "listing_id", "listing__title")
+        .annotate(comments=Sum("comments"), matched=Sum("matched"))
+        .order_by("company_id", "-comments")
+    )
+    for row in rows:
+        row["match_rate"] = row["matched"] / row["comments"] if row["comments"] else 0.0
+    return rows
@@ -0,0 +1,235 @@
+#pylint:disable=all
+"""Local extraction of phone numbers, emails and budgets from customer messages.
+
+These are the lead fields customers state most literally, so they are parsed
+with regular expressions on every inbound DM and saved right away instead of
+waiting for the LLM extractor. Indian mobile numbers (+91 / 0 prefixes, any
+grouping) and lakh / crore amounts are recognised in English and in the
+scripts the DM agent supports; digits in those scripts are normalised too.
+
+Known values are not overwritten by weaker evidence: a stored phone number
+only changes when the message talks about a number, and a stored budget only
+changes for a range or an amount given with a budget cue.
+"""
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+LAKH = Decimal(100000)
+CRORE = Decimal(10000000)
+# Amounts outside this range are not property budgets
+MIN_BUDGET = LAKH
+MAX_BUDGET = 500 * CRORE
+
+LAKH_WORDS = [
+    "lakhs", "lakh", "laks", "lacs", "lac", "lkh", "lk", "l",
+    "लाख",  # Hindi, Marathi
+    "লাখ", "লক্ষ",  # Bengali
+    "લાખ",  # Gujarati
+    "லட்சம்", "லட்சம", "லட்ச",  # Tamil
+    "ലക്ഷം", "ലക്ഷ",  # Malayalam
+    "లక్షలు", "లక్షల", "లక్ష",  # Telugu
+    "ಲಕ್ಷ",  # Kannada
+]
+CRORE_WORDS = [
+    "crores", "crore", "crs", "cr",
+    "करोड़", "करोड",  # Hindi, Marathi
+    "কোটি",  # Bengali
+    "કરોડ",  # Gujarati
+    "கோடி",  # Tamil
+    "കോടി",  # Malayalam
+    "కోట్లు", "కోటి",  # Telugu
+    "ಕೋಟಿ",  # Kannada
+]
+UNIT = "|".join(re.escape(word) for word in sorted(LAKH_WORDS + CRORE_WORDS, key=len, reverse=True))
+LAKH_UNIT = "|".join(re.escape(word) for word in sorted(LAKH_WORDS, key=len, reverse=True))
+CRORE_UNIT = "|".join(re.escape(word) for word in sorted(CRORE_WORDS, key=len, reverse=True))
+NUMBER = r"\d+(?:[.,]\d+)?"
+# Latin units must not run into another letter ("60 lakhs" yes, "60 large" no)
+UNIT_END = r"(?![a-z])"
+# Too ambiguous ("plot no 12 l block") unless written straight after the
+# number ("60L") or after a budget cue ("budget 60 l")
+SHORT_UNITS = {"l", "lk"}
+BUDGET_CUE = re.compile(
+    r"budget|price|rate|cost|range|afford|₹|\brs\b|\binr\b|बजट|कीमत|दाम|விலை|ബജറ്റ്|വില",
+    re.IGNORECASE,
+)
+# "2 lakh sq ft" / "3 lakh sqft" is an area, not an amount
+AREA_AFTER = re.compile(
+    r"^\s*(?:sq\.?\s*(?:ft|feet|m|yards?|yds?)|sqft|sq|square|sft|ft|feet|cents?|acres?|sqm|yards?|gaj)\b",
+    re.IGNORECASE,
+)
+PHONE_CUE = re.compile(
+    r"number|phone|mobile|\bmob\b|\bno\b|call|whats\s*app|\bwa\b|contact|नंबर|फोन",
+    re.IGNORECASE,
+)
+RANGE_SEPARATOR = r"(?:-|–|—|to|and|se|till|or|muthal|mudhal|से|முதல்|മുതൽ)"
+
+BUDGET_RANGE = re.compile(
+    rf"(?P<low>{NUMBER})\s*(?P<low_unit>{UNIT})?{UNIT_END}\s*{RANGE_SEPARATOR}\s*"
+    rf"(?P<high>{NUMBER})\s*(?P<high_unit>{UNIT}){UNIT_END}",
+    re.IGNORECASE,
+)
+BUDGET_SINGLE = re.compile(rf"(?P<amount>{NUMBER})\s*(?P<unit>{UNIT}){UNIT_END}", re.IGNORECASE)
+# "1 crore 20 lakh" is one amount, folded into "1.2 crore" before matching
+CRORE_LAKH = re.compile(
+    rf"(?P<crore>{NUMBER})\s*(?P<crore_unit>{CRORE_UNIT}){UNIT_END}\s*(?P<lakh>{NUMBER})\s*(?:{LAKH_UNIT}){UNIT_END}",
+    re.IGNORECASE,
+)
+BUDGET_RUPEES = re.compile(r"(?:₹|rs\.?|inr)\s*(?P<amount>\d[\d,]*)", re.IGNORECASE)
+# A single amount preceded by one of these is a lower bound, not a ceiling
+MINIMUM_HINT = re.compile(
+    r"(above|over|more than|min(imum)?|at least|atleast|starting|from|se (upar|zyada|jyada)|से ऊपर|से ज्यादा)\s*[₹]?\s*$",
+    re.IGNORECASE,
+)
+# ... or followed by one of these ("60L+", "50 lakh se upar", "50 लाख से ऊपर")
+MINIMUM_SUFFIX = re.compile(
+    r"^\s*(\+|plus|and above|or more|above|se (upar|zyada|jyada)|से ऊपर|से ज्यादा|से अधिक)",
+    re.IGNORECASE,
+)
+
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+PHONE_CANDIDATE = re.compile(r"(?<![\d.])\+?\d[\d\s\-().]{8,16}\d(?![\d])")
+
+
+def normalize_digits(text: str) -> str:
+    """Replace digits of any script (०१२, ௧௨, ...) with ASCII digits."""
+    return "".join(
+        str(unicodedata.digit(char)) if char.isdigit() and not char.isascii() else char
+        for char in str(text or "")
+    )
+
+
+def _amount(number, unit) -> Decimal:
+    try:
+        value = Decimal(number.replace(",", "."))
+    except InvalidOperation:
+        return None
+    unit = (unit or "").lower()
+    if unit in CRORE_WORDS:
+        value *= CRORE
+    elif unit in LAKH_WORDS:
+        value *= LAKH
+    return value.quantize(Decimal("0.01"))
+
+
+def _fold_crore_lakh(match) -> str:
+    try:
+        crore = Decimal(match["crore"].replace(",", "."))
+        lakh = Decimal(match["lakh"].replace(",", "."))
+    except InvalidOperation:
+        return match.group(0)
+    if lakh >= 100:
+        return match.group(0)
+    return f"{format((crore + lakh / 100).normalize(), 'f')} {match['crore_unit']}"
+
+
+def _budget_ok(value) -> bool:
+    return value is not None and MIN_BUDGET <= value <= MAX_BUDGET
+
+
+def _unit_ok(text, match, number_group, unit_group) -> bool:
+    if AREA_AFTER.search(text[match.end():]):
+        return False
+    if (match[unit_group] or "").lower() in SHORT_UNITS:
+        attached = match.end(number_group) == match.start(unit_group)
+        return attached or bool(BUDGET_CUE.search(text[: match.start()]))
+    return True
+
+
+def find_budget(text: str):
+    """Return (budget_min, budget_max, strength); strength is "range", "cued" or "plain"."""
+    text = CRORE_LAKH.sub(_fold_crore_lakh, normalize_digits(text))
+    for match in BUDGET_RANGE.finditer(text):
+        if not _unit_ok(text, match, "high", "high_unit"):
+            continue
+        # "50-60 lakhs": the unit of the upper bound applies to both
+        low = _amount(match["low"], match["low_unit"] or match["high_unit"])
+        high = _amount(match["high"], match["high_unit"])
+        if _budget_ok(low) and _budget_ok(high) and low <= high:
+            return low, high, "range"
+    match = next(
+        (found for found in BUDGET_SINGLE.finditer(text) if _unit_ok(text, found, "amount", "unit")), None
+    )
+    if match:
+        value = _amount(match["amount"], match["unit"])
+    else:
+        match = BUDGET_RUPEES.search(text)
+        value = _amount(match["amount"].replace(",", ""), None) if match else None
+    if not _budget_ok(value):
+        return None, None, None
+    strength = "cued" if BUDGET_CUE.search(text[: match.end()]) else "plain"
+    if MINIMUM_HINT.search(text[: match.start()]) or MINIMUM_SUFFIX.search(text[match.end():]):
+        return value, None, strength
+    return None, value, strength
+
+
+def extract_budget(text: str):
+    """Return (budget_min, budget_max) in rupees; either may be None."""
+    budget_min, budget_max, _ = find_budget(text)
+    return budget_min, budget_max
+
+
+def extract_phone(text: str):
+    """First Indian mobile number in ``text`` as +91XXXXXXXXXX, or None."""
+    for candidate in PHONE_CANDIDATE.findall(normalize_digits(text)):
+        digits = re.sub(r"\D", "", candidate)
+        if len(digits) == 12 and digits.startswith("91"):
+            digits = digits[2:]
+        elif len(digits) == 11 and digits.startswith("0"):
+            digits = digits[1:]
+        if len(digits) == 10 and digits[0] in "6789":
+            return f"+91{digits}"
+    return None
+
+
+def extract_email(text: str):
+    match = EMAIL.search(str(text or ""))
+    return match.group(0).rstrip(".").lower() if match else None
+
+
+def extract_contact_details(text: str) -> dict:
+    """Lead fields found in a customer message; absent fields are left out."""
+    found = {}
+    phone = extract_phone(text)
+    if phone:
+        found["phone_number"] = phone
+    email = extract_email(text)
+    if email:
+        found["email"] = email
+    budget_min, budget_max = extract_budget(text)
+    if budget_min is not None:
+        found["budget_min"] = budget_min
+    if budget_max is not None:
+        found["budget_max"] = budget_max
+    return found
+
+
+def apply_contact_details(lead, text: str) -> list:
+    """Set what ``text`` states on ``lead``; returns the changed field names (unsaved)."""
+    updates = {}
+    phone = extract_phone(text)
+    # A number in passing ("call after 9876...") does not replace a known one
+    if phone and (not lead.phone_number or PHONE_CUE.search(text)):
+        updates["phone_number"] = phone
+    email = extract_email(text)
+    if email:
+        updates["email"] = email
+    budget_min, budget_max, strength = find_budget(text)
+    known_budget = lead.budget_min is not None or lead.budget_max is not None
+    if strength and (strength != "plain" or not known_budget):
+        if budget_min is not None:
+            updates["budget_min"] = budget_min
+        if budget_max is not None:
+            updates["budget_max"] = budget_max
+        # A new single bound must not leave the old other bound contradicting it
+        if budget_min is None and lead.budget_min is not None and lead.budget_min > budget_max:
+            updates["budget_min"] = None
+        if budget_max is None and lead.budget_max is not None and lead.budget_max < budget_min:
+            updates["budget_max"] = None
+    changed = []
+    for field, value in updates.items():
+        if getattr(lead, field) != value:
+            setattr(lead, field, value)
+            changed.append(field)
+    return changed
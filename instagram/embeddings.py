@@ -0,0 +1,194 @@
+#pylint:disable=all
+"""Cached query embeddings for property retrieval.
+
+DMs repeat a lot ("price?", "location?", "hi"), so embeddings of customer
+messages are cached in two tiers: a process-local LRU and the
+``EmbeddingCache`` table shared by every worker. Entries are keyed by model,
+dimensions and a hash of the normalized text, expire after
+``EMBEDDING_CACHE_TTL`` and the table is trimmed to ``EMBEDDING_CACHE_MAX_ROWS``
+by ``purge_embedding_cache``. ``embedding_cache_stats`` reports how many
+OpenAI round trips the cache saved in this process.
+"""
+import hashlib
+import math
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+from openai import OpenAI
+
+from .models import EmbeddingCache
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+EMBEDDING_DIMENSIONS = 3072
+
+EMBEDDING_CACHE_TTL = timedelta(days=30)
+EMBEDDING_CACHE_MAX_ROWS = 50000
+# A 3072-d float32 vector is ~12KB, so this holds ~12MB per process
+EMBEDDING_LRU_SIZE = 1000
+PURGE_INTERVAL = 60 * 60  # seconds
+STATS_LOG_EVERY = 100
+
+_client = None
+_client_lock = threading.Lock()
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+_stats = {"lru_hits": 0, "db_hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def get_openai_client() -> OpenAI:
+    """One OpenAI client (and connection pool) per process."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI()
+    return _client
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold, collapse whitespace and drop surrounding punctuation."""
+    text = re.sub(r"\s+", " ", str(text or "")).strip().casefold()
+    return text.strip(" ?!.,;:-_'\"") or text
+
+
+def shorten_embedding(embedding, dimensions) -> list:
+    """Truncate a text-embedding-3 vector and L2-normalize it again.
+
+    The text-embedding-3 models are trained so that a prefix of the vector
+    is itself a usable embedding; this equals asking the API for
+    ``dimensions`` directly, without another call.
+    """
+    embedding = list(embedding)[:dimensions]
+    norm = math.sqrt(sum(value * value for value in embedding)) or 1.0
+    return [value / norm for value in embedding]
+
+
+def cache_key(text: str, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS) -> str:
+    return hashlib.sha256(f"{model}:{dimensions}:{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+        total = sum(_stats.values())
+    if total % STATS_LOG_EVERY == 0:
+        stats = embedding_cache_stats()
+        print(
+            f"Embedding cache: {stats['hit_rate']:.0%} hit rate over {stats['lookups']} lookups "
+            f"(LRU {stats['lru_hits']}, table {stats['db_hits']}, OpenAI {stats['misses']})"
+        )
+
+
+def _lru_get(key):
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is None:
+            return None
+        vector, expires = entry
+        if expires < time.monotonic():
+            del _lru[key]
+            return None
+        _lru.move_to_end(key)
+        return vector.tolist()
+
+
+def _lru_put(key, embedding):
+    with _lru_lock:
+        _lru[key] = (array("f", embedding), time.monotonic() + EMBEDDING_CACHE_TTL.total_seconds())
+        _lru.move_to_end(key)
+        while len(_lru) > EMBEDDING_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _db_get(key):
+    entry = (
+        EmbeddingCache.objects.filter(key=key, created_at__gte=timezone.now() - EMBEDDING_CACHE_TTL)
+        .only("id", "embedding")
+        .first()
+    )
+    if entry is None:
+        return None
+    EmbeddingCache.objects.filter(id=entry.id).update(hits=F("hits") + 1, last_used_at=timezone.now())
+    return list(entry.embedding)
+
+
+def _db_put(key, text, embedding, model, dimensions):
+    # Stale rows under the same key are replaced; concurrent misses just race to insert
+    EmbeddingCache.objects.filter(key=key, created_at__lt=timezone.now() - EMBEDDING_CACHE_TTL).delete()
+    EmbeddingCache.objects.bulk_create(
+        [
+            EmbeddingCache(
+                key=key,
+                model=model,
+                dimensions=dimensions,
+                text=normalize_text(text)[:1000],
+                embedding=embedding,
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def embed_query(text: str, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS) -> list:
+    """Return the embedding of a customer message, from cache when possible."""
+    key = cache_key(text, model, dimensions)
+    embedding = _lru_get(key)
+    if embedding is not None:
+        _count("lru_hits")
+        return embedding
+    embedding = _db_get(key)
+    if embedding is not None:
+        _count("db_hits")
+        _lru_put(key, embedding)
+        return embedding
+
+    _count("misses")
+    kwargs = {"model": model, "input": text}
+    if dimensions != EMBEDDING_DIMENSIONS:
+        kwargs["dimensions"] = dimensions
+    embedding = get_openai_client().embeddings.create(**kwargs).data[0].embedding
+    _lru_put(key, embedding)
+    _db_put(key, text, embedding, model, dimensions)
+    return embedding
+
+
+def embedding_cache_stats() -> dict:
+    """Hit / miss counters of this process; every hit is a saved OpenAI round trip."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["lookups"] = stats["lru_hits"] + stats["db_hits"] + stats["misses"]
+    stats["hit_rate"] = (stats["lookups"] - stats["misses"]) / stats["lookups"] if stats["lookups"] else 0.0
+    stats["lru_size"] = len(_lru)
+    return stats
+
+
+def purge_embedding_cache(force=False) -> int:
+    """Delete expired rows and trim the table to its size limit (at most once per interval)."""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+    deleted, _ = EmbeddingCache.objects.filter(created_at__lt=timezone.now() - EMBEDDING_CACHE_TTL).delete()
+    cutoff = list(
+        EmbeddingCache.objects.order_by("-last_used_at")
+        .values_list("last_used_at", flat=True)[EMBEDDING_CACHE_MAX_ROWS:EMBEDDING_CACHE_MAX_ROWS + 1]
+    )
+    if cutoff:
+        trimmed, _ = EmbeddingCache.objects.filter(last_used_at__lte=cutoff[0]).delete()
+        deleted += trimmed
+    return deleted
+
+
+def clear_embedding_lru():
+    with _lru_lock:
+        _lru.clear()
@@ -0,0 +1,364 @@
+#pylint:disable=all
+"""Shared Instagram / Facebook Graph API client.
+
+Every outbound Graph call goes through here so they all get:
+
+* connection pooling - one ``requests.Session`` per process for sync views and
+  one keep-alive ``httpx.AsyncClient`` per event loop for the webhook path;
+* sane timeouts;
+* exponential backoff on 429 / 5xx and Meta's throttling error codes;
+* a token bucket per business account following Instagram's messaging
+  rate limits, so bursts are smoothed out locally instead of failing. A
+  call never waits longer than ``MAX_RATE_LIMIT_WAIT`` for its slot; past
+  that ``RateLimited`` is raised and the queue worker reschedules the job.
+
+Sync helpers use plain names (``get``, ``post``, ``send_message``); their async
+counterparts are prefixed with ``a`` like Django's async ORM methods.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from asgiref.sync import async_to_sync
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_BASE = os.getenv("INSTAGRAM_GRAPH_API_BASE", "https://graph.instagram.com/v24.0")
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Meta reports throttling as HTTP 400 with these error codes
+THROTTLE_ERROR_CODES = {4, 17, 32, 613}
+
+# Per business account: (tokens per second, burst size)
+RATE_LIMITS = {
+    # Send API: 100 calls per second per Instagram professional account
+    "messages": (100, 100),
+    # Private replies to comments on posts / reels: 750 calls per hour
+    "private_replies": (750 / 3600, 100),
+}
+
+# Longer waits are not slept inside a job; the job is rescheduled instead
+MAX_RATE_LIMIT_WAIT = 10  # seconds
+
+
+class RateLimited(Exception):
+    """The account's rate limit has no slot within ``MAX_RATE_LIMIT_WAIT``."""
+
+    def __init__(self, account_id, kind, retry_after):
+        super().__init__(f"{kind} rate limit for account {account_id}, next slot in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``reserve`` returns how long to wait."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait=None) -> float:
+        """Take a slot and return the wait before it; None if that exceeds ``max_wait`` (nothing taken)."""
+        with self.lock:
+            self._refill()
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def next_slot(self) -> float:
+        """Wait before a slot would be free, without taking it."""
+        with self.lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(account_id, kind) -> TokenBucket:
+    key = (str(account_id), kind)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(*RATE_LIMITS[kind])
+    return bucket
+
+
+def rate_limit_delay(account_id, kind, max_wait=MAX_RATE_LIMIT_WAIT) -> float:
+    """Reserve a call slot for ``account_id`` and return the wait before using it.
+
+    Raises ``RateLimited`` instead of reserving when the wait would exceed
+    ``max_wait``.
+    """
+    if not account_id or kind not in RATE_LIMITS:
+        return 0.0
+    bucket = _bucket(account_id, kind)
+    wait = bucket.reserve(max_wait=max_wait)
+    if wait is None:
+        raise RateLimited(account_id, kind, bucket.next_slot())
+    return wait
+
+
+def check_rate_limit(account_id, kind):
+    """Raise ``RateLimited`` now if a ``kind`` call would not get a slot in time.
+
+    Handlers call this before any side effect so a rescheduled job does not
+    repeat half of its work.
+    """
+    if not account_id or kind not in RATE_LIMITS:
+        return
+    wait = _bucket(account_id, kind).next_slot()
+    if wait > MAX_RATE_LIMIT_WAIT:
+        raise RateLimited(account_id, kind, wait)
+
+
+def graph_url(path):
+    if path.startswith("http://") or path.startswith("https://"):
+        return path
+    return f"{GRAPH_API_BASE}/{path.lstrip('/')}"
+
+
+def _is_throttled(status_code, data):
+    if status_code in RETRY_STATUSES:
+        return True
+    if status_code == 400 and isinstance(data, dict):
+        return (data.get("error") or {}).get("code") in THROTTLE_ERROR_CODES
+    return False
+
+
+def _backoff_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(BACKOFF_BASE * 2 ** attempt, BACKOFF_MAX) * (0.5 + random.random() / 2)
+
+
+def _json_or_empty(response):
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+
+def _headers(access_token, headers):
+    headers = dict(headers or {})
+    if access_token:
+        headers["Authorization"] = f"Bearer {access_token}"
+    return headers
+
+
+# ---------------------------------------------------------------- sync client
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def request(method, path, *, access_token=None, account_id=None, rate_kind=None,
+            headers=None, timeout=None, max_rate_wait=MAX_RATE_LIMIT_WAIT, **kwargs) -> requests.Response:
+    """Send a Graph API request with pooling, rate limiting and retries.
+
+    ``max_rate_wait`` bounds the sleep for a rate-limit slot; request
+    threads pass 0 to get ``RateLimited`` right away instead.
+    """
+    delay = rate_limit_delay(account_id, rate_kind, max_rate_wait)
+    if delay:
+        time.sleep(delay)
+    url = graph_url(path)
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = get_session().request(
+                method, url, headers=_headers(access_token, headers), timeout=timeout, **kwargs
+            )
+        except requests.ConnectionError:
+            # Connect failures only; a read timeout may have been delivered
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+        if attempt < MAX_RETRIES and _is_throttled(response.status_code, _json_or_empty(response)):
+            wait = _backoff_delay(attempt, response.headers.get("Retry-After"))
+            logger.warning("Graph API %s %s returned %s, retrying in %.1fs", method, path, response.status_code, wait)
+            time.sleep(wait)
+            continue
+        return response
+
+
+def get(path, **kwargs) -> requests.Response:
+    return request("GET", path, **kwargs)
+
+
+def post(path, **kwargs) -> requests.Response:
+    return request("POST", path, **kwargs)
+
+
+def send_message(ig_business_account_id, recipient_ig_id, message, access_token,
+                 max_rate_wait=MAX_RATE_LIMIT_WAIT) -> requests.Response:
+    """Send a DM to an Instagram user."""
+    return post(
+        f"{ig_business_account_id}/messages",
+        json={"recipient": {"id": recipient_ig_id}, "message": {"text": message}},
+        access_token=access_token,
+        account_id=ig_business_account_id,
+        rate_kind="messages",
+        max_rate_wait=max_rate_wait,
+    )
+
+
+# --------------------------------------------------------------- async client
+
+# httpx clients are bound to the loop they were created on, so keep one
+# client per loop. Code running its own short-lived loop (async_to_sync)
+# must close the loop's client with ``aclose_async_client`` before it ends.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    """Close the current loop's client; call before a short-lived loop ends."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def run_sync(async_fn, *args, **kwargs):
+    """``async_to_sync`` for callers without a long-lived loop; closes that loop's client afterwards."""
+
+    async def run():
+        try:
+            return await async_fn(*args, **kwargs)
+        finally:
+            await aclose_async_client()
+
+    return async_to_sync(run)()
+
+
+async def arequest(method, path, *, access_token=None, account_id=None, rate_kind=None,
+                   headers=None, **kwargs) -> httpx.Response:
+    """Async counterpart of :func:`request`."""
+    delay = rate_limit_delay(account_id, rate_kind)
+    if delay:
+        await asyncio.sleep(delay)
+    url = graph_url(path)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await get_async_client().request(
+                method, url, headers=_headers(access_token, headers), **kwargs
+            )
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            # Only retry when the request cannot have reached Meta
+            if attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(_backoff_delay(attempt))
+            continue
+        if attempt < MAX_RETRIES and _is_throttled(response.status_code, _json_or_empty(response)):
+            wait = _backoff_delay(attempt, response.headers.get("Retry-After"))
+            logger.warning("Graph API %s %s returned %s, retrying in %.1fs", method, path, response.status_code, wait)
+            await asyncio.sleep(wait)
+            continue
+        return response
+
+
+async def apost(path, **kwargs) -> httpx.Response:
+    return await arequest("POST", path, **kwargs)
+
+
+async def asend_message(ig_business_account_id, recipient_ig_id, message, access_token):
+    """Send a DM to an Instagram user."""
+    response = await apost(
+        f"{ig_business_account_id}/messages",
+        json={"recipient": {"id": recipient_ig_id}, "message": {"text": message}},
+        access_token=access_token,
+        account_id=ig_business_account_id,
+        rate_kind="messages",
+    )
+    return _json_or_empty(response)
+
+
+async def areply_to_comment(comment_id, message, access_token):
+    """Reply publicly to an Instagram comment."""
+    try:
+        response = await apost(
+            f"{comment_id}/replies", json={"message": message, "access_token": access_token}
+        )
+        response_data = _json_or_empty(response)
+        if response.status_code == 200:
+            print(f"Successfully replied to comment {comment_id}")
+            return response_data
+        print(f"Failed to reply to comment: {response_data}")
+        return None
+    except Exception as e:
+        print(f"Error replying to comment: {str(e)}")
+        return None
+
+
+async def asend_dm_to_commenter(comment_id, message, ig_business_account_id, access_token):
+    """Send a private reply DM to the person who wrote ``comment_id``."""
+    try:
+        response = await apost(
+            f"{ig_business_account_id}/messages",
+            json={"recipient": {"comment_id": comment_id}, "message": {"text": message}},
+            access_token=access_token,
+            account_id=ig_business_account_id,
+            rate_kind="private_replies",
+        )
+        response_data = _json_or_empty(response)
+        if response.status_code == 200:
+            print(f"✅ Successfully sent DM via comment {comment_id}")
+            return response_data
+        print(f"❌ Failed to send DM: {response_data}")
+        return None
+    except RateLimited:
+        # The queue worker reschedules the job
+        raise
+    except Exception as e:
+        print(f"❌ Error sending DM: {str(e)}")
+        return None
@@ -0,0 +1,126 @@
+#pylint:disable=all
+"""Deduplicate webhook deliveries.
+
+Meta re-sends a webhook whenever it did not see a quick 200, so the same DM
+or comment can arrive several times, sometimes concurrently. ``claim_events``
+records each event id in ``EventRegister`` with a single
+``INSERT ... ON CONFLICT (event_id) DO NOTHING RETURNING``: exactly one
+delivery wins however the retries interleave. A small in-process LRU of ids
+already seen answers retry storms without touching the database, and
+``purge_expired_events`` keeps the register (and its unique index) small.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import EventRegister
+
+# Meta stops retrying a delivery well within a day; keep ids a while longer.
+EVENT_TTL = timedelta(days=3)
+PURGE_INTERVAL = 60 * 60  # seconds
+LRU_SIZE = 10000
+
+EVENT_TYPES = {"message": "instagram_dm", "comment": "instagram_comment"}
+
+_seen = OrderedDict()
+_seen_lock = threading.Lock()
+_last_purge = 0.0
+
+
+def event_id(event: dict):
+    """The id Meta keeps across retries of ``event``, or None."""
+    if event.get("webhook_type") == "message":
+        return event.get("message_id") or None
+    if event.get("webhook_type") == "comment":
+        return event.get("comment_id") or None
+    return None
+
+
+def _is_seen(key):
+    with _seen_lock:
+        if key in _seen:
+            _seen.move_to_end(key)
+            return True
+    return False
+
+
+def _remember(keys):
+    with _seen_lock:
+        for key in keys:
+            _seen[key] = True
+            _seen.move_to_end(key)
+        while len(_seen) > LRU_SIZE:
+            _seen.popitem(last=False)
+
+
+def _insert_new(rows):
+    """INSERT the (event_id, event_type, payload) rows and return the ids that were new."""
+    table = EventRegister._meta.db_table
+    values = ", ".join(["(%s, %s, %s::jsonb, %s, %s)"] * len(rows))
+    params = []
+    now = timezone.now()
+    for key, event_type, payload in rows:
+        params += [key, event_type, json.dumps(payload), now, "processed"]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (event_id, event_type, payload, processed_at, status) "
+            f"VALUES {values} ON CONFLICT (event_id) DO NOTHING RETURNING event_id",
+            params,
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def claim_events(events) -> list:
+    """Return the events of this delivery that have not been seen before.
+
+    Events without an id are passed through. When called inside a
+    transaction the claims roll back with it, and the LRU is only updated
+    once it commits.
+    """
+    candidates = OrderedDict()
+    for event in events:
+        key = event_id(event)
+        if key and key not in candidates and not _is_seen(key):
+            candidates[key] = event
+    claimed = set()
+    if candidates:
+        claimed = _insert_new(
+            [(key, EVENT_TYPES[event["webhook_type"]], event) for key, event in candidates.items()]
+        )
+        transaction.on_commit(lambda: _remember(candidates.keys()))
+    fresh = []
+    for event in events:
+        key = event_id(event)
+        if key is None:
+            fresh.append(event)
+        elif key in claimed:
+            fresh.append(event)
+            claimed.discard(key)
+        else:
+            print("Duplicate webhook event skipped", key)
+    return fresh
+
+
+def claim_event(event: dict) -> bool:
+    return bool(claim_events([event]))
+
+
+def purge_expired_events(force=False) -> int:
+    """Delete register rows older than ``EVENT_TTL`` (at most once per interval)."""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+    deleted, _ = EventRegister.objects.filter(processed_at__lt=timezone.now() - EVENT_TTL).delete()
+    return deleted
+
+
+def clear_seen_cache():
+    with _seen_lock:
+        _seen.clear()
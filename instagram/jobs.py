@@ -0,0 +1,344 @@
+#pylint:disable=all
+"""Postgres backed job queue for Instagram webhook events.
+
+The webhook view only persists the parsed event here and returns. Workers
+(``python manage.py run_webhook_worker``) claim pending rows with
+``SELECT ... FOR UPDATE SKIP LOCKED`` so several workers can run side by side
+without handing the same event out twice. On ASGI the webhook view also
+drains the queue on its own event loop (``schedule_drain``).
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .comment_cache import purge_comment_reply_cache
+from .embeddings import purge_embedding_cache
+from . import graph
+from .graph import RateLimited
+from .idempotency import claim_events, purge_expired_events
+from .listing_embeddings import drain_embedding_queue
+from .models import WebhookJob
+from .tenants import get_tenant
+from .utils import conversation_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retry N is 2 ** N * RETRY_BASE_DELAY, capped.
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 15 * 60
+# A job stuck in "processing" longer than this belongs to a crashed worker.
+STALE_LOCK_TIMEOUT = timedelta(minutes=10)
+# How often a long-running drain loop looks for such jobs.
+RELEASE_INTERVAL = 60  # seconds
+# A DM burst is never held back longer than this many debounce windows.
+DEBOUNCE_MAX_WAIT_FACTOR = 3
+# Jobs run at once by the in-process (ASGI) drain loop. Each one holds a
+# database connection while it runs, so keep this below max_connections.
+INLINE_CONCURRENCY = 50
+# The drain loop keeps waiting for deferred jobs due within this window.
+INLINE_MAX_IDLE = timedelta(seconds=60)
+# Finished jobs are deleted after these; dead ones stay longer for requeueing.
+DONE_JOB_TTL = timedelta(days=3)
+DEAD_JOB_TTL = timedelta(days=30)
+PURGE_INTERVAL = 60 * 60  # seconds
+
+_last_purge = 0.0
+
+
+def enqueue_event(data: dict):
+    """Persist a parsed webhook event for background processing."""
+    jobs = enqueue_events([data])
+    return jobs[0] if jobs else None
+
+
+def enqueue_events(events) -> list:
+    """Persist a batch of parsed events in arrival order with one INSERT.
+
+    Redeliveries of events already queued are dropped. The claims and the
+    jobs commit together, so a failed insert does not swallow the retry.
+    """
+    with transaction.atomic():
+        events = claim_events(events)
+        if not events:
+            return []
+        return WebhookJob.objects.bulk_create(
+            [
+                WebhookJob(
+                    event_type=event["webhook_type"],
+                    conversation_key=conversation_key(event),
+                    payload=event,
+                )
+                for event in events
+            ]
+        )
+
+
+async def aenqueue_events(events) -> list:
+    return await sync_to_async(enqueue_events)(events)
+
+
+def claim_jobs(batch_size=10):
+    """Lock and mark up to ``batch_size`` runnable jobs as processing.
+
+    A job is only runnable when no older job of the same conversation is
+    still pending or processing, so each conversation is handled in order
+    while different conversations run in parallel.
+    """
+    now = timezone.now()
+    earlier_in_conversation = WebhookJob.objects.filter(
+        conversation_key=OuterRef("conversation_key"),
+        id__lt=OuterRef("id"),
+        status__in=["pending", "processing"],
+    )
+    with transaction.atomic():
+        jobs = list(
+            WebhookJob.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", run_after__lte=now)
+            .filter(~Exists(earlier_in_conversation))
+            .order_by("id")[:batch_size]
+        )
+        if jobs:
+            WebhookJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status="processing", locked_at=now, attempts=F("attempts") + 1
+            )
+            for job in jobs:
+                job.status = "processing"
+                job.locked_at = now
+                job.attempts += 1
+    return jobs
+
+
+def release_stale_jobs():
+    """Put jobs abandoned by a crashed worker back in the queue.
+
+    The crashed run was counted as an attempt when it was claimed, so a job
+    that keeps killing its worker is dead-lettered at ``max_attempts``
+    instead of being handed out forever. Returns the number put back.
+    """
+    now = timezone.now()
+    stale = WebhookJob.objects.filter(status="processing", locked_at__lt=now - STALE_LOCK_TIMEOUT)
+    dead = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="dead", locked_at=None, last_error="Worker stopped while running the job", updated_at=now
+    )
+    if dead:
+        logger.error("Moved %s stale webhook job(s) to dead letter", dead)
+    return stale.update(status="pending", locked_at=None, run_after=now, updated_at=now)
+
+
+def purge_finished_jobs(force=False) -> int:
+    """Delete done and dead jobs past their TTL (at most once per interval)."""
+    global _last_purge
+    now = time.monotonic()
+    if not force and now - _last_purge < PURGE_INTERVAL:
+        return 0
+    _last_purge = now
+    cutoff = timezone.now()
+    deleted, _ = WebhookJob.objects.filter(
+        Q(status="done", updated_at__lt=cutoff - DONE_JOB_TTL)
+        | Q(status="dead", updated_at__lt=cutoff - DEAD_JOB_TTL)
+    ).delete()
+    return deleted
+
+
+async def run_handler(event_type, payload):
+    """Dispatch a parsed event to the matching webhook handler."""
+    from .views import InstagramWebHookView
+
+    handler = InstagramWebHookView()
+    if event_type == "message":
+        return await handler.handle_message_async(data=payload)
+    if event_type == "comment":
+        return await handler.handle_comments_async(data=payload)
+    logger.warning("No handler for webhook job type %s", event_type)
+    return {}
+
+
+def get_dm_debounce_seconds(recipient) -> float:
+    """Per-company DM debounce window (``Company.detail["dm_debounce_seconds"]``)."""
+    tenant = get_tenant(recipient)
+    if not tenant:
+        return 0
+    try:
+        return max(0.0, float(tenant.company.detail.get("dm_debounce_seconds", 0) or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_message_payloads(payloads) -> dict:
+    """Fold a burst of DM events into one event handled as a single turn."""
+    merged = dict(payloads[-1])
+    merged["burst"] = [
+        {"message_id": payload["message_id"], "message": payload["message"]}
+        for payload in payloads
+    ]
+    merged["message"] = "\n".join(str(payload["message"]) for payload in payloads)
+    return merged
+
+
+def collect_dm_burst(job: WebhookJob):
+    """Return (payload, merged_jobs, due) for a DM job and the DMs queued behind it.
+
+    Only consecutive message jobs of the same conversation are merged so a
+    comment in between still runs in order.
+    """
+    window = get_dm_debounce_seconds(job.payload.get("recipient"))
+    if not window:
+        return job.payload, [], None
+    merged_jobs = []
+    following = WebhookJob.objects.filter(
+        conversation_key=job.conversation_key, status="pending", id__gt=job.id
+    ).order_by("id")
+    for other in following:
+        if other.event_type != "message":
+            break
+        merged_jobs.append(other)
+    last_arrival = max([job.created_at] + [other.created_at for other in merged_jobs])
+    due = min(
+        last_arrival + timedelta(seconds=window),
+        job.created_at + timedelta(seconds=window * DEBOUNCE_MAX_WAIT_FACTOR),
+    )
+    payloads = [job.payload] + [other.payload for other in merged_jobs]
+    return merge_message_payloads(payloads), merged_jobs, due
+
+
+async def aprocess_job(job: WebhookJob):
+    """Run a claimed job, scheduling a retry or dead-lettering it on failure.
+
+    Returns the resulting job status. DM jobs of companies with a debounce
+    window are deferred until the sender goes quiet, then handled together
+    with the DMs queued behind them as one agent turn.
+    """
+    payload, merged_jobs = job.payload, []
+    if job.event_type == "message":
+        payload, merged_jobs, due = await sync_to_async(collect_dm_burst)(job)
+        if due and timezone.now() < due:
+            # Not an attempt; the jobs behind it stay blocked until it runs.
+            job.status = "pending"
+            job.locked_at = None
+            job.run_after = due
+            job.attempts -= 1
+            await job.asave(update_fields=["status", "locked_at", "run_after", "attempts", "updated_at"])
+            return job.status
+    try:
+        await run_handler(job.event_type, payload)
+    except RateLimited as error:
+        # Not a failure: run again once the account has a free slot
+        job.status = "pending"
+        job.locked_at = None
+        job.run_after = timezone.now() + timedelta(seconds=error.retry_after)
+        job.attempts -= 1
+        logger.info("Webhook job %s rate limited, deferred %.0fs", job.id, error.retry_after)
+        await job.asave(update_fields=["status", "locked_at", "run_after", "attempts", "updated_at"])
+        return job.status
+    except Exception as error:
+        job.last_error = f"{error}\n{traceback.format_exc()}"
+        job.locked_at = None
+        if job.attempts >= job.max_attempts:
+            job.status = "dead"
+            logger.error("Webhook job %s moved to dead letter: %s", job.id, error)
+        else:
+            delay = min(RETRY_BASE_DELAY * 2 ** job.attempts, RETRY_MAX_DELAY)
+            job.status = "pending"
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            logger.warning("Webhook job %s failed, retrying in %ss: %s", job.id, delay, error)
+        await job.asave(update_fields=["status", "run_after", "locked_at", "last_error", "updated_at"])
+        return job.status
+    if merged_jobs:
+        await WebhookJob.objects.filter(id__in=[other.id for other in merged_jobs]).aupdate(
+            status="done", last_error=f"Merged into job {job.id}", updated_at=timezone.now()
+        )
+    job.status = "done"
+    job.locked_at = None
+    await job.asave(update_fields=["status", "locked_at", "updated_at"])
+    return job.status
+
+
+def process_job(job: WebhookJob):
+    """Run one job from sync code; each call gets its own loop and Graph client."""
+    return graph.run_sync(aprocess_job, job)
+
+
+_drain_task = None
+
+
+def schedule_drain():
+    """Start the in-process drain loop unless it is already running."""
+    global _drain_task
+    if _drain_task is None or _drain_task.done():
+        # Fresh context: the loop must not inherit the request's sync thread
+        _drain_task = asyncio.get_running_loop().create_task(
+            drain_queue(), context=contextvars.Context()
+        )
+
+
+def next_due_job_delay():
+    """Seconds until the earliest pending job becomes runnable, if soon."""
+    next_job = WebhookJob.objects.filter(status="pending").order_by("run_after").first()
+    if not next_job:
+        return None
+    delay = (next_job.run_after - timezone.now()).total_seconds()
+    if delay > INLINE_MAX_IDLE.total_seconds():
+        return None
+    return max(delay, 0)
+
+
+async def _process_isolated(job: WebhookJob):
+    # Own sync thread (and DB connection) per job so ORM and embedding calls
+    # of concurrent conversations do not queue behind each other.
+    async with ThreadSensitiveContext():
+        try:
+            return await aprocess_job(job)
+        finally:
+            await sync_to_async(close_old_connections)()
+
+
+async def drain_queue(concurrency=INLINE_CONCURRENCY):
+    """Claim and run jobs concurrently on the current event loop until idle.
+
+    Slow LLM calls only occupy a task, not a worker, so up to
+    ``concurrency`` conversations progress at once in one process.
+    """
+    await sync_to_async(purge_expired_events)()
+    await sync_to_async(purge_embedding_cache)()
+    await sync_to_async(purge_comment_reply_cache)()
+    await sync_to_async(purge_finished_jobs)()
+    running = set()
+    last_release = None
+    while True:
+        if last_release is None or time.monotonic() - last_release >= RELEASE_INTERVAL:
+            # No worker may be running (ASGI only), so orphaned jobs are released here too
+            await sync_to_async(release_stale_jobs)()
+            last_release = time.monotonic()
+        free = concurrency - len(running)
+        if free > 0:
+            for job in await sync_to_async(claim_jobs)(batch_size=free):
+                running.add(asyncio.create_task(_process_isolated(job)))
+        if running:
+            # Wake up regularly to pick up jobs enqueued by later requests
+            _, running = await asyncio.wait(
+                running, timeout=1.0, return_when=asyncio.FIRST_COMPLETED
+            )
+            continue
+        delay = await sync_to_async(next_due_job_delay)()
+        if delay is None:
+            # Idle: embed listings queued by recent saves before stopping
+            await sync_to_async(drain_embedding_queue)(max_batches=5)
+            return
+        # Jobs blocked behind another worker's job are "due" yet unclaimable
+        await asyncio.sleep(max(delay, 1.0))
+
+
+def requeue_dead_jobs(job_ids=None):
+    """Move dead-lettered jobs back to pending, e.g. after fixing a bug."""
+    queryset = WebhookJob.objects.filter(status="dead")
+    if job_ids:
+        queryset = queryset.filter(id__in=job_ids)
+    return queryset.update(status="pending", attempts=0, run_after=timezone.now(), last_error="")
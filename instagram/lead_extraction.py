@@ -0,0 +1,239 @@
+#pylint:disable=all
+"""Incremental structured lead extraction.
+
+After each AI reply the lead's fields (name, phone, budget, qualification,
+...) are refreshed by an LLM. Instead of re-reading the whole conversation
+every turn, the extractor gets the lead's current state plus only the
+messages after ``Lead.extracted_through_message_id`` and the result is
+merged back, so the cost per turn stays flat over a long chat.
+
+Runs are debounced per lead: a burst of turns schedules one run, and a turn
+arriving while a run is in flight queues exactly one follow-up run. A short
+database lease (``Lead.extraction_locked_until``) keeps workers in other
+processes from extracting the same lead at once, and only the extracted
+fields are saved so concurrent writes to the lead are not clobbered.
+
+Companies with ``Company.detail["dm_merged_lead_extraction"]`` skip the
+extractor altogether: the DM agent answers with a ``DMTurn`` holding both
+the reply and a ``LeadUpdate`` delta, which ``handle_message`` applies.
+"""
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from typing import List, Literal, Optional
+
+from agents import Agent, Runner
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from pydantic import BaseModel, Field
+
+from realestate.models import ConversationMessage, Lead
+
+from .agent_instructions import LEAD_EXTRACTION
+
+EXTRACTION_MODEL_NAME = "gpt-4-turbo"
+# Wait this long after a turn so the assistant reply and quick follow-ups are included
+EXTRACTION_DEBOUNCE_SECONDS = 3
+# New messages sent per extractor call; a longer backlog is worked through in steps
+EXTRACTION_BATCH_MESSAGES = 40
+EXTRACTION_LEASE = timedelta(minutes=2)
+
+STATE_FIELDS = [
+    "customer_name", "phone_number", "email", "preferred_location", "budget_min", "budget_max",
+    "timeline", "payment_method", "property_requirements", "intent_level",
+    "qualification_status", "status", "ai_conversation_summary",
+]
+# Statuses the extractor may set; others (shared, negotiating, ...) are set by people
+EXTRACTOR_STATUSES = {
+    "active", "qualified_hot", "qualified_warm", "qualified_cold",
+    "unqualified", "spam", "closed_won", "closed_lost",
+}
+
+
+class PropertyRequirements(BaseModel):
+    bedrooms: Optional[int] = None
+    bathrooms: Optional[int] = None
+    area_sqft: Optional[float] = None
+    property_type: Optional[str] = None
+    furnished: Optional[Literal["furnished", "semi-furnished", "unfurnished"]] = None
+    amenities: Optional[List[str]] = None
+
+
+class LeadUpdate(BaseModel):
+    """Lead fields learned or changed this turn; null means nothing new."""
+
+    customer_name: Optional[str] = None
+    phone_number: Optional[str] = None
+    email: Optional[str] = None
+    preferred_location: Optional[str] = None
+    budget_min: Optional[float] = None
+    budget_max: Optional[float] = None
+    timeline: Optional[Literal["immediate", "short", "medium", "long", "just_browsing"]] = None
+    payment_method: Optional[Literal["cash", "loan", "both", "unknown"]] = None
+    property_requirements: Optional[PropertyRequirements] = None
+    intent_level: Optional[Literal["low", "medium", "high", "hot"]] = None
+    qualification_status: Optional[
+        Literal["initiated", "in_progress", "qualified", "unqualified", "no_response", "ready_for_agent"]
+    ] = None
+    status: Optional[
+        Literal[
+            "active", "qualified_hot", "qualified_warm", "qualified_cold",
+            "unqualified", "spam", "closed_won", "closed_lost",
+        ]
+    ] = None
+    ai_conversation_summary: Optional[str] = None
+
+    def delta(self) -> dict:
+        return self.model_dump(exclude_none=True)
+
+
+class DMTurn(BaseModel):
+    reply: str = Field(description="The message sent to the customer")
+    lead_update: LeadUpdate
+
+
+_agent = None
+_scheduled = {}  # lead id -> "waiting" | "running" | "rerun"
+_scheduled_lock = threading.Lock()
+
+
+def get_extraction_agent():
+    global _agent
+    if _agent is None:
+        _agent = Agent(name="Lead Data Extractor", model=EXTRACTION_MODEL_NAME, instructions=LEAD_EXTRACTION)
+    return _agent
+
+
+def format_conversation_messages(messages):
+    return "\n".join(
+        f"[{msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')}] {msg.sender_type}: {msg.message_text}"
+        for msg in messages
+    )
+
+
+def current_state(lead) -> dict:
+    state = {}
+    for field in STATE_FIELDS:
+        value = getattr(lead, field)
+        state[field] = float(value) if isinstance(value, Decimal) else value
+    return state
+
+
+def extractor_input(lead, messages) -> str:
+    return (
+        "CURRENT STATE:\n"
+        + json.dumps(current_state(lead), ensure_ascii=False)
+        + "\n\nNEW MESSAGES:\n"
+        + format_conversation_messages(messages)
+    )
+
+
+def merge_lead_update(lead, update: dict) -> list:
+    """Apply extractor output to ``lead``; returns the changed field names."""
+    changed = []
+    for field, value in update.items():
+        if field not in STATE_FIELDS or value is None or value == "":
+            continue
+        if field in ("budget_min", "budget_max"):
+            try:
+                value = Decimal(str(value))
+            except InvalidOperation:
+                continue
+        elif field == "property_requirements":
+            if not isinstance(value, dict):
+                continue
+            value = {**(lead.property_requirements or {}), **{k: v for k, v in value.items() if v is not None}}
+        elif field == "status" and (value not in EXTRACTOR_STATUSES or lead.status not in EXTRACTOR_STATUSES):
+            continue
+        if getattr(lead, field) != value:
+            setattr(lead, field, value)
+            changed.append(field)
+    return changed
+
+
+def _claim(lead_id) -> bool:
+    now = timezone.now()
+    return bool(
+        Lead.objects.filter(id=lead_id)
+        .filter(Q(extraction_locked_until__isnull=True) | Q(extraction_locked_until__lt=now))
+        .update(extraction_locked_until=now + EXTRACTION_LEASE)
+    )
+
+
+def extract_lead_data(lead_id) -> bool:
+    """Fold the messages after the lead's high-water mark into its fields."""
+    if not _claim(lead_id):
+        print("Lead extraction already running elsewhere for lead", lead_id)
+        return False
+    updated = False
+    try:
+        while True:
+            lead = Lead.objects.get(id=lead_id)
+            messages = list(
+                ConversationMessage.objects.filter(
+                    conversation_id=lead.instagram_conversation_id,
+                    id__gt=lead.extracted_through_message_id,
+                ).order_by("id")[:EXTRACTION_BATCH_MESSAGES]
+            )
+            if not messages:
+                return updated
+            result = async_to_sync(Runner.run)(get_extraction_agent(), input=extractor_input(lead, messages))
+            try:
+                lead_update = json.loads(result.final_output)
+            except json.JSONDecodeError:
+                # High-water mark stays put; the next run retries these messages
+                print("❌ Failed to parse agent output as JSON:", result.final_output)
+                return updated
+            if not isinstance(lead_update, dict):
+                return updated
+            changed = merge_lead_update(lead, lead_update)
+            lead.extracted_state = lead_update
+            lead.extracted_through_message_id = messages[-1].id
+            fields = changed + ["extracted_state", "extracted_through_message_id", "updated_at"]
+            if changed:
+                lead.last_interaction_at = timezone.now()
+                fields.append("last_interaction_at")
+                print(f"✅ Lead {lead.id} updated: {', '.join(changed)}")
+            lead.save(update_fields=fields)
+            updated = updated or bool(changed)
+            if len(messages) < EXTRACTION_BATCH_MESSAGES:
+                return updated
+    finally:
+        Lead.objects.filter(id=lead_id).update(extraction_locked_until=None)
+
+
+def _run_scheduled(lead_id):
+    try:
+        while True:
+            with _scheduled_lock:
+                _scheduled[lead_id] = "running"
+            try:
+                extract_lead_data(lead_id)
+            except Exception as e:
+                print("Lead extraction failed for lead", lead_id, e)
+            with _scheduled_lock:
+                if _scheduled.get(lead_id) != "rerun":
+                    _scheduled.pop(lead_id, None)
+                    return
+            time.sleep(EXTRACTION_DEBOUNCE_SECONDS)
+    finally:
+        connection.close()
+
+
+def schedule_lead_extraction(lead_id):
+    """Extract in a background thread shortly, coalescing with runs already scheduled."""
+    with _scheduled_lock:
+        state = _scheduled.get(lead_id)
+        if state == "waiting":
+            return
+        if state in ("running", "rerun"):
+            _scheduled[lead_id] = "rerun"
+            return
+        _scheduled[lead_id] = "waiting"
+    timer = threading.Timer(EXTRACTION_DEBOUNCE_SECONDS, _run_scheduled, args=(lead_id,))
+    timer.daemon = True
+    timer.start()
@@ -0,0 +1,209 @@
+#pylint:disable=all
+"""Batched embedding queue for property listings.
+
+Saving a listing no longer calls OpenAI. The ``post_save`` signal hashes the
+listing's embedding text and, only when it differs from the text the stored
+embedding was built from, marks the listing ``pending``. Workers
+(``run_webhook_worker``, ``embed_listings`` and the ASGI drain loop) claim
+pending listings with ``SELECT ... FOR UPDATE SKIP LOCKED`` and embed them in
+multi-input API calls, retrying failures with backoff before marking them
+``failed``.
+"""
+import hashlib
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from realestate.models import PropertyListing
+
+from .embeddings import EMBEDDING_MODEL, get_openai_client, shorten_embedding
+from .vector_index import invalidate_company_index
+
+logger = logging.getLogger(__name__)
+
+# Listings per embeddings API call
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+# A listing "processing" longer than this belongs to a crashed worker.
+EMBEDDING_LEASE = timedelta(minutes=10)
+
+# Fields that make up build_embedding_text; saves touching none of them are skipped
+TEXT_FIELDS = {
+    "title", "property_type", "status", "location", "price", "currency", "price_type",
+    "bedrooms", "bathrooms", "area_sqft", "amenities", "description",
+}
+
+
+def build_embedding_text(instance: PropertyListing) -> str:
+    """Combine key fields into a single text block for embedding."""
+    parts = [
+        f"Title: {instance.title}",
+        f"Type: {instance.property_type}",
+        f"Status: {instance.status}",
+        f"Location: {instance.location}",
+        f"Price: {instance.price} {instance.currency} ({instance.price_type})",
+        f"Bedrooms: {instance.bedrooms or '-'}",
+        f"Bathrooms: {instance.bathrooms or '-'}",
+        f"Area: {instance.area_sqft or '-'} sqft",
+        f"Amenities: {instance.amenities or '-'}",
+        f"Description: {instance.description or '-'}",
+    ]
+    return "\n".join(parts)
+
+
+def embedding_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embedding_small_hash(text_hash: str, dimensions: int) -> str:
+    """Marker of the text and size ``embedding_small`` was built for."""
+    return hashlib.sha256(f"{dimensions}:{text_hash}".encode("utf-8")).hexdigest()
+
+
+def queue_listing_embedding(instance: PropertyListing, update_fields=None) -> bool:
+    """Mark ``instance`` pending if its embedding text changed; True when queued."""
+    if update_fields is not None and not TEXT_FIELDS & set(update_fields):
+        return False
+    text_hash = embedding_text_hash(build_embedding_text(instance))
+    # Compared in SQL: the saved instance may hold a stale hash
+    return bool(
+        PropertyListing.objects.filter(id=instance.id)
+        .exclude(embedding_hash=text_hash, embedding_status="ready")
+        .exclude(embedding_status="pending")
+        .update(
+            embedding_status="pending",
+            embedding_attempts=0,
+            embedding_error="",
+            embedding_run_after=timezone.now(),
+        )
+    )
+
+
+def claim_pending_listings(batch_size=EMBEDDING_BATCH_SIZE):
+    """Lock and mark up to ``batch_size`` due pending listings as processing."""
+    now = timezone.now()
+    with transaction.atomic():
+        listings = list(
+            PropertyListing.objects.select_for_update(skip_locked=True)
+            .filter(embedding_status="pending", embedding_run_after__lte=now)
+            .order_by("embedding_run_after", "id")[:batch_size]
+        )
+        if listings:
+            PropertyListing.objects.filter(id__in=[listing.id for listing in listings]).update(
+                embedding_status="processing",
+                embedding_run_after=now + EMBEDDING_LEASE,
+                embedding_attempts=F("embedding_attempts") + 1,
+            )
+            for listing in listings:
+                listing.embedding_attempts += 1
+    return listings
+
+
+def release_stale_embeddings():
+    """Put listings abandoned by a crashed worker back in the queue."""
+    return PropertyListing.objects.filter(
+        embedding_status="processing", embedding_run_after__lt=timezone.now()
+    ).update(embedding_status="pending")
+
+
+def _fail(listings, error):
+    for listing in listings:
+        if listing.embedding_attempts >= EMBEDDING_MAX_ATTEMPTS:
+            status, delay = "failed", 0
+        else:
+            status = "pending"
+            delay = min(RETRY_BASE_DELAY * 2 ** listing.embedding_attempts, RETRY_MAX_DELAY)
+        PropertyListing.objects.filter(id=listing.id, embedding_status="processing").update(
+            embedding_status=status,
+            embedding_error=str(error)[:2000],
+            embedding_run_after=timezone.now() + timedelta(seconds=delay),
+        )
+    logger.warning("Embedding %s listing(s) failed: %s", len(listings), error)
+
+
+def embed_pending_listings(batch_size=EMBEDDING_BATCH_SIZE) -> dict:
+    """Embed one batch of pending listings with a single API call."""
+    release_stale_embeddings()
+    listings = claim_pending_listings(batch_size)
+    counts = {"claimed": len(listings), "embedded": 0, "failed": 0}
+    if not listings:
+        return counts
+    texts = [build_embedding_text(listing) for listing in listings]
+    try:
+        response = get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=texts)
+    except Exception as error:
+        _fail(listings, error)
+        counts["failed"] = len(listings)
+        return counts
+
+    now = timezone.now()
+    companies = set()
+    with transaction.atomic():
+        # Locked so a concurrent save cannot slip in between the check and the write
+        current = PropertyListing.objects.select_for_update().in_bulk([listing.id for listing in listings])
+        for item in response.data:
+            listing = current.get(listings[item.index].id)
+            text_hash = embedding_text_hash(texts[item.index])
+            if listing is None:
+                continue
+            if embedding_text_hash(build_embedding_text(listing)) != text_hash:
+                # Edited during the call; embed the new text in a later batch
+                PropertyListing.objects.filter(id=listing.id).update(
+                    embedding_status="pending", embedding_attempts=0, embedding_run_after=now
+                )
+                continue
+            PropertyListing.objects.filter(id=listing.id).update(
+                embedding=item.embedding,
+                embedding_small=shorten_embedding(item.embedding, settings.LISTING_EMBEDDING_DIMENSIONS),
+                embedding_hash=text_hash,
+                embedding_small_hash=embedding_small_hash(text_hash, settings.LISTING_EMBEDDING_DIMENSIONS),
+                embedding_model=EMBEDDING_MODEL,
+                embedding_status="ready",
+                embedding_error="",
+                embedding_run_after=now,
+                embedded_at=now,
+            )
+            counts["embedded"] += 1
+            companies.add(listing.company_id)
+    for company_id in companies:
+        invalidate_company_index(company_id)
+    return counts
+
+
+def drain_embedding_queue(batch_size=EMBEDDING_BATCH_SIZE, max_batches=None) -> dict:
+    """Embed pending listings batch by batch until none are due."""
+    totals = {"claimed": 0, "embedded": 0, "failed": 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        counts = embed_pending_listings(batch_size)
+        batches += 1
+        for key in totals:
+            totals[key] += counts[key]
+        if counts["claimed"] < batch_size:
+            break
+    return totals
+
+
+def embedding_status_counts(company_id=None) -> dict:
+    queryset = PropertyListing.objects.all()
+    if company_id:
+        queryset = queryset.filter(company_id=company_id)
+    counts = {status: 0 for status, _ in PropertyListing.EMBEDDING_STATUS_CHOICES}
+    for row in queryset.values("embedding_status").annotate(total=Count("id")):
+        counts[row["embedding_status"]] = row["total"]
+    return counts
+
+
+def retry_failed_embeddings(company_id=None) -> int:
+    queryset = PropertyListing.objects.filter(embedding_status="failed")
+    if company_id:
+        queryset = queryset.filter(company_id=company_id)
+    return queryset.update(
+        embedding_status="pending", embedding_attempts=0, embedding_error="", embedding_run_after=timezone.now()
+    )
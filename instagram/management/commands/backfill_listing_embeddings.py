@@ -0,0 +1,205 @@
+#pylint:disable=all
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from instagram.embeddings import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, get_openai_client, shorten_embedding
+from instagram.listing_embeddings import build_embedding_text, embedding_small_hash, embedding_text_hash
+from instagram.session import estimate_tokens
+from realestate.models import PropertyListing
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+MAX_RETRIES = 6
+
+
+class RateLimiter:
+    """Spaces requests so neither the request nor the token budget per minute is exceeded."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.next_slot = 0.0
+
+    def wait(self, tokens):
+        now = time.monotonic()
+        if self.next_slot > now:
+            time.sleep(self.next_slot - now)
+        interval = 0.0
+        if self.requests_per_minute:
+            interval = max(interval, 60.0 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            interval = max(interval, 60.0 * tokens / self.tokens_per_minute)
+        self.next_slot = max(now, self.next_slot) + interval
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild listing embeddings in bulk: stream listings in chunks, embed them with multi-input "
+        "OpenAI requests (rate-limited, retried) and write them back with bulk_update. Listings "
+        "whose stored full embedding still matches their text and model are only shortened locally. "
+        "--dimensions rewrites only embedding_small, after its size was changed. Progress is printed "
+        "as --after-id checkpoints, and --only-missing runs resume by themselves."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Only listings of this company id")
+        parser.add_argument("--only-missing", action="store_true", help="Only listings without a ready embedding")
+        parser.add_argument(
+            "--model", default=EMBEDDING_MODEL,
+            help=f"Embedding model (default {EMBEDDING_MODEL}). Search skips listings of any model other than "
+            "EMBEDDING_MODEL, so switch EMBEDDING_MODEL once the backfill is done",
+        )
+        parser.add_argument(
+            "--dimensions", type=int,
+            help="Only rewrite embedding_small, at this size; it must be EMBEDDING_SMALL_DIMENSIONS, so "
+            "change that and migrate first. The full embedding is left as it is",
+        )
+        parser.add_argument("--reembed", action="store_true", help="Call OpenAI even where the stored embedding could be shortened")
+        parser.add_argument("--after-id", type=int, default=0, help="Resume after this listing id")
+        parser.add_argument("--batch-size", type=int, default=100, help="Listings per embeddings request")
+        parser.add_argument("--requests-per-minute", type=int, default=300)
+        parser.add_argument("--tokens-per-minute", type=int, default=500000)
+
+    def handle(self, *args, **options):
+        model = options["model"]
+        column_dimensions = PropertyListing._meta.get_field("embedding_small").dimensions
+        if options["dimensions"] is not None and options["dimensions"] != column_dimensions:
+            raise CommandError(
+                f"embedding_small holds {column_dimensions} dimensions; change EMBEDDING_SMALL_DIMENSIONS "
+                f"and LISTING_EMBEDDING_DIMENSIONS and migrate before --dimensions {options['dimensions']}"
+            )
+        if model != EMBEDDING_MODEL:
+            self.stdout.write(self.style.WARNING(
+                f"Queries are embedded with {EMBEDDING_MODEL}; listings embedded with {model} are left out "
+                "of search until EMBEDDING_MODEL is switched"
+            ))
+        reuse = not options["reembed"]
+
+        queryset = PropertyListing.objects.filter(id__gt=options["after_id"]).order_by("id")
+        if options["company"]:
+            queryset = queryset.filter(company_id=options["company"])
+        if options["only_missing"] and options["dimensions"] is None:
+            # A blank model predates the field and means EMBEDDING_MODEL
+            other_model = ~Q(embedding_model__in=[model, ""] if model == EMBEDDING_MODEL else [model])
+            queryset = queryset.filter(
+                Q(embedding=None) | Q(embedding_small=None) | ~Q(embedding_status="ready") | other_model
+            )
+
+        self.limiter = RateLimiter(options["requests_per_minute"], options["tokens_per_minute"])
+        self.options = options
+        self.counts = {"shortened": 0, "embedded": 0, "requests": 0}
+        started = time.monotonic()
+        batch = []
+        for listing in queryset.iterator(chunk_size=options["batch_size"]):
+            batch.append(listing)
+            if len(batch) == options["batch_size"]:
+                self.process(batch, reuse)
+                batch = []
+        if batch:
+            self.process(batch, reuse)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.0f}s: {self.counts['shortened']} shortened locally, {self.counts['embedded']} "
+            f"embedded via {model} in {self.counts['requests']} request(s)"
+        ))
+
+    def process(self, batch, reuse):
+        model = self.options["model"]
+        small_only = self.options["dimensions"] is not None
+        small = self.options["dimensions"] or settings.LISTING_EMBEDDING_DIMENSIONS
+        now = timezone.now()
+        last_id = batch[-1].id
+        texts = {listing.id: build_embedding_text(listing) for listing in batch}
+        hashes = {listing_id: embedding_text_hash(text) for listing_id, text in texts.items()}
+        if small_only and self.options["only_missing"]:
+            # embedding_small_hash is checked here, it cannot be computed in SQL
+            batch = [
+                listing for listing in batch
+                if listing.embedding_small is None
+                or (listing.embedding_model or EMBEDDING_MODEL) != model
+                or listing.embedding_small_hash != embedding_small_hash(hashes[listing.id], small)
+            ]
+        to_embed = []
+        for listing in batch:
+            text_hash = hashes[listing.id]
+            # An empty hash predates the embedding queue; trust those vectors as well
+            if (
+                not reuse
+                or listing.embedding is None
+                or listing.embedding_hash not in ("", text_hash)
+                or (listing.embedding_model or EMBEDDING_MODEL) != model
+            ):
+                to_embed.append(listing)
+                continue
+            listing.embedding_small = shorten_embedding(listing.embedding, small)
+            listing.embedding_small_hash = embedding_small_hash(text_hash, small)
+            listing.embedding_model = model
+            self.counts["shortened"] += 1
+            if not small_only:
+                listing.embedding_hash = text_hash
+                listing.embedding_status = "ready"
+                listing.embedded_at = listing.embedded_at or now
+
+        if to_embed:
+            vectors = self.embed([texts[listing.id] for listing in to_embed], small if small_only else None)
+            for listing, vector in zip(to_embed, vectors):
+                text_hash = hashes[listing.id]
+                if small_only:
+                    listing.embedding_small = vector
+                    if (listing.embedding_model or EMBEDDING_MODEL) != model:
+                        # The full vector is of the old model; a full run or the queue rebuilds it
+                        listing.embedding = None
+                        listing.embedding_hash = ""
+                else:
+                    if len(vector) != EMBEDDING_DIMENSIONS:
+                        raise CommandError(
+                            f"{model} returned {len(vector)} dimensions but the embedding column holds "
+                            f"{EMBEDDING_DIMENSIONS}; use --dimensions to fill embedding_small only"
+                        )
+                    listing.embedding = vector
+                    listing.embedding_small = shorten_embedding(vector, small)
+                    listing.embedding_hash = text_hash
+                    listing.embedding_status = "ready"
+                    listing.embedding_attempts = 0
+                    listing.embedding_error = ""
+                listing.embedding_small_hash = embedding_small_hash(text_hash, small)
+                listing.embedding_model = model
+                listing.embedded_at = now
+            self.counts["embedded"] += len(to_embed)
+
+        # bulk_update skips post_save, so nothing is queued again
+        if batch:
+            PropertyListing.objects.bulk_update(
+                batch,
+                [
+                    "embedding", "embedding_small", "embedding_hash", "embedding_small_hash", "embedding_model",
+                    "embedding_status", "embedding_attempts", "embedding_error", "embedded_at",
+                ],
+            )
+        self.stdout.write(
+            f"Checkpoint --after-id {last_id}: {self.counts['shortened']} shortened, "
+            f"{self.counts['embedded']} embedded"
+        )
+
+    def embed(self, texts, dimensions=None):
+        kwargs = {"model": self.options["model"], "input": texts}
+        if dimensions is not None:
+            kwargs["dimensions"] = dimensions
+        tokens = sum(estimate_tokens(text) for text in texts)
+        for attempt in range(MAX_RETRIES):
+            self.limiter.wait(tokens)
+            try:
+                response = get_openai_client().embeddings.create(**kwargs)
+                self.counts["requests"] += 1
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except RETRYABLE_ERRORS as error:
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                delay = min(2 ** attempt * 2, 60)
+                self.stdout.write(self.style.WARNING(f"{type(error).__name__}, retrying in {delay}s"))
+                time.sleep(delay)
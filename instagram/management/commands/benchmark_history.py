@@ -0,0 +1,118 @@
+#pylint:disable=all
+import asyncio
+import json
+import time
+import uuid
+
+from agents import Runner
+from django.core.management.base import BaseCommand
+
+from instagram.agent_instructions import AGENT_1, AGENT_1_CONTEXT
+from instagram.session import MyCustomSession, _to_item, estimate_tokens
+from instagram.stubs import GraphStubServer, OpenAIStubServer
+from instagram.views import get_dm_agent
+from realestate.models import Company, ConversationMessage, ConversationSummary, Lead
+
+from .benchmark_webhook_async import Command as WebhookBenchmark
+
+USER_LINES = [
+    "Hi, looking for a 2bhk in Kakkanad, ideally close to Infopark",
+    "Budget is around 60 to 70 lakhs, can stretch a little for a good one",
+    "We need it within 3 months, my lease ends in March",
+    "Is covered parking included? We have two cars",
+    "What about the maintenance charges per month?",
+    "Can you share photos of the kitchen and the balcony view?",
+]
+ASSISTANT_LINES = [
+    "Great choice! Kakkanad has some lovely options near Infopark. Are you looking for ready to move or under construction?",
+    "That works well for this area. Would you be taking a home loan or paying in cash?",
+    "Got it, we can definitely find something ready by then. Which floor do you prefer?",
+    "Yes, this project has one covered slot per flat and extra open parking on request.",
+    "Maintenance is about 3 rupees per sq ft, so roughly 3,500 a month for a 1,150 sq ft flat.",
+    "Sure! I'll send them right over. Could you share your phone number so our agent can arrange a visit?",
+]
+
+
+class Command(BaseCommand):
+    help = "Compare prompt size and LLM latency of full history vs the summarized, token-budgeted history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lengths", default="10,25,50,100,200", help="Comma separated conversation lengths (messages)")
+        parser.add_argument("--llm-latency", type=float, default=0.3, help="Fixed seconds per stubbed OpenAI call")
+        parser.add_argument("--latency-per-1k-tokens", type=float, default=0.05, help="Extra stub seconds per 1k prompt tokens")
+
+    def handle(self, *args, **options):
+        openai_stub = OpenAIStubServer(
+            latency=options["llm_latency"], latency_per_1k_tokens=options["latency_per_1k_tokens"]
+        ).start()
+        graph_stub = GraphStubServer().start()
+        WebhookBenchmark().use_stubs(openai_stub, graph_stub)
+        company = Company.objects.create(name="Benchmark Realty", detail={})
+        try:
+            self.stdout.write(
+                f"{'messages':>9}{'full tok':>10}{'policy tok':>12}{'full s':>9}{'policy s':>10}{'folds':>7}"
+            )
+            for length in [int(value) for value in options["lengths"].split(",") if value.strip()]:
+                row = asyncio.run(self.measure(company, length))
+                self.stdout.write(
+                    f"{length:>9}{row['full_tokens']:>10}{row['policy_tokens']:>12}"
+                    f"{row['full_latency']:>9.2f}{row['policy_latency']:>10.2f}{row['folds']:>7}"
+                )
+        finally:
+            ConversationMessage.objects.filter(lead__company=company).delete()
+            ConversationSummary.objects.filter(lead__company=company).delete()
+            Lead.objects.filter(company=company).delete()
+            company.delete()
+            openai_stub.stop()
+            graph_stub.stop()
+
+    async def measure(self, company, length):
+        conversation_id = f"history_bench_{uuid.uuid4().hex[:10]}"
+        lead = await Lead.objects.acreate(
+            company=company, instagram_conversation_id=conversation_id, instagram_username="history_bench"
+        )
+        session = MyCustomSession.for_company(conversation_id, lead, company)
+        folds = 0
+        # Grow the conversation turn by turn, compacting as handle_message does
+        for i in range(length):
+            user = i % 2 == 0
+            lines = USER_LINES if user else ASSISTANT_LINES
+            await session.add_items(
+                [
+                    {
+                        "sender_type": "user" if user else "assistant",
+                        "message_text": f"{lines[(i // 2) % len(lines)]} ({i})",
+                        "is_from_instagram": False,
+                    }
+                ]
+            )
+            if not user:
+                before = await ConversationSummary.objects.filter(conversation_id=conversation_id).afirst()
+                after = await session.compact()
+                if after and (not before or after.through_message_id != before.through_message_id):
+                    folds += 1
+
+        full_history = [
+            _to_item(m)
+            async for m in ConversationMessage.objects.filter(conversation_id=conversation_id).order_by("timestamp", "id")
+        ]
+        policy_history = await session.get_items()
+        context = {
+            "role": "developer",
+            "content": AGENT_1_CONTEXT.format(company_name=company.name, context_text=""),
+        }
+        full_tokens, full_latency = await self.run_turn(full_history + [context])
+        policy_tokens, policy_latency = await self.run_turn(policy_history + [context])
+        return {
+            "full_tokens": full_tokens,
+            "policy_tokens": policy_tokens,
+            "full_latency": full_latency,
+            "policy_latency": policy_latency,
+            "folds": folds,
+        }
+
+    async def run_turn(self, items):
+        tokens = estimate_tokens(AGENT_1) + estimate_tokens(json.dumps(items, ensure_ascii=False))
+        started = time.perf_counter()
+        await Runner.run(get_dm_agent(), input=items)
+        return tokens, time.perf_counter() - started
@@ -0,0 +1,75 @@
+#pylint:disable=all
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from instagram import vector_index
+from instagram.utils import search_listings
+from realestate.models import PropertyListing
+
+from .benchmark_vector_search import Command as VectorBenchmark
+from .benchmark_vector_search import matryoshka_vector
+from .replay_webhook_events import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the in-process NumPy listing index with the pgvector search, for synthetic "
+        "companies of several sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="50,200,1000,2000", help="Comma separated listing counts")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("-k", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        self.stdout.write(
+            f"{settings.LISTING_EMBEDDING_DIMENSIONS}-d vectors, k={options['k']}, "
+            f"pgvector mode {settings.LISTING_VECTOR_SEARCH}"
+        )
+        self.stdout.write(
+            f"{'listings':>9}{'load ms':>9}{'mem p50':>9}{'mem p95':>9}{'pg p50':>9}{'pg p95':>9}{'overlap':>9}"
+        )
+        for size in [int(value) for value in options["sizes"].split(",") if value.strip()]:
+            company = VectorBenchmark().create_synthetic(rng, size)
+            try:
+                self.stdout.write(self.measure(rng, company, size, options["queries"], options["k"]))
+            finally:
+                vector_index.invalidate_company_index(company.id)
+                company.delete()
+
+    def measure(self, rng, company, size, queries, k):
+        queryset = PropertyListing.objects.filter(company=company)
+        vectors = list(queryset.values_list("embedding", flat=True))
+        queries = [matryoshka_vector(rng, center=list(rng.choice(vectors)), noise=0.02) for _ in range(queries)]
+
+        started = time.perf_counter()
+        index = vector_index.CompanyVectorIndex(
+            *zip(*queryset.values_list("id", "embedding_small")), settings.LISTING_EMBEDDING_DIMENSIONS
+        )
+        load = time.perf_counter() - started
+
+        memory, pgvector, overlaps = [], [], []
+        for query in queries:
+            # Same work as vector_search: eligible ids, one product, fetch the winners
+            started = time.perf_counter()
+            allowed = list(queryset.values_list("id", flat=True))
+            ids = index.search(query, k, allowed_ids=allowed)
+            list(queryset.in_bulk(ids).values())
+            memory.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            expected = [listing.id for listing in search_listings(queryset, query, k)]
+            pgvector.append(time.perf_counter() - started)
+            overlaps.append(len(set(ids) & set(expected)) / max(1, len(expected)))
+
+        return (
+            f"{size:>9}{load * 1000:>9.1f}"
+            f"{percentile(memory, 50) * 1000:>9.2f}{percentile(memory, 95) * 1000:>9.2f}"
+            f"{percentile(pgvector, 50) * 1000:>9.2f}{percentile(pgvector, 95) * 1000:>9.2f}"
+            f"{sum(overlaps) / len(overlaps):>9.3f}"
+        )
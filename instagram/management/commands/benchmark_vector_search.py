@@ -0,0 +1,119 @@
+#pylint:disable=all
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from instagram.embeddings import shorten_embedding
+from instagram.utils import search_listings
+from realestate.models import Company, PropertyListing
+
+from .replay_webhook_events import percentile
+
+FULL_DIMENSIONS = 3072
+
+
+def matryoshka_vector(rng, center=None, noise=1.0):
+    """Random unit vector whose variance decays with the dimension index.
+
+    text-embedding-3 vectors concentrate information in their leading
+    dimensions (that is what makes shortening work); plain uniform noise
+    would not, so synthetic listings mimic that profile.
+    """
+    vector = [
+        (center[i] if center else 0.0) + rng.gauss(0, noise) / math.sqrt(1 + i / 64)
+        for i in range(FULL_DIMENSIONS)
+    ]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare recall@k and latency of the HNSW search over shortened embeddings with the "
+        "exact full-dimension search, on a company's listings or on synthetic ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Benchmark on this company's real listings")
+        parser.add_argument("--listings", type=int, default=5000, help="Synthetic listings when --company is not set")
+        parser.add_argument("--queries", type=int, default=100)
+        parser.add_argument("-k", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        company = None
+        if options["company"]:
+            company = Company.objects.get(id=options["company"])
+            created = False
+        else:
+            company = self.create_synthetic(rng, options["listings"])
+            created = True
+        try:
+            vectors = list(
+                PropertyListing.objects.filter(company=company)
+                .exclude(embedding=None)
+                .values_list("embedding", flat=True)
+            )
+            if not vectors:
+                self.stderr.write("No embedded listings to search")
+                return
+            # Queries: perturbed listing vectors, i.e. messages close to a listing
+            queries = [
+                matryoshka_vector(rng, center=list(rng.choice(vectors)), noise=0.02)
+                for _ in range(options["queries"])
+            ]
+            self.report(company, queries, options["k"], len(vectors))
+        finally:
+            if created:
+                company.delete()
+
+    def create_synthetic(self, rng, count):
+        company = Company.objects.create(name="Vector Benchmark Realty", detail={})
+        dimensions = settings.LISTING_EMBEDDING_DIMENSIONS
+        batch = []
+        for i in range(count):
+            embedding = matryoshka_vector(rng)
+            batch.append(
+                PropertyListing(
+                    company=company,
+                    title=f"Synthetic listing {i}",
+                    embedding=embedding,
+                    embedding_small=shorten_embedding(embedding, dimensions),
+                    # Keep the embedding queue away from synthetic rows
+                    embedding_status="ready",
+                )
+            )
+            if len(batch) == 500:
+                PropertyListing.objects.bulk_create(batch)
+                batch = []
+        PropertyListing.objects.bulk_create(batch)
+        return company
+
+    def report(self, company, queries, k, rows):
+        queryset = PropertyListing.objects.filter(company=company)
+        timings = {"exact": [], "hnsw": []}
+        recalls = []
+        for query in queries:
+            started = time.perf_counter()
+            exact = search_listings(queryset, query, k, mode="exact")
+            timings["exact"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            approx = search_listings(queryset, query, k, mode="hnsw")
+            timings["hnsw"].append(time.perf_counter() - started)
+            expected = {listing.id for listing in exact}
+            recalls.append(len(expected & {listing.id for listing in approx}) / max(1, len(expected)))
+
+        self.stdout.write(
+            f"{rows} listings, {len(queries)} queries, k={k}, "
+            f"{settings.LISTING_EMBEDDING_DIMENSIONS}-d HNSW vs {FULL_DIMENSIONS}-d exact"
+        )
+        for mode, values in timings.items():
+            self.stdout.write(
+                f"{mode:<6} p50 {percentile(values, 50) * 1000:7.1f}ms  "
+                f"p95 {percentile(values, 95) * 1000:7.1f}ms  p99 {percentile(values, 99) * 1000:7.1f}ms"
+            )
+        self.stdout.write(f"recall@{k}: {sum(recalls) / len(recalls):.3f} (min {min(recalls):.2f})")
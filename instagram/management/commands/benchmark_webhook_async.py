@@ -0,0 +1,125 @@
+#pylint:disable=all
+import asyncio
+import os
+import time
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.models import Subscription
+from core.views import get_plan
+from instagram import graph
+from instagram.models import InstagramAccount
+from instagram.stubs import GraphStubServer, OpenAIStubServer
+from instagram.views import InstagramWebHookView
+from realestate.models import Company, ConversationMessage, Lead
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync (one event at a time per worker) and async (concurrent on one "
+        "event loop) DM handling throughput against stubbed OpenAI and Graph APIs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stubbed OpenAI call")
+        parser.add_argument("--graph-latency", type=float, default=0.1, help="Seconds per stubbed Graph call")
+
+    def handle(self, *args, **options):
+        openai_stub = OpenAIStubServer(latency=options["llm_latency"]).start()
+        graph_stub = GraphStubServer(latency=options["graph_latency"]).start()
+        self.use_stubs(openai_stub, graph_stub)
+        business_id = f"bench_{uuid.uuid4().hex[:10]}"
+        company = self.create_tenant(business_id)
+        try:
+            events = options["events"]
+            sync_elapsed = self.run_sync(self.make_events(business_id, "sync", events))
+            async_elapsed = asyncio.run(
+                self.run_async(self.make_events(business_id, "async", events), options["concurrency"])
+            )
+            self.stdout.write(f"Events per mode : {events}")
+            self.stdout.write(f"Sync            : {sync_elapsed:.2f}s ({events / sync_elapsed:.1f} events/s)")
+            self.stdout.write(f"Async           : {async_elapsed:.2f}s ({events / async_elapsed:.1f} events/s)")
+            self.stdout.write(f"Speed-up        : {sync_elapsed / async_elapsed:.1f}x")
+            self.stdout.write(f"Stub calls      : OpenAI {openai_stub.calls}, Graph {graph_stub.calls}")
+        finally:
+            ConversationMessage.objects.filter(conversation_id__startswith=business_id).delete()
+            Lead.objects.filter(company=company).delete()
+            company.delete()
+            openai_stub.stop()
+            graph_stub.stop()
+
+    def use_stubs(self, openai_stub, graph_stub):
+        from agents import set_default_openai_client, set_tracing_disabled
+        from openai import AsyncOpenAI
+
+        os.environ["OPENAI_BASE_URL"] = f"{openai_stub.url}/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        set_default_openai_client(AsyncOpenAI(base_url=f"{openai_stub.url}/v1", api_key="stub"))
+        set_tracing_disabled(True)
+        graph.GRAPH_API_BASE = graph_stub.url
+
+    def create_tenant(self, business_id):
+        company = Company.objects.create(name="Benchmark Realty", detail={})
+        InstagramAccount.objects.create(
+            company=company,
+            instagram_business_account_id=business_id,
+            fb_data={"instagram_business_account_id": business_id},
+            instagram_data={"access_token": "stub"},
+        )
+        plan = get_plan("ai_automate")
+        now = timezone.now()
+        Subscription.objects.create(
+            company=company,
+            plan_id=plan["id"],
+            plan_name=plan["name"],
+            price=plan["price"],
+            start_date=now,
+            end_date=now + timedelta(days=30),
+            renewal_date=now + timedelta(days=30),
+            last_reset_date=now,
+            next_reset_date=now + timedelta(days=30),
+            data={"features_allowed": plan["features_allowed"]},
+            lead_quota=1000000,
+        )
+        return company
+
+    def make_events(self, business_id, mode, count):
+        return [
+            {
+                "webhook_type": "message",
+                "sender": f"{mode}_{i}",
+                "sender_username": f"{mode}_{i}",
+                "recipient": business_id,
+                "message": "Hi, looking for a 2bhk in Kakkanad under 60L",
+                "message_id": f"{business_id}_{mode}_{i}",
+            }
+            for i in range(count)
+        ]
+
+    def run_sync(self, events):
+        started = time.perf_counter()
+        for event in events:
+            InstagramWebHookView().handle_message(event)
+        return time.perf_counter() - started
+
+    async def run_async(self, events, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def handle(event):
+            async with semaphore:
+                async with ThreadSensitiveContext():
+                    try:
+                        await InstagramWebHookView().handle_message_async(event)
+                    finally:
+                        await sync_to_async(close_old_connections)()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(handle(event) for event in events))
+        return time.perf_counter() - started
@@ -0,0 +1,60 @@
+#pylint:disable=all
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from instagram.jobs import enqueue_events
+from instagram.utils import group_events_by_conversation, parse_instagram_payload
+
+DEFAULT_PAYLOADS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "benchmarks",
+    "webhook_batches.json",
+)
+
+
+class Command(BaseCommand):
+    help = "Measure webhook batch parsing (and optionally enqueue) throughput on recorded payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--payloads", default=DEFAULT_PAYLOADS, help="JSON file with a list of recorded webhook bodies")
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--enqueue", action="store_true", help="Also insert the jobs (rolled back afterwards)")
+
+    def handle(self, *args, **options):
+        with open(options["payloads"]) as f:
+            batches = json.load(f)
+        bodies = [json.dumps(batch) for batch in batches]
+        iterations = options["iterations"]
+
+        total_events = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for body in bodies:
+                grouped = group_events_by_conversation(parse_instagram_payload(json.loads(body)))
+                total_events += sum(len(events) for events in grouped.values())
+        elapsed = time.perf_counter() - started
+
+        deliveries = iterations * len(bodies)
+        self.stdout.write(f"Deliveries parsed : {deliveries}")
+        self.stdout.write(f"Events yielded    : {total_events} ({total_events / deliveries:.2f} per delivery)")
+        self.stdout.write(f"Parse throughput  : {deliveries / elapsed:,.0f} deliveries/s, {total_events / elapsed:,.0f} events/s")
+
+        if options["enqueue"]:
+            # Rounds after the first replay the same event ids, so they time
+            # the duplicate-delivery path of the idempotency check.
+            rounds = max(1, iterations // 100)
+            enqueued = 0
+            started = time.perf_counter()
+            with transaction.atomic():
+                for _ in range(rounds):
+                    for body in bodies:
+                        grouped = group_events_by_conversation(parse_instagram_payload(json.loads(body)))
+                        events = [event for events in grouped.values() for event in events]
+                        enqueued += len(enqueue_events(events))
+                transaction.set_rollback(True)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"Enqueue throughput: {rounds * len(bodies) / elapsed:,.0f} deliveries/s, {enqueued / elapsed:,.0f} events/s")
@@ -0,0 +1,65 @@
+#pylint:disable=all
+from django.core.management.base import BaseCommand, CommandError
+
+from instagram.comment_triggers import get_trigger_matcher, trigger_match_rates
+from realestate.models import Company, PropertyListing
+
+
+class Command(BaseCommand):
+    help = (
+        "Print how many comments were answered by trigger rules (without the LLM), per listing. "
+        "With --comment, show which rule of --company / --listing a comment would match."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--company", type=int, help="Only this company id")
+        parser.add_argument("--listing", type=int, help="Listing whose rules --comment is checked against")
+        parser.add_argument("--days", type=int, default=7)
+        parser.add_argument("--comment", help="Comment text to test against the rules instead of printing stats")
+
+    def handle(self, *args, **options):
+        if options["comment"] is not None:
+            return self.test_comment(options)
+
+        rows = trigger_match_rates(options["company"], options["days"])
+        if not rows:
+            self.stdout.write("No comments recorded")
+            return
+        total_comments = sum(row["comments"] for row in rows)
+        total_matched = sum(row["matched"] for row in rows)
+        for row in rows:
+            listing = f"{row['listing_id']} {row['listing__title']}" if row["listing_id"] else "(post not linked)"
+            self.stdout.write(
+                f"company {row['company_id']:<5} {listing[:50]:<50} {row['matched']:>6}/{row['comments']:<6} "
+                f"{row['match_rate']:.0%}"
+            )
+        rate = total_matched / total_comments if total_comments else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_matched} of {total_comments} comments ({rate:.0%}) answered by trigger rules "
+            f"in the last {options['days']} day(s)"
+        ))
+
+    def test_comment(self, options):
+        listing = None
+        if options["listing"]:
+            listing = PropertyListing.objects.select_related("company").filter(id=options["listing"]).first()
+            if listing is None:
+                raise CommandError(f"Listing {options['listing']} not found")
+            company = listing.company
+        elif options["company"]:
+            company = Company.objects.filter(id=options["company"]).first()
+            if company is None:
+                raise CommandError(f"Company {options['company']} not found")
+        else:
+            raise CommandError("--comment needs --company or --listing")
+
+        matcher = get_trigger_matcher(company, listing)
+        for rule in matcher.rules:
+            self.stdout.write(f"{rule.source} rule ({rule.mode}): {', '.join(rule.keywords)}")
+        rule, keyword = matcher.match(options["comment"])
+        if rule is None:
+            self.stdout.write("No trigger rule matches; the comment goes to the LLM")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Matched {rule.source} rule ({rule.mode}) on {keyword!r}"))
+        self.stdout.write(f"Comment reply: {rule.comment_reply or '(company static reply)'}")
+        self.stdout.write(f"DM: {rule.dm_reply or '(company static DM)'}")
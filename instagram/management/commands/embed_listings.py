@@ -0,0 +1,42 @@
+#pylint:disable=all
+import time
+
+from django.core.management.base import BaseCommand
+
+from instagram.listing_embeddings import (
+    EMBEDDING_BATCH_SIZE,
+    drain_embedding_queue,
+    embedding_status_counts,
+    retry_failed_embeddings,
+)
+
+
+class Command(BaseCommand):
+    help = "Embed property listings queued by saves, in batched OpenAI calls."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Listings per API call")
+        parser.add_argument("--company", type=int, help="Scope --status and --retry-failed to this company id")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the queue is empty")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds to wait between polls with --loop")
+        parser.add_argument("--retry-failed", action="store_true", help="Queue failed listings again first")
+        parser.add_argument("--status", action="store_true", help="Only print listing counts per embedding status")
+
+    def handle(self, *args, **options):
+        if options["status"]:
+            for status, count in embedding_status_counts(options["company"]).items():
+                self.stdout.write(f"{status:<11} {count}")
+            return
+        if options["retry_failed"]:
+            count = retry_failed_embeddings(options["company"])
+            self.stdout.write(f"Queued {count} failed listing(s) again")
+
+        while True:
+            totals = drain_embedding_queue(options["batch_size"])
+            if totals["claimed"]:
+                self.stdout.write(
+                    f"Embedded {totals['embedded']}/{totals['claimed']} listing(s), {totals['failed']} failed"
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["sleep"])
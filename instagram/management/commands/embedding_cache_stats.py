@@ -0,0 +1,33 @@
+#pylint:disable=all
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Sum
+
+from instagram.embeddings import purge_embedding_cache
+from instagram.models import EmbeddingCache
+
+
+class Command(BaseCommand):
+    help = "Show how many query embedding calls the persistent cache has saved, and optionally purge it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--purge", action="store_true", help="Drop expired rows and trim the table first")
+        parser.add_argument("--top", type=int, default=10, help="Most reused texts to list")
+
+    def handle(self, *args, **options):
+        if options["purge"]:
+            self.stdout.write(f"Purged {purge_embedding_cache(force=True)} row(s)")
+
+        for row in EmbeddingCache.objects.values("model", "dimensions").annotate(
+            entries=Count("id"), hits=Sum("hits")
+        ).order_by("model", "dimensions"):
+            hits = row["hits"] or 0
+            # Each entry cost one OpenAI call; every table hit saved one
+            hit_rate = hits / (hits + row["entries"]) if hits + row["entries"] else 0
+            self.stdout.write(
+                f"{row['model']} ({row['dimensions']}d): {row['entries']} entries, "
+                f"{hits} table hits, {hit_rate:.0%} of table lookups served from cache"
+            )
+        self.stdout.write("Most reused:")
+        for entry in EmbeddingCache.objects.order_by("-hits")[: options["top"]]:
+            self.stdout.write(f"  {entry.hits:>6}  {entry.text[:80]}")
+        self.stdout.write("In-process LRU hits are logged by each worker every 100 lookups.")
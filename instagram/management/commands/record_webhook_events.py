@@ -0,0 +1,73 @@
+#pylint:disable=all
+import hashlib
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from instagram.models import WebhookJob
+from instagram.utils import parse_instagram_payload
+
+
+def _pseudonym(value):
+    return "u_" + hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:12]
+
+
+class Command(BaseCommand):
+    help = (
+        "Record normalized webhook events to a JSONL file for replay_webhook_events, either from "
+        "the webhook job queue or from a JSON file of raw webhook bodies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="JSONL file to write")
+        parser.add_argument("--from-payloads", help="JSON file with a list of raw webhook bodies instead of the queue")
+        parser.add_argument("--since-hours", type=float, default=24, help="Queue events newer than this")
+        parser.add_argument("--limit", type=int, default=1000)
+        parser.add_argument("--type", choices=["message", "comment"], help="Only record this event type")
+        parser.add_argument("--keep-senders", action="store_true", help="Do not pseudonymize sender ids and usernames")
+
+    def handle(self, *args, **options):
+        if options["from_payloads"]:
+            records = self.from_payloads(options["from_payloads"])
+        else:
+            records = self.from_queue(options["since_hours"])
+        if options["type"]:
+            records = [record for record in records if record["event"].get("webhook_type") == options["type"]]
+        records = records[: options["limit"]]
+
+        with open(options["output"], "w") as f:
+            for record in records:
+                if not options["keep_senders"]:
+                    event = record["event"]
+                    for field in ("sender", "sender_username"):
+                        if event.get(field):
+                            event[field] = _pseudonym(event[field])
+                f.write(json.dumps(record) + "\n")
+        self.stdout.write(self.style.SUCCESS(f"Recorded {len(records)} event(s) to {options['output']}"))
+
+    def from_queue(self, since_hours):
+        """Events as the handlers received them, with their arrival offsets."""
+        jobs = WebhookJob.objects.filter(
+            created_at__gte=timezone.now() - timedelta(hours=since_hours)
+        ).order_by("created_at")
+        records = []
+        first = None
+        for job in jobs.iterator():
+            first = first or job.created_at
+            records.append({"offset": (job.created_at - first).total_seconds(), "event": job.payload})
+        return records
+
+    def from_payloads(self, path):
+        with open(path) as f:
+            bodies = json.load(f)
+        records = []
+        first = None
+        for body in bodies:
+            times = [entry.get("time") for entry in body.get("entry", []) or [] if entry and entry.get("time")]
+            arrived = min(times) if times else first or 0
+            first = arrived if first is None else first
+            for event in parse_instagram_payload(body):
+                records.append({"offset": max(0, arrived - first), "event": event})
+        return records
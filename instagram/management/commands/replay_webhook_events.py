@@ -0,0 +1,157 @@
+#pylint:disable=all
+import asyncio
+import contextvars
+import json
+import math
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+
+from instagram.jobs import run_handler
+from instagram.stubs import GraphStubServer, OpenAIStubServer
+from instagram.utils import conversation_key
+from realestate.models import Company, ConversationMessage, Lead
+
+from .benchmark_webhook_async import Command as WebhookBenchmark
+
+# Query counter of the event being replayed; sync_to_async carries it into
+# the ORM threads.
+_current_counter = contextvars.ContextVar("replay_query_counter", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_counter(sender, connection, **kwargs):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay events recorded by record_webhook_events through the webhook handlers at a target "
+        "rate, against local OpenAI and Graph stubs, and report latency percentiles, queries per "
+        "event and errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="JSONL file written by record_webhook_events")
+        parser.add_argument("--rate", type=float, default=0, help="Events per second (default: recorded pacing)")
+        parser.add_argument("--speed", type=float, default=1.0, help="Speed-up of the recorded pacing when --rate is not set")
+        parser.add_argument("--concurrency", type=int, default=50, help="Events handled at once (1 models a single sync worker)")
+        parser.add_argument("--limit", type=int, default=0)
+        parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stubbed OpenAI call")
+        parser.add_argument("--graph-latency", type=float, default=0.1, help="Seconds per stubbed Graph call")
+
+    def handle(self, *args, **options):
+        with open(options["input"]) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        if options["limit"]:
+            records = records[: options["limit"]]
+        if not records:
+            raise CommandError("No events to replay")
+
+        openai_stub = OpenAIStubServer(latency=options["llm_latency"]).start()
+        graph_stub = GraphStubServer(latency=options["graph_latency"]).start()
+        bench = WebhookBenchmark()
+        bench.use_stubs(openai_stub, graph_stub)
+        business_id = f"replay_{uuid.uuid4().hex[:10]}"
+        company = bench.create_tenant(business_id)
+        # Recorded comments rarely hit a listing linked in this scratch tenant
+        Company.objects.filter(id=company.id).update(
+            detail={"enable_comment_reply_only_on_linked_instagram_post_on_property_listing": False}
+        )
+        connection_created.connect(_install_counter)
+        for connection in connections.all(initialized_only=True):
+            _install_counter(None, connection)
+        try:
+            events = [self.prepare(record["event"], business_id, i) for i, record in enumerate(records)]
+            if options["rate"]:
+                schedule = [i / options["rate"] for i in range(len(records))]
+            else:
+                schedule = [float(record.get("offset", 0)) / options["speed"] for record in records]
+            started = time.perf_counter()
+            results = asyncio.run(self.replay(events, schedule, options["concurrency"]))
+            elapsed = time.perf_counter() - started
+            self.report(results, elapsed, openai_stub, graph_stub)
+        finally:
+            connection_created.disconnect(_install_counter)
+            ConversationMessage.objects.filter(conversation_id__startswith=business_id).delete()
+            Lead.objects.filter(company=company).delete()
+            company.delete()
+            openai_stub.stop()
+            graph_stub.stop()
+
+    def prepare(self, event, business_id, index):
+        """Point a recorded event at the scratch tenant with ids unique to this run."""
+        event = {key: value for key, value in event.items() if key != "burst"}
+        event["recipient"] = business_id
+        if event.get("webhook_type") == "message":
+            event["message_id"] = f"{business_id}_{index}_{event.get('message_id', '')}"
+        elif event.get("webhook_type") == "comment":
+            event["comment_id"] = f"{business_id}_{index}_{event.get('comment_id', '')}"
+        return event
+
+    async def replay(self, events, schedule, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        conversation_locks = {}
+        results = []
+        started = time.perf_counter()
+
+        async def run(event, due):
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            arrived = time.perf_counter()
+            # Same-conversation events stay in order, as they do in the queue
+            lock = conversation_locks.setdefault(conversation_key(event), asyncio.Lock())
+            counter = [0]
+            _current_counter.set(counter)
+            error = None
+            async with lock, semaphore:
+                async with ThreadSensitiveContext():
+                    try:
+                        await run_handler(event["webhook_type"], event)
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                    finally:
+                        await sync_to_async(close_old_connections)()
+            results.append((event["webhook_type"], time.perf_counter() - arrived, counter[0], error))
+
+        await asyncio.gather(*(run(event, due) for event, due in zip(events, schedule)))
+        return results
+
+    def report(self, results, elapsed, openai_stub, graph_stub):
+        self.stdout.write(f"Events replayed : {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f} events/s)")
+        self.stdout.write(f"{'type':<10}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'queries':>9}{'errors':>8}")
+        for event_type in ["all"] + sorted({result[0] for result in results}):
+            rows = [result for result in results if event_type == "all" or result[0] == event_type]
+            latencies = [row[1] for row in rows]
+            queries = sum(row[2] for row in rows) / len(rows)
+            errors = sum(1 for row in rows if row[3])
+            self.stdout.write(
+                f"{event_type:<10}{len(rows):>7}"
+                f"{percentile(latencies, 50):>8.2f}s{percentile(latencies, 95):>8.2f}s"
+                f"{percentile(latencies, 99):>8.2f}s{max(latencies):>8.2f}s"
+                f"{queries:>9.1f}{errors:>8}"
+            )
+        errors = Counter(row[3] for row in results if row[3])
+        for message, count in errors.most_common(5):
+            self.stdout.write(self.style.ERROR(f"{count} x {message[:200]}"))
+        self.stdout.write(f"Stub calls      : OpenAI {openai_stub.calls}, Graph {graph_stub.calls}")
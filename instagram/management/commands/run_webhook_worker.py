@@ -0,0 +1,78 @@
+#pylint:disable=all
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from instagram import graph
+from instagram.comment_cache import purge_comment_reply_cache
+from instagram.embeddings import purge_embedding_cache
+from instagram.idempotency import purge_expired_events
+from instagram.jobs import aprocess_job, claim_jobs, purge_finished_jobs, release_stale_jobs, requeue_dead_jobs
+from instagram.listing_embeddings import embed_pending_listings
+
+
+class Command(BaseCommand):
+    help = "Process queued Instagram webhook events (messages and comments)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10, help="Jobs claimed per poll")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit (for cron / scheduled events)")
+        parser.add_argument("--requeue-dead", action="store_true", help="Move dead-lettered jobs back to pending and exit")
+
+    def handle(self, *args, **options):
+        if options["requeue_dead"]:
+            count = requeue_dead_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Requeued {count} dead job(s)"))
+            return
+
+        self.stdout.write(f"Webhook worker started (batch size {options['batch_size']})")
+        # One event loop for the worker's lifetime, so the Graph client and
+        # its keep-alive connections are shared by every job
+        asyncio.run(self.run(options))
+
+    def housekeeping(self):
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write(self.style.WARNING(f"Released {released} stale job(s)"))
+        purged = purge_expired_events()
+        if purged:
+            self.stdout.write(f"Purged {purged} expired event id(s)")
+        purged = purge_embedding_cache()
+        if purged:
+            self.stdout.write(f"Purged {purged} cached embedding(s)")
+        purged = purge_comment_reply_cache()
+        if purged:
+            self.stdout.write(f"Purged {purged} cached comment reply(s)")
+        purged = purge_finished_jobs()
+        if purged:
+            self.stdout.write(f"Purged {purged} finished job(s)")
+        embedded = embed_pending_listings()
+        if embedded["claimed"]:
+            self.stdout.write(
+                f"Embedded {embedded['embedded']}/{embedded['claimed']} queued listing(s)"
+            )
+        return embedded
+
+    async def run(self, options):
+        try:
+            while True:
+                embedded = await sync_to_async(self.housekeeping)()
+
+                jobs = await sync_to_async(claim_jobs)(batch_size=options["batch_size"])
+                for job in jobs:
+                    status = await aprocess_job(job)
+                    if status == "done":
+                        self.stdout.write(f"✅ Job {job.id} ({job.event_type}) done")
+                    elif job.last_error:
+                        self.stdout.write(self.style.ERROR(f"❌ Job {job.id} ({job.event_type}) failed: {status}"))
+                    else:
+                        self.stdout.write(f"⏳ Job {job.id} ({job.event_type}) deferred until {job.run_after}")
+
+                if not jobs and not embedded["claimed"]:
+                    if options["once"]:
+                        return
+                    await asyncio.sleep(options["sleep"])
+        finally:
+            await graph.aclose_async_client()
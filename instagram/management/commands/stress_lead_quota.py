@@ -0,0 +1,88 @@
+#pylint:disable=all
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from core.models import Subscription
+from instagram.stubs import GraphStubServer, OpenAIStubServer
+from realestate.models import ConversationMessage, Lead
+
+from .benchmark_webhook_async import Command as WebhookBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire parallel new-lead webhooks (and raw quota reservations from threads) at one "
+        "subscription and check that leads_used never loses an increment or overshoots lead_quota."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--webhooks", type=int, default=60, help="Parallel DMs, each from a new sender")
+        parser.add_argument("--quota", type=int, default=25)
+        parser.add_argument("--threads", type=int, default=16, help="Threads for the raw reserve_lead run")
+        parser.add_argument("--reservations", type=int, default=400, help="Raw reserve_lead calls")
+
+    def handle(self, *args, **options):
+        openai_stub = OpenAIStubServer(latency=0.05).start()
+        graph_stub = GraphStubServer(latency=0.02).start()
+        bench = WebhookBenchmark()
+        bench.use_stubs(openai_stub, graph_stub)
+        business_id = f"quota_{uuid.uuid4().hex[:10]}"
+        company = bench.create_tenant(business_id)
+        subscription = Subscription.objects.get(company=company)
+        failures = []
+        try:
+            failures += self.run_webhooks(bench, business_id, company, subscription, options)
+            failures += self.run_reservations(subscription, options)
+        finally:
+            ConversationMessage.objects.filter(conversation_id__startswith=business_id).delete()
+            Lead.objects.filter(company=company).delete()
+            company.delete()
+            openai_stub.stop()
+            graph_stub.stop()
+        if failures:
+            raise CommandError("; ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Lead quota accounting held under concurrency"))
+
+    def run_webhooks(self, bench, business_id, company, subscription, options):
+        quota, webhooks = options["quota"], options["webhooks"]
+        Subscription.objects.filter(pk=subscription.pk).update(lead_quota=quota, leads_used=0)
+        events = bench.make_events(business_id, "quota", webhooks)
+        asyncio.run(bench.run_async(events, concurrency=webhooks))
+
+        leads = Lead.objects.filter(company=company).count()
+        used = Subscription.objects.get(pk=subscription.pk).leads_used
+        expected = min(quota, leads)
+        self.stdout.write(f"Webhooks        : {webhooks} parallel, quota {quota}")
+        self.stdout.write(f"Leads created   : {leads}")
+        self.stdout.write(f"leads_used      : {used} (expected {expected})")
+        failures = []
+        if leads != webhooks:
+            failures.append(f"{webhooks - leads} webhook(s) did not create a lead")
+        if used != expected:
+            failures.append(f"webhooks left leads_used at {used}, expected {expected}")
+        return failures
+
+    def run_reservations(self, subscription, options):
+        quota, calls = options["quota"], options["reservations"]
+        Subscription.objects.filter(pk=subscription.pk).update(lead_quota=quota, leads_used=0)
+
+        def reserve(_):
+            try:
+                return subscription.reserve_lead()
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=options["threads"]) as pool:
+            granted = sum(pool.map(reserve, range(calls)))
+
+        used = Subscription.objects.get(pk=subscription.pk).leads_used
+        self.stdout.write(f"Reservations    : {calls} from {options['threads']} threads, {granted} granted")
+        self.stdout.write(f"leads_used      : {used} (expected {min(quota, calls)})")
+        failures = []
+        if granted != used or used != min(quota, calls):
+            failures.append(f"{granted} reservation(s) granted but leads_used is {used}")
+        return failures
@@ -1,5 +1,7 @@
 #pylint:disable=all
 from django.db import models
+from django.utils import timezone
+from pgvector.django import VectorField
 
 # Create your models here.
 class InstagramAccount(models.Model):
@@ -30,4 +32,158 @@ class InstagramAccount(models.Model):
             )
         ]
         verbose_name = "Instagram Account"
-        verbose_name_plural = "Instagram Accounts"
\ No newline at end of file
+        verbose_name_plural = "Instagram Accounts"
+
+class WebhookJob(models.Model):
+    """Parsed webhook event waiting to be handled by a queue worker."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("done", "Done"),
+        ("dead", "Dead Letter"),
+    ]
+
+    event_type = models.CharField(max_length=50)
+    # recipient_sender; jobs sharing a key are handled strictly in order
+    conversation_key = models.CharField(max_length=255, blank=True, default="")
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.event_type} #{self.id} ({self.status})"
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["conversation_key", "status"]),
+            models.Index(fields=["status", "updated_at"]),
+        ]
+        verbose_name = "Webhook Job"
+        verbose_name_plural = "Webhook Jobs"
+
+
+class EmbeddingCache(models.Model):
+    """Persistent tier of the query embedding cache (see ``instagram.embeddings``)."""
+
+    # sha256 of model, dimensions and normalized text
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    dimensions = models.IntegerField()
+    text = models.TextField(blank=True)
+    embedding = VectorField()
+    hits = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.model}/{self.dimensions}: {self.text[:50]}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_used_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+        verbose_name = "Embedding Cache Entry"
+        verbose_name_plural = "Embedding Cache"
+
+
+class CommentReplyCache(models.Model):
+    """Cached AGENT_2 replies to generic comments on a listing's post (see ``instagram.comment_cache``).
+
+    Each (listing, intent, language) key holds a small pool of variants so
+    repeated comments do not all get the same reply.
+    """
+
+    listing = models.ForeignKey(
+        "realestate.PropertyListing", on_delete=models.CASCADE, related_name="comment_reply_cache"
+    )
+    # sha256 of the property context the reply was generated from; a listing edit changes it
+    context_hash = models.CharField(max_length=64)
+    intent = models.CharField(max_length=50)
+    language = models.CharField(max_length=50)
+    response = models.JSONField(default=dict)
+    hits = models.IntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.listing_id}/{self.intent}/{self.language}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["listing", "intent", "language", "expires_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
+        verbose_name = "Comment Reply Cache Entry"
+        verbose_name_plural = "Comment Reply Cache"
+
+
+class CommentTriggerStat(models.Model):
+    """Daily comment counts per listing and how many a trigger rule answered (see ``instagram.comment_triggers``)."""
+
+    company = models.ForeignKey(
+        "realestate.Company", on_delete=models.CASCADE, related_name="comment_trigger_stats"
+    )
+    # Null for comments on posts not linked to a listing
+    listing = models.ForeignKey(
+        "realestate.PropertyListing", on_delete=models.CASCADE, null=True, blank=True,
+        related_name="comment_trigger_stats",
+    )
+    day = models.DateField()
+    comments = models.IntegerField(default=0)
+    matched = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.company_id}/{self.listing_id}/{self.day}"
+
+    class Meta:
+        # NULLs are distinct in a plain unique index, so unlinked posts get their own
+        constraints = [
+            models.UniqueConstraint(
+                fields=["company", "listing", "day"],
+                condition=models.Q(listing__isnull=False),
+                name="unique_comment_trigger_stat_listing",
+            ),
+            models.UniqueConstraint(
+                fields=["company", "day"],
+                condition=models.Q(listing__isnull=True),
+                name="unique_comment_trigger_stat_no_listing",
+            ),
+        ]
+        indexes = [models.Index(fields=["company", "day"])]
+        verbose_name = "Comment Trigger Stat"
+        verbose_name_plural = "Comment Trigger Stats"
+
+
+class PrefilterStat(models.Model):
+    """Daily count of comments / DMs skipped by the spam and noise filter (see ``instagram.prefilter``)."""
+
+    CHANNEL_CHOICES = [("comment", "Comment"), ("dm", "DM")]
+    VERDICT_CHOICES = [("spam", "Spam"), ("noise", "Noise")]
+
+    company = models.ForeignKey("realestate.Company", on_delete=models.CASCADE, related_name="prefilter_stats")
+    day = models.DateField()
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    verdict = models.CharField(max_length=20, choices=VERDICT_CHOICES)
+    reason = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.company_id}/{self.day}/{self.channel}/{self.reason}"
+
+    class Meta:
+        unique_together = ("company", "day", "channel", "verdict", "reason")
+        verbose_name = "Prefilter Stat"
+        verbose_name_plural = "Prefilter Stats"
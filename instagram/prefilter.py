@@ -0,0 +1,198 @@
+#pylint:disable=all
+"""Local spam / noise filter run before any LLM call or lead creation.
+
+Every comment, and every DM that would start a new conversation, is
+classified here as ``spam``, ``noise`` or ``actionable`` using rules and the
+sender's recent history only (no network). Skipped events create no lead,
+use no lead quota and make no LLM call; they are counted per company, day,
+channel and reason in ``PrefilterStat`` for the reports page.
+
+- spam: the company's blocked words, link / follower / crypto promotion,
+  and senders over the per-hour limit for the channel
+- noise: emoji or punctuation only, tag-a-friend comments ("@rahul see
+  this"), praise-only comments ("wow 😍 nice") and the same text repeated
+  by a sender within the hour
+
+DMs in conversations that already have a lead always pass. The history is
+kept per process, which is enough for one webhook worker per host. Events
+are remembered by comment / message id, so a retried job gets the verdict
+of its first attempt instead of counting as a repeat of itself.
+
+Settings in ``Company.detail``: ``prefilter_enabled`` (default on),
+``prefilter_skip_noise`` (default on; spam is always skipped),
+``prefilter_comment_limit_per_hour`` (default 5),
+``prefilter_dm_limit_per_hour`` (default 30) and ``prefilter_blocked_words``
+(comma separated).
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from datetime import timedelta
+
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .comment_cache import INTENT_KEYWORDS
+from .models import PrefilterStat
+
+HISTORY_WINDOW = 60 * 60  # seconds
+MAX_TRACKED_SENDERS = 50000
+DEFAULT_COMMENT_LIMIT = 5
+DEFAULT_DM_LIMIT = 30
+# Words besides mentions a tag-a-friend comment may have ("@rahul see this")
+MAX_TAG_WORDS = 4
+
+MENTION = re.compile(r"@[\w.]+")
+SPAM_PATTERNS = re.compile(
+    r"https?://|www\.|bit\.ly|t\.me/|wa\.me/|(?<![@\w.])\w+\.(?:com|net|xyz|io|link|shop)\b"
+    r"|\b(?:free|buy|get|gain|real)\s+(?:followers|likes|views)\b|\bfollow\s*(?:back|4\s*follow|for\s*follow)\b"
+    r"|\b(?:crypto|bitcoin|btc|forex|binary\s+trading|onlyfans|telegram\s+channel)\b"
+    r"|\b(?:check|see|visit)\s+(?:my|our)\s+(?:bio|profile|page|story)\b|\b(?:dm|message)\s+(?:us\s+)?(?:for|to)\s+(?:collab|promo|promotion)\b"
+    r"|\b(?:promote|promotion|collab)\b.*\b(?:page|account|profile)\b"
+    r"|\bearn\s+(?:₹|rs\.?|\$)?\s*\d+",
+    re.IGNORECASE,
+)
+PRAISE_WORDS = {
+    "nice", "wow", "super", "superb", "awesome", "beautiful", "amazing", "great", "good", "lovely",
+    "excellent", "fantastic", "cool", "gorgeous", "stunning", "perfect", "best", "congrats",
+    "congratulations", "dream", "home", "house", "view", "omg", "woww", "sooo", "so", "very", "looks",
+    "look", "mashallah", "masha", "allah", "mast", "kadak", "sundar", "adipoli", "semma", "kalakki",
+    "bahut", "badhiya", "bhai", "bro", "sir", "it", "is", "this", "the", "a", "place", "wah", "waah",
+}
+TAG_WORDS = {
+    "see", "this", "look", "check", "it", "out", "dekh", "dekho", "bro", "bhai", "da", "di", "yaar",
+    "for", "us", "our", "we", "need", "next", "home", "lol", "haha", "hahaha", "tag", "here",
+}
+REASON_LABELS = {
+    "blocked_word": "Blocked word",
+    "promotion": "Promotion / links",
+    "rate_limit": "Over hourly limit",
+    "repeat": "Repeated text",
+    "tag_only": "Tags only",
+    "tag_a_friend": "Tag a friend",
+    "emoji_only": "Emoji only",
+    "praise": "Praise only",
+}
+INTENT_WORDS = {keyword for keywords in INTENT_KEYWORDS.values() for keyword in keywords}
+
+_history = {}  # (company id, channel, sender) -> deque of (monotonic time, text hash, event id)
+_history_lock = threading.Lock()
+
+
+def prefilter_settings(company) -> dict:
+    detail = company.detail or {}
+    try:
+        comment_limit = max(0, int(detail.get("prefilter_comment_limit_per_hour", DEFAULT_COMMENT_LIMIT)))
+        dm_limit = max(0, int(detail.get("prefilter_dm_limit_per_hour", DEFAULT_DM_LIMIT)))
+    except (TypeError, ValueError):
+        comment_limit, dm_limit = DEFAULT_COMMENT_LIMIT, DEFAULT_DM_LIMIT
+    blocked = detail.get("prefilter_blocked_words", "")
+    if isinstance(blocked, str):
+        blocked = blocked.split(",")
+    return {
+        "enabled": detail.get("prefilter_enabled", True),
+        "skip_noise": detail.get("prefilter_skip_noise", True),
+        "limits": {"comment": comment_limit, "dm": dm_limit},
+        "blocked_words": [word.strip().lower() for word in blocked if word.strip()],
+    }
+
+
+def _words(text):
+    return ["".join(char for char in token if unicodedata.category(char)[0] in "LMN") for token in text.lower().split()]
+
+
+def _remember(key, text_hash, event_id=None):
+    """Add the event to the sender's history; returns (events in the window, repeats of this text).
+
+    An ``event_id`` already in the history is not added again; the counts
+    are those of the events before it, as on its first call.
+    """
+    now = time.monotonic()
+    with _history_lock:
+        events = _history.get(key)
+        if events is None:
+            if len(_history) >= MAX_TRACKED_SENDERS:
+                # Forget senders with nothing in the window, else the oldest half
+                stale = [sender for sender, past in _history.items() if not past or past[-1][0] < now - HISTORY_WINDOW]
+                for sender in stale or list(_history)[: MAX_TRACKED_SENDERS // 2]:
+                    del _history[sender]
+            events = _history[key] = deque()
+        while events and events[0][0] < now - HISTORY_WINDOW:
+            events.popleft()
+        if event_id:
+            for index, (_, _, past_id) in enumerate(events):
+                if past_id == event_id:
+                    before = list(events)[:index]
+                    return index + 1, sum(1 for _, past_hash, _ in before if past_hash == text_hash)
+        repeats = sum(1 for _, past_hash, _ in events if past_hash == text_hash)
+        events.append((now, text_hash, event_id))
+        return len(events), repeats
+
+
+def classify_event(company, channel: str, sender, text: str, event_id=None):
+    """Return (verdict, reason) for a comment or new-conversation DM; verdict is spam, noise or actionable.
+
+    ``event_id`` (the comment or message id) makes retries of the same event
+    get the same verdict.
+    """
+    settings = prefilter_settings(company)
+    if not settings["enabled"]:
+        return "actionable", ""
+    text = str(text or "")
+    lowered = unicodedata.normalize("NFC", text).lower()
+    count, repeats = _remember(
+        (company.id, channel, str(sender)),
+        hashlib.sha1(" ".join(lowered.split()).encode("utf-8")).hexdigest(),
+        str(event_id) if event_id else None,
+    )
+
+    if any(word in lowered for word in settings["blocked_words"]):
+        return "spam", "blocked_word"
+    if SPAM_PATTERNS.search(lowered):
+        return "spam", "promotion"
+    limit = settings["limits"][channel]
+    if limit and count > limit:
+        return "spam", "rate_limit"
+
+    if not settings["skip_noise"]:
+        return "actionable", ""
+    if lowered.strip() and repeats:
+        return "noise", "repeat"
+    without_mentions = MENTION.sub(" ", lowered)
+    words = [word for word in _words(without_mentions) if word]
+    if not words:
+        if MENTION.search(lowered):
+            return "noise", "tag_only"
+        return "noise", "emoji_only"
+    if channel != "comment" or set(words) & INTENT_WORDS:
+        return "actionable", ""
+    if MENTION.search(lowered) and len(words) <= MAX_TAG_WORDS and all(word in TAG_WORDS | PRAISE_WORDS for word in words):
+        return "noise", "tag_a_friend"
+    if all(word in PRAISE_WORDS for word in words):
+        return "noise", "praise"
+    return "actionable", ""
+
+
+def record_skip(company_id, channel: str, verdict: str, reason: str):
+    stat, _ = PrefilterStat.objects.get_or_create(
+        company_id=company_id, day=timezone.localdate(), channel=channel, verdict=verdict, reason=reason
+    )
+    PrefilterStat.objects.filter(id=stat.id).update(count=F("count") + 1)
+
+
+def prefilter_summary(company_id, days=30) -> dict:
+    """Skipped events of the last ``days`` days, for the reports page."""
+    stats = PrefilterStat.objects.filter(company_id=company_id, day__gt=timezone.localdate() - timedelta(days=days))
+    summary = {"total": 0, "spam": 0, "noise": 0, "comment": 0, "dm": 0}
+    by_reason = {}
+    for row in stats.values("channel", "verdict", "reason").annotate(total=Sum("count")):
+        summary["total"] += row["total"]
+        summary[row["verdict"]] += row["total"]
+        summary[row["channel"]] += row["total"]
+        label = REASON_LABELS.get(row["reason"], row["reason"])
+        by_reason[label] = by_reason.get(label, 0) + row["total"]
+    summary["by_reason"] = sorted(by_reason.items(), key=lambda item: -item[1])
+    return summary
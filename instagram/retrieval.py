@@ -0,0 +1,232 @@
+#pylint:disable=all
+"""Property context retrieval for DM turns.
+
+Many DMs cannot benefit from a listing search: greetings, thank-yous, a name
+or a phone number. ``needs_retrieval`` recognises those with local regex and
+keyword rules plus ``Lead.conversation_stage``; for them the listings of the
+previous turn (stored on the assistant message) are reused instead of paying
+for an embedding call and a vector query. Skips and the retrieval latency
+they saved are counted per process (``retrieval_stats``) and recorded on each
+assistant message's ``extracted_data``.
+
+When retrieval does run, ``hybrid_search`` pre-filters the company's
+available listings with what the lead told us (budget, bedrooms) and fuses
+vector similarity with a Postgres full-text rank, so a few listings that fit
+go to the LLM instead of ten that merely sound alike. The vector ranking
+comes from ``vector_index``: in memory for small companies, pgvector above.
+"""
+import re
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Q
+
+from realestate.models import ConversationMessage, PropertyListing
+
+from .embeddings import embed_query
+from .utils import summarize_property
+from .vector_index import vector_search
+
+# Listings handed to the LLM per turn; the pre-filters make a few enough
+HYBRID_LIMIT = 4
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = 20
+# Reciprocal rank fusion constant; larger flattens the rank differences
+RRF_K = 60
+TEXT_WEIGHT = 0.5
+# Show listings slightly above the stated budget too
+BUDGET_TOLERANCE = Decimal("1.15")
+
+# needs_retrieval reason for messages with nothing but greetings, names and contact details
+SMALL_TALK = "small talk / contact details"
+# Stages in which a reply without property hints is about the customer, not listings
+CONTACT_STAGES = {"contact", "handoff", "closing"}
+
+PROPERTY_HINTS = re.compile(
+    r"\b("
+    r"\d+\s*bhk|bhk|bed(room)?s?|bath(room)?s?|flat|apartment|villa|house|home|plot|land|"
+    r"property|properties|project|listing|studio|penthouse|duplex|commercial|office|shop|"
+    r"price|pricing|rate|cost|budget|lakh|lakhs|lac|lacs|crore|crores|cr|emi|loan|"
+    r"sq\.?\s?ft|sqft|cent|cents|acre|acres|area|size|floor|"
+    r"location|located|where|near|nearby|distance|road|city|"
+    r"available|availability|ready|possession|rent|buy|sale|sell|"
+    r"photo|photos|pic|pics|picture|video|brochure|details|amenities|parking|"
+    r"ghar|makaan|veedu|flatu|plotu"
+    r")\b",
+    re.IGNORECASE,
+)
+PHONE = re.compile(r"(?<!\w)\+?\d[\d\s\-()]{6,}\d")
+EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+NAME_INTRO = re.compile(r"\b(my name is|my name's|i am|i'm|im|this is|it's|its|call me|name is|name:)\s+\w+", re.IGNORECASE)
+FILLER_WORDS = {
+    "hi", "hii", "hiii", "hello", "helo", "hey", "heyy", "hai", "namaste", "namaskar", "vanakkam",
+    "namaskaram", "good", "morning", "afternoon", "evening", "night", "gm",
+    "thanks", "thank", "you", "thx", "ty", "tq", "thankyou", "dhanyavad", "shukriya", "nandri", "nanni",
+    "ok", "okay", "okk", "k", "kk", "sure", "fine", "great", "cool", "nice", "super", "perfect",
+    "yes", "yeah", "yep", "ya", "haan", "ha", "no", "nope", "nahi", "illa", "alright", "done",
+    "sir", "madam", "mam", "maam", "bro", "dear", "please", "pls", "plz",
+    "my", "number", "phone", "mobile", "whatsapp", "contact", "email", "mail", "id", "is", "and",
+    "here", "it", "the", "a", "to", "me", "on", "at", "will", "call", "wait", "waiting",
+}
+
+_stats = {"turns": 0, "skipped": 0, "retrieval_seconds": 0.0, "retrievals": 0}
+_stats_lock = threading.Lock()
+
+
+def needs_retrieval(message: str, lead=None):
+    """Return (retrieve, reason) for a customer message."""
+    text = str(message or "")
+    if PROPERTY_HINTS.search(text):
+        return True, "property hint"
+    stage = getattr(lead, "conversation_stage", "") or ""
+    if stage in CONTACT_STAGES:
+        return False, f"{stage} stage"
+    stripped = EMAIL.sub(" ", PHONE.sub(" ", text))
+    stripped = NAME_INTRO.sub(" ", stripped)
+    words = re.findall(r"[^\W\d_]+", stripped.lower())
+    if not [word for word in words if word not in FILLER_WORDS]:
+        return False, SMALL_TALK
+    return True, "default"
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def lead_filters(lead):
+    """SQL predicates from what the lead told us, most specific last.
+
+    Listings missing the compared field (no price, no bedroom count) are
+    kept so incomplete listings are not hidden.
+    """
+    filters = []
+    if lead is None:
+        return filters
+    if lead.budget_max:
+        filters.append(
+            Q(price__isnull=True)
+            | Q(price_type="per_unit")
+            | Q(price__lte=Decimal(lead.budget_max) * BUDGET_TOLERANCE)
+        )
+    bedrooms = _int((lead.property_requirements or {}).get("bedrooms"))
+    if bedrooms:
+        filters.append(Q(bedrooms__isnull=True) | Q(bedrooms__gte=bedrooms, bedrooms__lte=bedrooms + 1))
+    return filters
+
+
+def text_query(*texts):
+    """OR of the words in ``texts`` as a full-text query, or None."""
+    words = {word for text in texts for word in re.findall(r"[^\W_]{3,}", str(text or "").lower())}
+    if not words:
+        return None
+    return SearchQuery(" | ".join(sorted(words)), search_type="raw", config="simple")
+
+
+def _fuse(queryset, company, query_embedding, query, limit):
+    ranked = {}
+    scores = {}
+    for rank, listing in enumerate(vector_search(queryset, company.id, query_embedding, HYBRID_CANDIDATES)):
+        ranked[listing.id] = listing
+        scores[listing.id] = 1 / (RRF_K + rank + 1)
+    if query is not None:
+        # Same expression as the listing_search_gin index
+        vector = SearchVector("title", "location", "description", "amenities", config="simple")
+        text_hits = (
+            queryset.annotate(search=vector)
+            .filter(search=query)
+            .annotate(rank=SearchRank(vector, query))
+            .order_by("-rank")[:HYBRID_CANDIDATES]
+        )
+        for rank, listing in enumerate(text_hits):
+            ranked.setdefault(listing.id, listing)
+            scores[listing.id] = scores.get(listing.id, 0) + TEXT_WEIGHT / (RRF_K + rank + 1)
+    best = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [ranked[listing_id] for listing_id in best]
+
+
+def hybrid_search(user_message, lead, company, limit=HYBRID_LIMIT):
+    """Available listings of ``company`` matching the lead, ranked by vector and text relevance.
+
+    The lead's budget and bedroom filters are dropped one at a time, most
+    specific first, while fewer than ``limit`` listings match.
+    """
+    base = PropertyListing.objects.select_related("company").filter(company=company, status="available")
+    filters = lead_filters(lead)
+    query_embedding = embed_query(user_message)
+    query = text_query(user_message, getattr(lead, "preferred_location", ""))
+    while True:
+        queryset = base
+        for condition in filters:
+            queryset = queryset.filter(condition)
+        listings = _fuse(queryset, company, query_embedding, query, limit)
+        if len(listings) >= limit or not filters:
+            return listings
+        filters.pop()
+
+
+def previous_listings(conversation_id, company):
+    """Listings retrieved for the last assistant reply of the conversation."""
+    last_reply = (
+        ConversationMessage.objects.filter(conversation_id=conversation_id, sender_type="assistant")
+        .order_by("-timestamp", "-id")
+        .values_list("extracted_data", flat=True)
+        .first()
+    )
+    ids = (last_reply or {}).get("listing_ids") or []
+    if not ids:
+        return []
+    by_id = PropertyListing.objects.select_related("company").filter(company=company).in_bulk(ids)
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def average_retrieval_seconds() -> float:
+    with _stats_lock:
+        return _stats["retrieval_seconds"] / _stats["retrievals"] if _stats["retrievals"] else 0.0
+
+
+def retrieve_context(user_message, lead, company, conversation_id) -> dict:
+    """Return the property context for a DM turn and how it was obtained."""
+    retrieve, reason = needs_retrieval(user_message, lead)
+    started = time.perf_counter()
+    if retrieve:
+        # Filter by company - prevents cross-company data leakage
+        listings = hybrid_search(user_message, lead, company)
+    else:
+        listings = previous_listings(conversation_id, company)
+    elapsed = time.perf_counter() - started
+    with _stats_lock:
+        _stats["turns"] += 1
+        if retrieve:
+            _stats["retrievals"] += 1
+            _stats["retrieval_seconds"] += elapsed
+        else:
+            _stats["skipped"] += 1
+    saved = max(0.0, average_retrieval_seconds() - elapsed) if not retrieve else 0.0
+    if not retrieve:
+        stats = retrieval_stats()
+        print(
+            f"Retrieval skipped ({reason}), reused {len(listings)} listing(s); saved ~{saved * 1000:.0f}ms. "
+            f"{stats['skipped']}/{stats['turns']} turns skipped in this process"
+        )
+    return {
+        "snippets": [summarize_property(listing) for listing in listings],
+        "listing_ids": [listing.id for listing in listings],
+        "retrieval": "performed" if retrieve else "skipped",
+        "retrieval_reason": reason,
+        "retrieval_ms": round(elapsed * 1000, 1),
+        "retrieval_saved_ms": round(saved * 1000, 1),
+    }
+
+
+def retrieval_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["skip_rate"] = stats["skipped"] / stats["turns"] if stats["turns"] else 0.0
+    stats["avg_retrieval_ms"] = stats["retrieval_seconds"] / stats["retrievals"] * 1000 if stats["retrievals"] else 0.0
+    stats["estimated_saved_ms"] = stats["skipped"] * stats["avg_retrieval_ms"]
+    return stats
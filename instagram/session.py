@@ -2,9 +2,8 @@
 
 from realestate.models import (
     ConversationMessage,
+    ConversationSummary,
 )
-from django.utils.decorators import method_decorator
-from django.views.decorators.csrf import csrf_exempt
 
 import logging
 
@@ -14,30 +13,119 @@ logger = logging.getLogger(__name__)
 from typing import List, Optional
 from asgiref.sync import sync_to_async
 
+# History policy defaults; companies can override them in Company.detail
+# ("history_recent_messages", "history_token_budget").
+HISTORY_RECENT_MESSAGES = 12
+HISTORY_TOKEN_BUDGET = 3000
+# Older messages are folded into the summary in batches of at least this
+# many, so the summary is not rewritten on every turn.
+HISTORY_FOLD_BATCH = 8
+SUMMARY_MODEL_NAME = "gpt-5-mini"
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; UTF-8 bytes / 4 also holds up for Indic scripts."""
+    return len((text or "").encode("utf-8")) // 4 + 1
+
+
+def _setting(detail, key, default):
+    try:
+        return max(1, int(detail.get(key) or default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_item(message) -> dict:
+    # Map sender_type to OpenAI-compatible roles
+    # 'user' -> 'user', 'assistant'/'human_agent' -> 'assistant'
+    role = 'user' if message.sender_type == 'user' else 'assistant'
+    return {"role": role, "content": message.message_text}
+
 
 class MyCustomSession:
-    """Custom session backed by the ConversationMessage model."""
+    """Custom session backed by the ConversationMessage model.
+
+    Only the most recent messages are sent verbatim. Older ones are folded
+    into a persisted rolling summary (``ConversationSummary``) by
+    :meth:`compact`, and the whole history is kept under a token budget.
+    """
 
-    def __init__(self, conversation_id: str, lead):
+    def __init__(self, conversation_id: str, lead, recent_messages=HISTORY_RECENT_MESSAGES,
+                 token_budget=HISTORY_TOKEN_BUDGET):
         self.conversation_id = conversation_id
         self.lead = lead
+        self.recent_messages = recent_messages
+        self.token_budget = token_budget
 
-    async def get_items(self, limit: Optional[int] = None) -> List[dict]:
-        """Retrieve messages for this conversation."""
+    @classmethod
+    def for_company(cls, conversation_id: str, lead, company):
+        detail = company.detail or {}
+        return cls(
+            conversation_id,
+            lead,
+            recent_messages=_setting(detail, "history_recent_messages", HISTORY_RECENT_MESSAGES),
+            token_budget=_setting(detail, "history_token_budget", HISTORY_TOKEN_BUDGET),
+        )
+
+    async def _load(self):
+        """Return the summary (or None) and the messages it does not cover yet."""
+        summary = await ConversationSummary.objects.filter(
+            conversation_id=self.conversation_id
+        ).afirst()
         queryset = ConversationMessage.objects.filter(
             conversation_id=self.conversation_id
-        ).order_by("timestamp")
+        ).order_by("timestamp", "id")
+        if summary:
+            queryset = queryset.filter(id__gt=summary.through_message_id)
+        messages = [m async for m in queryset if m.message_text]
+        return summary, messages
+
+    async def get_items(self, limit: Optional[int] = None) -> List[dict]:
+        """Retrieve the summary plus the newest messages that fit the token budget."""
+        summary, messages = await self._load()
+        budget = self.token_budget - (summary.token_estimate if summary else 0)
+        kept, used = [], 0
+        for m in reversed(messages):
+            cost = estimate_tokens(m.message_text)
+            if kept and used + cost > budget:
+                break
+            kept.append(_to_item(m))
+            used += cost
+        kept.reverse()
         if limit:
-            queryset = queryset[:limit]
-        messages = await sync_to_async(list)(queryset)
-        res = []
-        for m in messages:
-            if m.message_text:
-                # Map sender_type to OpenAI-compatible roles
-                # 'user' -> 'user', 'assistant'/'human_agent' -> 'assistant'
-                role = 'user' if m.sender_type == 'user' else 'assistant'
-                res.append({"role": role, "content": m.message_text})
-        return res
+            kept = kept[-limit:]
+        if summary and summary.summary:
+            return [{"role": "developer", "content": SUMMARY_PREFIX + summary.summary}] + kept
+        return kept
+
+    async def compact(self) -> Optional[ConversationSummary]:
+        """Fold messages older than the verbatim window into the rolling summary.
+
+        Runs after the reply is sent so it never delays a turn. The summary
+        is only rewritten once a batch of old messages has built up, or the
+        history no longer fits the budget.
+        """
+        summary, messages = await self._load()
+        older = messages[:-self.recent_messages] if len(messages) > self.recent_messages else []
+        if not older:
+            return summary
+        total = (summary.token_estimate if summary else 0) + sum(estimate_tokens(m.message_text) for m in messages)
+        if len(older) < HISTORY_FOLD_BATCH and total <= self.token_budget:
+            return summary
+        text = await summarize_history(summary.summary if summary else "", older)
+        summary, _ = await ConversationSummary.objects.aupdate_or_create(
+            conversation_id=self.conversation_id,
+            defaults={
+                "lead": self.lead,
+                "summary": text,
+                "through_message_id": older[-1].id,
+                "summarized_messages": (summary.summarized_messages if summary else 0) + len(older),
+                "token_estimate": estimate_tokens(SUMMARY_PREFIX + text),
+            },
+        )
+        print(f"History of {self.conversation_id}: folded {len(older)} message(s) into the summary")
+        return summary
 
     async def add_items(self, items: List[dict]) -> None:
         """Store new messages."""
@@ -87,3 +175,23 @@ class MyCustomSession:
                 conversation_id=self.conversation_id
             ).delete()
         )()
+        await ConversationSummary.objects.filter(conversation_id=self.conversation_id).adelete()
+
+
+async def summarize_history(previous_summary: str, messages) -> str:
+    """Return ``previous_summary`` updated with ``messages`` (oldest first)."""
+    from agents import Agent, Runner
+
+    from .agent_instructions import HISTORY_SUMMARY
+
+    transcript = "\n".join(f"{m.sender_type}: {m.message_text}" for m in messages)
+    agent = Agent(
+        name="Conversation Summarizer",
+        model=SUMMARY_MODEL_NAME,
+        instructions=HISTORY_SUMMARY,
+    )
+    result = await Runner.run(
+        agent,
+        input=f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}",
+    )
+    return str(result.final_output).strip()
@@ -0,0 +1,27 @@
+#pylint:disable=all
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import Subscription
+from realestate.models import Company
+
+from .models import InstagramAccount
+from .tenants import invalidate_tenant
+
+
+@receiver(post_save, sender=InstagramAccount)
+@receiver(post_delete, sender=InstagramAccount)
+def invalidate_tenant_for_account(sender, instance, **kwargs):
+    invalidate_tenant(account_id=instance.id, company_id=instance.company_id)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_tenant_for_company(sender, instance, **kwargs):
+    invalidate_tenant(company_id=instance.id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_tenant_for_subscription(sender, instance, **kwargs):
+    invalidate_tenant(company_id=instance.company_id)
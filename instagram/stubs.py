@@ -0,0 +1,203 @@
+#pylint:disable=all
+"""Local stand-ins for the OpenAI and Instagram Graph APIs used by benchmarks.
+
+Each server answers on ``127.0.0.1`` with a fixed artificial latency (plus,
+optionally, a per-token one mimicking prompt processing) so the webhook path
+can be exercised end to end without network calls or cost.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 3072
+
+
+def fake_embedding(text, dimensions=EMBEDDING_DIMENSIONS):
+    """Deterministic pseudo-embedding so identical texts map to identical vectors."""
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dimensions)]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        size = int(self.headers.get("Content-Length") or 0)
+        payload = self._read_json()
+        # ~4 bytes of request body per prompt token
+        time.sleep(self.server.latency + size / 4 / 1000 * self.server.latency_per_1k_tokens)
+        self.server.record(self.path)
+        self._send_json(self.server.respond(self.path, payload))
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.record(self.path)
+        self._send_json(self.server.respond(self.path, {}))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, latency_per_1k_tokens=0.0):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.latency = latency
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.calls = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def record(self, path):
+        with self._lock:
+            key = path.split("?")[0]
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def respond(self, path, payload):
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class OpenAIStubServer(StubServer):
+    """Answers ``/v1/responses``, ``/v1/chat/completions`` and ``/v1/embeddings``."""
+
+    def requested_schema(self, payload):
+        """JSON schema of a structured output request (Responses or Chat Completions), else None."""
+        text_format = (payload.get("text") or {}).get("format") or {}
+        if text_format.get("type") == "json_schema":
+            return text_format.get("schema") or {}
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return (response_format.get("json_schema") or {}).get("schema") or {}
+        return None
+
+    def reply_text(self, payload):
+        reply = "Thanks for reaching out! Could you share your name?"
+        schema = self.requested_schema(payload)
+        if schema is not None and "reply" in (schema.get("properties") or {}):
+            # lead_extraction.DMTurn; an empty lead_update means nothing new
+            return json.dumps({"reply": reply, "lead_update": {}})
+        # Responses API requests carry the conversation in "input", Chat Completions in "messages"
+        instructions = (
+            str(payload.get("instructions", ""))
+            + json.dumps(payload.get("messages", []))
+            + json.dumps(payload.get("input", ""))
+        )
+        if "comment_reply" in instructions:
+            return json.dumps(
+                {
+                    "comment_reply": "Thanks! Please check your DM 😊",
+                    "first_dm": "Hi! Thanks for your comment. What are you looking for?",
+                    "context_for_dm_handler": "User commented on a listing post",
+                    "detected_language": "english",
+                }
+            )
+        if "keeps the structured lead data" in instructions:
+            return "{}"
+        return reply
+
+    def usage(self):
+        return {
+            "input_tokens": 1200,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": 40,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": 1240,
+        }
+
+    def respond(self, path, payload):
+        if path.endswith("/embeddings"):
+            inputs = payload.get("input", "")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            dimensions = payload.get("dimensions") or EMBEDDING_DIMENSIONS
+            return {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dimensions)}
+                    for i, text in enumerate(inputs)
+                ],
+                "model": payload.get("model", "text-embedding-3-large"),
+                "usage": {"prompt_tokens": 8, "total_tokens": 8},
+            }
+        if path.endswith("/chat/completions"):
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model", "gpt-5"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": self.reply_text(payload)},
+                    }
+                ],
+                "usage": {"prompt_tokens": 1200, "completion_tokens": 40, "total_tokens": 1240},
+            }
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": payload.get("model", "gpt-5"),
+            "status": "completed",
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "output": [
+                {
+                    "type": "message",
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": self.reply_text(payload), "annotations": []}],
+                }
+            ],
+            "usage": self.usage(),
+        }
+
+
+class GraphStubServer(StubServer):
+    """Answers Instagram Graph API send / reply calls with success payloads."""
+
+    def respond(self, path, payload):
+        if path.rstrip("/").endswith("/replies"):
+            return {"id": f"stub_reply_{uuid.uuid4().hex[:12]}"}
+        recipient = (payload.get("recipient") or {})
+        return {
+            "recipient_id": recipient.get("id") or recipient.get("comment_id", ""),
+            "message_id": f"stub_mid_{uuid.uuid4().hex}",
+        }
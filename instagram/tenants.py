@@ -0,0 +1,126 @@
+#pylint:disable=all
+"""Resolve the tenant behind a webhook's business account id.
+
+Routing goes through the unique (indexed) ``instagram_business_account_id``
+column and the result is kept in a process-local cache, so in the steady
+state a webhook finds its account, company, subscription and tokens without
+a single query. Unknown or disconnected account ids are cached as misses
+for the same TTL, so webhooks for them cost one query per minute rather than
+one each. ``instagram.signals`` drops entries when any of those rows is
+saved; the TTL bounds staleness for changes made by other processes.
+Feature checks go through ``core.entitlements``.
+"""
+import threading
+import time
+
+from core.models import Subscription
+
+from .models import InstagramAccount
+
+TENANT_CACHE_TTL = 60  # seconds
+
+_cache = {}
+_lock = threading.Lock()
+_MISSING = object()  # not cached; a cached miss is stored as None
+
+
+class TenantContext:
+    """Everything the webhook handlers need to know about one tenant."""
+
+    __slots__ = ("account", "company", "subscription", "business_account_id", "access_token")
+
+    def __init__(self, account, subscription):
+        self.account = account
+        self.company = account.company
+        self.subscription = subscription
+        self.business_account_id = (account.fb_data or {}).get("instagram_business_account_id")
+        self.access_token = (account.instagram_data or {}).get("access_token")
+
+
+def _lookup_account(business_account_id):
+    account = (
+        InstagramAccount.objects.select_related("company")
+        .filter(instagram_business_account_id=business_account_id)
+        .first()
+    )
+    if account is None:
+        # Accounts connected before the column was filled in
+        account = (
+            InstagramAccount.objects.select_related("company")
+            .filter(fb_data__instagram_business_account_id=business_account_id)
+            .first()
+        )
+        if account is not None:
+            InstagramAccount.objects.filter(id=account.id).update(
+                instagram_business_account_id=business_account_id
+            )
+    if account is None or (account.fb_data or {}).get("instagram_business_account_id") != business_account_id:
+        # Facebook disconnected: the webhook no longer belongs to this company
+        return None
+    return account
+
+
+def _cached(business_account_id):
+    entry = _cache.get(str(business_account_id))
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return _MISSING
+
+
+def _store(business_account_id, context):
+    with _lock:
+        _cache[str(business_account_id)] = (context, time.monotonic() + TENANT_CACHE_TTL)
+
+
+def load_tenant(business_account_id):
+    """Build a fresh ``TenantContext`` (or None) from the database."""
+    account = _lookup_account(str(business_account_id))
+    if account is None:
+        return None
+    subscription = Subscription.objects.filter(company=account.company).first()
+    return TenantContext(account, subscription)
+
+
+def get_tenant(business_account_id):
+    """Return the cached ``TenantContext`` for a business account id, or None."""
+    if not business_account_id:
+        return None
+    context = _cached(business_account_id)
+    if context is _MISSING:
+        context = load_tenant(business_account_id)
+        _store(business_account_id, context)
+    return context
+
+
+async def aget_tenant(business_account_id):
+    """Async :func:`get_tenant`; cache hits never leave the event loop."""
+    from asgiref.sync import sync_to_async
+
+    if not business_account_id:
+        return None
+    context = _cached(business_account_id)
+    if context is _MISSING:
+        context = await sync_to_async(get_tenant)(business_account_id)
+    return context
+
+
+def invalidate_tenant(account_id=None, company_id=None):
+    """Drop cached contexts for an InstagramAccount id and/or Company id.
+
+    Saving an account also drops every cached miss, since it may have just
+    been connected to one of those business account ids.
+    """
+    with _lock:
+        for key, (context, _) in list(_cache.items()):
+            if context is None:
+                if account_id is not None:
+                    _cache.pop(key, None)
+            elif (account_id is not None and context.account.id == account_id) or (
+                company_id is not None and context.company.id == company_id
+            ):
+                _cache.pop(key, None)
+
+
+def clear_tenant_cache():
+    with _lock:
+        _cache.clear()
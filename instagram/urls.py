@@ -10,6 +10,7 @@ urlpatterns = [
     path('callback/fb/', views.FBCallbackView.as_view(), name='fb_callback'),
     path('callback/instagram/', views.InstagramCallbackView.as_view(), name='instagram_callback'),
     path('webhook/', views.InstagramWebHookView.as_view(), name='instagram_webhook'),
+    path('webhook/async/', views.AsyncInstagramWebHookView.as_view(), name='instagram_webhook_async'),
     path('facebook/', views.InstagramWebHookView.as_view(), name='facebook'),
     path('save-token/', views.instagram_save_token, name='instagram_save_token'),
     path('event-subscribe/<int:company_id>/', views.InstagramWebHookSubscribe.as_view(), name="event-subscribe"),
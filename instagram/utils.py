@@ -1,153 +1,10 @@
-
 #pylint: disable=all
-from openai import OpenAI
 from realestate.models import PropertyListing
-client = OpenAI()
 from pgvector.django import CosineDistance
-from asgiref.sync import sync_to_async
-from django.utils import timezone
-from agents import Agent, Runner
-from realestate.models import Lead, ConversationMessage
-import json
-
-from asgiref.sync import async_to_sync
 
-
-def format_conversation_messages(messages):
-    formatted_strings = []
-    for msg in messages:
-        formatted_strings.append(
-            f"[{msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')}] {msg.sender_type}: {msg.message_text}"
-        )
-    return "\n".join(formatted_strings)
-
-def extract_lead_data_async(lead_id, lead=None):
-    lead = lead if lead else Lead.objects.get(id=lead_id)
-    messages = ConversationMessage.objects.filter(conversation_id=lead.instagram_conversation_id).order_by("timestamp")
-    conversation_text = format_conversation_messages(messages)
-
-    agent = Agent(
-    name="Lead Data Extractor",
-    model="gpt-4-turbo",
-    instructions="""
-You are an AI assistant that reads a real estate chat conversation and extracts structured lead data.
-Output a single valid JSON object **only**, with the following fields:
-
-REQUIRED FIELDS:
-- customer_name: string or null
-- phone_number: string (digits, include country code if possible) or null
-- email: string or null
-- preferred_location: string or null
-- budget_min: number or null
-- budget_max: number or null
-- timeline: one of ["immediate", "short", "medium", "long", "just_browsing"] or null
-- payment_method: one of ["cash", "loan", "both", "unknown"]
-- property_requirements: JSON object (example: {"bedrooms": 2, "bathrooms": 2, "area_sqft": 1200}) or empty object {}
-- intent_level: one of ["low", "medium", "high", "hot"] or null
-- qualification_status: one of ["initiated", "in_progress", "qualified", "unqualified", "no_response", "ready_for_agent"]
-- status: one of ["active", "qualified_hot", "qualified_warm", "qualified_cold", "unqualified", "spam", "closed_won", "closed_lost"]
-- ai_conversation_summary: string, concise summary of user conversation
-
-EXTRACTION RULES:
-
-1. Output only valid JSON. No extra text outside the JSON object.
-2. If a field value is unknown, use null (not empty string).
-3. property_requirements must be an object, even if empty {}.
-4. Always include all fields.
-5. All numbers must be valid JSON numbers (not strings).
-
-QUALIFICATION LOGIC (Critical):
-
-Set qualification_status based on conversation analysis:
-- "initiated" → Just started talking, minimal info
-- "in_progress" → Has provided some info (name, location, or timeline mentioned)
-- "qualified" → Has name/phone + at least 2 of: budget + location + property type + timeline
-- "unqualified" → Explicitly not interested, spam, or rude
-- "no_response" → They stopped responding mid-conversation
-- "ready_for_agent" → Qualified + phone number present → MARK THIS FOR HANDOFF
-
-Set status based on engagement and qualification:
-- "active" → Actively chatting, responding well
-- "qualified_hot" → Has phone + budget + location + timeline → HOT LEAD (ready for immediate agent follow-up)
-- "qualified_warm" → Has phone + 2-3 of (budget/location/timeline/property type) → Warm lead
-- "qualified_cold" → Has basic info but vague on budget/timeline → Cold lead
-- "unqualified" → Not interested or spam
-- "spam" → Irrelevant messages, multiple requests, suspicious behavior
-- "closed_won" → Lead converted/property bought (if mentioned)
-- "closed_lost" → Explicitly said not interested or stopped responding
-
-INTENT LEVEL MAPPING (based on what they say and ask):
-- "low" → Passive browsing, no urgency, vague responses
-- "medium" → Interested but still exploring, some hesitation
-- "high" → Active interest, asking specific questions, has preferences
-- "hot" → Very engaged, phone provided, clear budget/timeline, ready to move forward
-
-TIMELINE INTERPRETATION:
-- immediate → "ASAP", "this month", "URGENTLY", "right now"
-- short → "next month", "1-3 months", "soon", "Q1"
-- medium → "3-6 months", "half year", "this year"
-- long → "6+ months", "next year", "taking time"
-- just_browsing → "just looking", "exploring", "browsing", "no rush"
-
-PROPERTY REQUIREMENTS:
-Extract these if mentioned:
-- bedrooms: number
-- bathrooms: number
-- area_sqft: number
-- property_type: "apartment", "villa", "land", "builder floor", etc.
-- amenities: ["list", "of", "amenities"] if mentioned
-- furnished: "furnished", "semi-furnished", "unfurnished"
-
-EXAMPLE OUTPUT:
-
-{
-    "customer_name": "John Doe",
-    "phone_number": "+911234567890",
-    "email": "johndoe@example.com",
-    "preferred_location": "Bangalore, Whitefield",
-    "budget_min": 5000000,
-    "budget_max": 8000000,
-    "timeline": "short",
-    "payment_method": "loan",
-    "property_requirements": {"bedrooms": 3, "bathrooms": 2, "area_sqft": 1500, "property_type": "apartment"},
-    "intent_level": "high",
-    "qualification_status": "ready_for_agent",
-    "status": "qualified_hot",
-    "ai_conversation_summary": "John is looking for a 3BHK apartment in Whitefield, budget 50-80L, wants to buy in 1-3 months using home loan. Very engaged, provided phone number. Ready for agent follow-up."
-}
-
-SPECIAL CASES:
-
-1. If they provide phone + budget + location + clear timeline → ALWAYS "qualified_hot" and "ready_for_agent"
-2. If vague on all fronts but engaging → "in_progress" and "active"
-3. If they say "just browsing" → "qualified_cold" at best, never "hot"
-4. If conversation died out → "no_response" but keep "active" status if recent
-5. If they're rude or irrelevant → "unqualified" and "spam"
-
-Now analyze the following conversation and produce a JSON strictly matching the fields above.
-""",
-)
-
-    # Run the async agent synchronously
-    result = async_to_sync(Runner.run)(agent, input=conversation_text)
-
-
-    try:
-        lead_update = json.loads(result.final_output)  # parse string to dict
-    except json.JSONDecodeError:
-        print("❌ Failed to parse agent output as JSON:", result.final_output)
-        lead_update = {}
-
-    if lead_update:
-        changed = False
-        for field, value in lead_update.items():
-            if value is not None and hasattr(lead, field):
-                setattr(lead, field, value)
-                changed = True
-        if changed:
-            lead.last_interaction_at = timezone.now()
-            print("✅ Lead updated with", lead_update)
-            lead.save()
+from django.conf import settings
+from django.db import connection, transaction
+from .embeddings import EMBEDDING_MODEL, embed_query, shorten_embedding
 
 
 def summarize_property(listing: PropertyListing) -> str:
@@ -169,7 +26,51 @@ def summarize_property(listing: PropertyListing) -> str:
     )
     return summary
 
-def find_relevant_properties(user_message, company=None, limit=10):
+_pgvector_version = None
+
+
+def pgvector_version():
+    """Installed pgvector extension version as a tuple, e.g. (0, 8, 0)."""
+    global _pgvector_version
+    if _pgvector_version is None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+        _pgvector_version = tuple(int(part) for part in (row[0] if row else "0").split(".") if part.isdigit())
+    return _pgvector_version
+
+
+def search_listings(queryset, query_embedding, limit=10, mode=None):
+    """Order ``queryset`` by cosine distance to a full-size query embedding.
+
+    ``hnsw`` mode searches the shortened ``embedding_small`` column through
+    its HNSW index; ``exact`` scans the full 3072-d ``embedding`` column.
+    Listings embedded with another model than queries are left out.
+    """
+    mode = mode or settings.LISTING_VECTOR_SEARCH
+    queryset = queryset.filter(embedding_model__in=["", EMBEDDING_MODEL])
+    if mode != "hnsw":
+        return list(
+            queryset.exclude(embedding=None)
+            .annotate(similarity=CosineDistance("embedding", query_embedding))
+            .order_by("similarity")[:limit]
+        )
+    query_embedding = shorten_embedding(query_embedding, settings.LISTING_EMBEDDING_DIMENSIONS)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL hnsw.ef_search = %s", [max(settings.LISTING_HNSW_EF_SEARCH, limit)])
+            if pgvector_version() >= (0, 8):
+                # Keep scanning the graph until enough rows pass the company filter
+                cursor.execute("SET LOCAL hnsw.iterative_scan = relaxed_order")
+        listings = list(
+            queryset.exclude(embedding_small=None)
+            .annotate(similarity=CosineDistance("embedding_small", query_embedding))
+            .order_by("similarity")[:limit]
+        )
+    return sorted(listings, key=lambda listing: listing.similarity)
+
+
+def find_relevant_listings(user_message, company=None, limit=10):
     """Find the most semantically similar properties to a user's query.
 
     Args:
@@ -177,59 +78,78 @@ def find_relevant_properties(user_message, company=None, limit=10):
         company: Optional Company instance to filter properties by
         limit: Maximum number of properties to return
     """
-    client = OpenAI()
-    query_embedding = client.embeddings.create(
-        model="text-embedding-3-large",
-        input=user_message
-    ).data[0].embedding
+    query_embedding = embed_query(user_message)
 
-    queryset = PropertyListing.objects.exclude(embedding=None)
+    queryset = PropertyListing.objects.select_related("company")
 
     # Filter by company if provided - IMPORTANT: prevents cross-company data leakage
     if company:
         queryset = queryset.filter(company=company)
 
-    listings = (
-        queryset
-        .annotate(similarity=CosineDistance("embedding", query_embedding))
-        .order_by("similarity")[:limit]
-    )
+    return search_listings(queryset, query_embedding, limit)
+
 
-    # Return full summaries for context feeding
-    return [summarize_property(l) for l in listings]
+def find_relevant_properties(user_message, company=None, limit=10):
+    """Summaries of :func:`find_relevant_listings`, for context feeding."""
+    return [summarize_property(l) for l in find_relevant_listings(user_message, company, limit)]
+
+
+def _parse_message_event(messaging_item: dict):
+    return {
+        "webhook_type": "message",
+        "sender": messaging_item["sender"]["id"],
+        "sender_username": messaging_item["sender"]["id"],
+        "recipient": messaging_item["recipient"]["id"],
+        "message": messaging_item["message"]["text"],
+        "message_id": messaging_item["message"]["mid"],
+    }
+
+
+def _parse_comment_event(entry: dict, change: dict):
+    value = change["value"]
+    return {
+        "webhook_type": "comment",
+        "recipient": entry["id"],
+        "sender": value["from"]["id"],
+        "sender_username": value["from"]["username"],
+        "post_id": value["media"]["id"],
+        "parent_id": value.get("parent_id", ""),
+        "comment_id": value["id"],
+        "post_type": value["media"]["media_product_type"],
+        "comment_text": value["text"],
+    }
 
 
 def parse_instagram_payload(data: dict):
-    try:
-        response = {"webhook_type": "unknown"}
-        entry = data.get("entry", [])
+    """Yield one normalized event per entry / messaging item / change.
+
+    Meta batches several events into a single delivery under load, so every
+    item is parsed independently; a malformed item is skipped without
+    dropping the rest of the batch.
+    """
+    for entry in data.get("entry", []) or []:
         if not entry:
-            return response
-        latest_entry = entry[0]
-        if not latest_entry:
-            return response
-        if "messaging" in latest_entry:
-            message_data = latest_entry["messaging"][0]
-            response["webhook_type"] = "message"
-            response["sender"] = message_data["sender"]["id"]
-            response["sender_username"] = message_data["sender"]["id"]
-            response["recipient"] = message_data["recipient"]["id"]
-            response["message"] = message_data["message"]["text"]
-            response["message_id"] = message_data["message"]["mid"]
-            return response
-        if "changes" in latest_entry:
-            comment_data = latest_entry["changes"][0]
-            response["webhook_type"] = "comment"
-            response["recipient"] = latest_entry["id"]
-            response["sender"] = comment_data["value"]["from"]["id"]
-            response["sender_username"] = comment_data["value"]["from"]["username"]
-            response["post_id"] = comment_data["value"]["media"]["id"]
-            response["parent_id"] = comment_data["value"].get("parent_id","")
-            response["comment_id"] = comment_data["value"]["id"]
-            response["post_type"] = comment_data["value"]["media"]["media_product_type"]
-            response["comment_text"] = comment_data["value"]["text"]
-            return response
-        return response
-    except Exception as error:
-        print("Error on webhook data parse", error)
-        return {"webhook_type": "unknown"}
\ No newline at end of file
+            continue
+        for messaging_item in entry.get("messaging", []) or []:
+            try:
+                yield _parse_message_event(messaging_item)
+            except Exception as error:
+                print("Error on webhook message parse", error)
+        for change in entry.get("changes", []) or []:
+            try:
+                yield _parse_comment_event(entry, change)
+            except Exception as error:
+                print("Error on webhook comment parse", error)
+
+
+def conversation_key(event: dict) -> str:
+    """Key that identifies the conversation an event belongs to."""
+    return str(event.get("recipient", "")) + "_" + str(event.get("sender", ""))
+
+
+def group_events_by_conversation(events):
+    """Group events per conversation, preserving arrival order inside each."""
+    grouped = {}
+    for event in events:
+        grouped.setdefault(conversation_key(event), []).append(event)
+    return grouped
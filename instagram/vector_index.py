@@ -0,0 +1,118 @@
+#pylint:disable=all
+"""In-process vector index of each company's listings.
+
+Most companies have a few hundred listings at most. For them the shortened,
+normalized listing embeddings are held in one contiguous float32 NumPy
+matrix per company and ranked with a single matrix-vector product, instead
+of a pgvector round trip. Companies above ``LISTING_MEMORY_INDEX_MAX_ROWS``
+(or with the index disabled) keep using pgvector.
+
+Indexes load lazily, are dropped when the embedding queue
+(``listing_embeddings``) writes a company's embeddings or a listing is
+deleted, and expire after ``LISTING_MEMORY_INDEX_TTL`` seconds so changes
+made by other processes show up.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from realestate.models import PropertyListing
+
+from .embeddings import EMBEDDING_MODEL
+from .utils import search_listings
+
+# Cached marker for companies that have too many listings for memory
+_TOO_LARGE = object()
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+class CompanyVectorIndex:
+    __slots__ = ("ids", "matrix")
+
+    def __init__(self, ids, vectors, dimensions):
+        """``vectors`` (``embedding_small`` values) are cut to ``dimensions`` and normalized."""
+        self.ids = np.asarray(ids, dtype=np.int64)
+        matrix = np.array(vectors, dtype=np.float32).reshape(len(self.ids), -1)[:, :dimensions]
+        matrix = np.ascontiguousarray(matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = matrix / norms
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query_embedding, limit, allowed_ids=None):
+        """Ids of the ``limit`` nearest listings (cosine), best first."""
+        if not len(self.ids):
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)[: self.matrix.shape[1]]
+        query = query / (np.linalg.norm(query) or 1.0)
+        similarities = self.matrix @ query
+        if allowed_ids is not None:
+            mask = np.isin(self.ids, np.fromiter(allowed_ids, dtype=np.int64))
+            similarities = np.where(mask, similarities, -np.inf)
+            limit = min(limit, int(mask.sum()))
+        limit = min(limit, len(self.ids))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-similarities, limit - 1)[:limit]
+        top = top[np.argsort(-similarities[top])]
+        return self.ids[top].tolist()
+
+
+def _load(company_id):
+    # embedding_small, like the HNSW search, so both rank listings the same way
+    queryset = (
+        PropertyListing.objects.filter(company_id=company_id, embedding_model__in=["", EMBEDDING_MODEL])
+        .exclude(embedding_small=None)
+    )
+    if queryset.count() > settings.LISTING_MEMORY_INDEX_MAX_ROWS:
+        return _TOO_LARGE
+    dimensions = settings.LISTING_EMBEDDING_DIMENSIONS
+    rows = list(queryset.values_list("id", "embedding_small"))
+    if not rows:
+        return CompanyVectorIndex([], np.zeros((0, dimensions)), dimensions)
+    return CompanyVectorIndex([row[0] for row in rows], [row[1] for row in rows], dimensions)
+
+
+def get_company_index(company_id):
+    """The company's in-memory index, or None when pgvector should be used."""
+    if not settings.LISTING_MEMORY_INDEX:
+        return None
+    now = time.monotonic()
+    with _lock:
+        entry = _indexes.get(company_id)
+        if entry and entry[1] > now:
+            _indexes.move_to_end(company_id)
+            return None if entry[0] is _TOO_LARGE else entry[0]
+    index = _load(company_id)
+    with _lock:
+        _indexes[company_id] = (index, now + settings.LISTING_MEMORY_INDEX_TTL)
+        _indexes.move_to_end(company_id)
+        while len(_indexes) > settings.LISTING_MEMORY_INDEX_COMPANIES:
+            _indexes.popitem(last=False)
+    return None if index is _TOO_LARGE else index
+
+
+def invalidate_company_index(company_id):
+    with _lock:
+        _indexes.pop(company_id, None)
+
+
+def vector_search(queryset, company_id, query_embedding, limit):
+    """Rank ``queryset`` (one company's listings) by similarity to the query.
+
+    The SQL filters of ``queryset`` still apply: only its ids are eligible.
+    """
+    index = get_company_index(company_id)
+    if index is None:
+        return search_listings(queryset, query_embedding, limit)
+    allowed = list(queryset.values_list("id", flat=True))
+    ids = index.search(query_embedding, limit, allowed_ids=allowed)
+    by_id = queryset.in_bulk(ids)
+    return [by_id[listing_id] for listing_id in ids if listing_id in by_id]
@@ -29,33 +29,79 @@ from django.utils import timezone
 from asgiref.sync import sync_to_async, async_to_sync
 
 from agents import Agent, Runner
-import threading
 from .utils import (
-    extract_lead_data_async,
     parse_instagram_payload,
-    find_relevant_properties,
+    group_events_by_conversation,
 )
-from core.models import Subscription, EventRegister
 from .session import MyCustomSession
-from .agent_instructions import AGENT_1, AGENT_2
+from .lead_extraction import DMTurn, merge_lead_update, schedule_lead_extraction
+from .retrieval import NAME_INTRO, SMALL_TALK, retrieve_context
+from .contact_extraction import apply_contact_details
+from .comment_cache import cache_settings, comment_cache_key, get_cached_reply, store_reply
+from .comment_triggers import get_trigger_matcher, record_trigger_result
+from .prefilter import classify_event, record_skip
+from .jobs import aenqueue_events, enqueue_events, schedule_drain
+from . import graph
+from .tenants import aget_tenant
+from core.entitlements import aget_entitlements
+from .agent_instructions import AGENT_1, AGENT_1_CONTEXT, AGENT_1_LEAD_UPDATE, AGENT_2
 GPT_MODEL_NAME = "gpt-5"
 # GPT_MODEL_NAME = "gpt-5-mini"
+
+_dm_agents = {}
+
+
+def get_dm_agent(structured=False):
+    """The DM agent; its instructions are static, so one instance serves every company.
+
+    ``structured`` returns the variant that answers with a ``DMTurn`` (reply
+    plus lead field delta) instead of plain text.
+    """
+    if structured not in _dm_agents:
+        _dm_agents[structured] = Agent(
+            name="Instagram Real Estate Assistant",
+            model=GPT_MODEL_NAME,
+            instructions=AGENT_1_LEAD_UPDATE if structured else AGENT_1,
+            output_type=DMTurn if structured else None,
+        )
+    return _dm_agents[structured]
+
+
+def log_llm_usage(label, result):
+    """Print token usage of an agent run, including prompt-cache hits."""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    input_tokens = usage.input_tokens or 0
+    ratio = cached / input_tokens if input_tokens else 0
+    print(
+        f"LLM usage ({label}): input {input_tokens} tokens, "
+        f"cached {cached} ({ratio:.0%}), output {usage.output_tokens}"
+    )
+
 @method_decorator(csrf_exempt, name="dispatch")
 class InstagramWebHookView(View):
 
-    def update_lead_from_ai(self, lead, update_data: dict):
-        changed = False
-        for field, value in update_data.items():
-            if value is not None and hasattr(lead, field):
-                setattr(lead, field, value)
-                changed = True
+    def update_lead_from_ai(self, lead, update_data: dict, through_message_id=None):
+        changed = merge_lead_update(lead, update_data)
 
         # Optionally update summary and timestamp
         if update_data.get("summary"):
             lead.ai_conversation_summary = update_data["summary"]
+            changed.append("ai_conversation_summary")
+        fields = list(changed)
+        if through_message_id:
+            # The extractor need not read these messages again if the mode is switched off
+            lead.extracted_through_message_id = through_message_id
+            fields.append("extracted_through_message_id")
         if changed:
             lead.last_interaction_at = timezone.now()
-            lead.save()
+            fields.append("last_interaction_at")
+        if fields:
+            lead.save(update_fields=fields + ["updated_at"])
+        return changed
 
     def get(self, request):
         token_sent = request.GET.get("hub.verify_token")
@@ -66,20 +112,30 @@ class InstagramWebHookView(View):
 
     async def get_reply_from_llm_async(self, conversation_id, user_message):
         """Uses OpenAI Agent to get a contextual LLM reply."""
-        session = MyCustomSession(conversation_id, self.lead)
-        # Pass company to filter properties - prevents cross-company data leakage
-        context_snippets = await sync_to_async(find_relevant_properties)(user_message, company=self.company)
-        context_text = "\n".join(context_snippets)
+        session = MyCustomSession.for_company(conversation_id, self.lead, self.company)
+        # Greetings, names, phone numbers etc. reuse the previous turn's listings
+        self.retrieval = await sync_to_async(retrieve_context)(
+            user_message, self.lead, self.company, conversation_id
+        )
+        context_text = "\n".join(self.retrieval["snippets"])
+        # History already ends with the user's message(s). Static instructions
+        # and the append-only history form a stable, cacheable prefix; the
+        # per-company, per-turn context trails it.
         messages = await session.get_items()
         print("History going to LLM:", messages)
-        agent = Agent(
-            name="Instagram Real Estate Assistant",
-            model=GPT_MODEL_NAME,
-            instructions=AGENT_1.format(
+        context_message = {
+            "role": "developer",
+            "content": AGENT_1_CONTEXT.format(
                 company_name=self.company.name, context_text=context_text
             ),
-        )
-        result = await Runner.run(agent, input=user_message, session=session)
+        }
+        structured = bool(self.company.detail.get("dm_merged_lead_extraction", False))
+        result = await Runner.run(get_dm_agent(structured), input=messages + [context_message])
+        log_llm_usage(f"dm company {self.company.id}", result)
+        if structured:
+            self.lead_update = result.final_output.lead_update.delta()
+            return result.final_output.reply
+        self.lead_update = None
         return result.final_output
         #return "Reply from llm"
 
@@ -88,52 +144,68 @@ class InstagramWebHookView(View):
             conversation_id, user_message
         )
 
-    def reply_to_message(
+    async def reply_to_message(
         self, company_business_ig_id, recipient_ig_id, message, access_token
     ):
-        url = f"https://graph.instagram.com/v24.0/{company_business_ig_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
-        data = {"recipient": {"id": recipient_ig_id}, "message": {"text": message}}
-
-        response = requests.post(url, json=data, headers=headers)
-        return response.json()
-
-        return {}
+        return await graph.asend_message(
+            company_business_ig_id, recipient_ig_id, message, access_token
+        )
 
     def handle_message(self, data: dict):
+        return graph.run_sync(self.handle_message_async, data)
+
+    async def handle_message_async(self, data: dict):
         if not data["recipient"]:
             return {}
         message_id = data["message_id"]
-        try:
-            message = ConversationMessage.objects.get(instagram_message_id=message_id)
+        # A debounced burst carries every DM merged into this turn
+        burst = data.get("burst") or [{"message_id": message_id, "message": data["message"]}]
+        # Redeliveries are dropped at enqueue time. A job retry may find the
+        # messages stored by the failed attempt: they are not stored again, and
+        # the turn only counts as processed once a reply was stored after them.
+        stored_ids = {
+            instagram_message_id: stored_id
+            async for instagram_message_id, stored_id in ConversationMessage.objects.filter(
+                instagram_message_id__in=[item["message_id"] for item in burst]
+            ).values_list("instagram_message_id", "id")
+        }
+        if len(stored_ids) == len(burst) and await ConversationMessage.objects.filter(
+            conversation_id=str(data["recipient"]) + "_" + str(data["sender"]),
+            sender_type="assistant",
+            id__gt=max(stored_ids.values()),
+        ).aexists():
             print("Message already processed", message_id)
             return {}
-        except ConversationMessage.DoesNotExist:
-            pass
-        try:
-            company_instagram_account = InstagramAccount.objects.get(
-                fb_data__instagram_business_account_id=data["recipient"]
-            )
-        except InstagramAccount.DoesNotExist:
+        new_items = [item for item in burst if item["message_id"] not in stored_ids]
+        data = {**data, "message": "\n".join(str(item["message"]) for item in burst)}
+        tenant = await aget_tenant(data["recipient"])
+        if tenant is None:
             return {}
+        company_instagram_account = tenant.account
         conversation_id = str(data["recipient"]) + "_" + str(data["sender"])
         self.company = company_instagram_account.company
         if not self.company.detail.get('enable_dm_response', True):
             print("DM response feature not enabled for company", self.company.id)
             return {}
-        subscription = Subscription.objects.filter(company=self.company).first()
+        # New conversations pass the local spam / noise filter before a lead is created
+        if not await Lead.objects.filter(instagram_conversation_id=conversation_id, company=self.company).aexists():
+            verdict, reason = classify_event(self.company, "dm", data["sender"], data["message"], message_id)
+            if verdict != "actionable":
+                print(f"Skipping {verdict} DM ({reason}) from", data["sender"])
+                await sync_to_async(record_skip)(self.company.id, "dm", verdict, reason)
+                return {}
+        subscription = tenant.subscription
+        entitlements = await aget_entitlements(self.company.id)
         if (
             not subscription
-            or not subscription.is_active()
-            or subscription.has_permission("instagram_dm") is False
+            or not entitlements
+            or not entitlements.is_active()
+            or not entitlements.has_permission("instagram_dm")
         ):
             print("No active subscription to handle DM")
             return {}
         # Lookup by BOTH conversation_id AND company to ensure lead isolation per company
-        lead, created = Lead.objects.get_or_create(
+        lead, created = await Lead.objects.aget_or_create(
             instagram_conversation_id=conversation_id,
             company=company_instagram_account.company,
             defaults={
@@ -151,47 +223,56 @@ class InstagramWebHookView(View):
             lead.last_customer_message = str(data["message"])
             lead.last_interaction_at = timezone.now()
             # Don't update source_type - keep original
-            lead.save(update_fields=['last_customer_message', 'last_interaction_at', 'status'])
+            await lead.asave(update_fields=['last_customer_message', 'last_interaction_at', 'status'])
 
+        # Phone, email and budget are parsed locally and saved before any LLM call
+        contact_fields = apply_contact_details(lead, data["message"])
+        if contact_fields:
+            await lead.asave(update_fields=contact_fields + ['updated_at'])
+            print(f"Lead {lead.id} updated from message text: {', '.join(contact_fields)}")
         
         if created:
-            # Increment leads_used count
-            subscription.leads_used += 1
-            subscription.save()
+            has_quota = await subscription.areserve_lead()
             print("New lead created from Instagram DM:", lead.id)
+        else:
+            has_quota = await subscription.ahas_lead_quota()
         self.lead = lead
 
         # If human agent is assigned, store the message but skip AI reply
-        if self.lead.human_agent_assigned:
+        if self.lead.human_agent_assigned_id:
             print("Human agent assigned - storing message but skipping AI reply")
-            # Store the user's message
-            ConversationMessage.objects.create(
-                lead=self.lead,
-                conversation_id=conversation_id,
-                sender_type='user',
-                message_text=str(data["message"]),
-                message_type='information_response',
-                is_from_instagram=True,
-                instagram_message_id=message_id,
+            # Store the user's messages
+            await ConversationMessage.objects.abulk_create(
+                [
+                    ConversationMessage(
+                        lead=self.lead,
+                        conversation_id=conversation_id,
+                        sender_type='user',
+                        message_text=str(item["message"]),
+                        message_type='information_response',
+                        is_from_instagram=True,
+                        instagram_message_id=item["message_id"],
+                    )
+                    for item in new_items
+                ]
             )
             # Update unread count for inbox
             if self.lead.metadata is None:
                 self.lead.metadata = {}
-            self.lead.metadata['unread_count'] = self.lead.metadata.get('unread_count', 0) + 1
+            self.lead.metadata['unread_count'] = self.lead.metadata.get('unread_count', 0) + len(new_items)
             self.lead.last_customer_message = str(data["message"])
             self.lead.last_interaction_at = timezone.now()
-            self.lead.save(update_fields=['metadata', 'last_customer_message', 'last_interaction_at'])
+            await self.lead.asave(update_fields=['metadata', 'last_customer_message', 'last_interaction_at'])
             print(f"Message stored for lead {self.lead.id}, unread count: {self.lead.metadata['unread_count']}")
             return {}
         if (
-            not subscription
-            or not subscription.is_active()
-            or subscription.has_permission("instagram_dm_ai_reply") is False
-            or subscription.lead_quota_exceeded()
+            not entitlements.is_active()
+            or not entitlements.has_permission("instagram_dm_ai_reply")
+            or not has_quota
         ):
             # Check if we've already sent the static first DM
             if not self.lead.metadata or self.lead.metadata.get("static_first_dm") != "done":
-                response_to_user = self.reply_to_message(
+                response_to_user = await self.reply_to_message(
                     recipient_ig_id=data["sender"],
                     company_business_ig_id=data["recipient"],
                     message=self.company.detail.get("static_dm_reply", "Thanks for reaching out to us, we will contact you shortly."),
@@ -202,7 +283,7 @@ class InstagramWebHookView(View):
                 if self.lead.metadata is None:
                     self.lead.metadata = {}
                 self.lead.metadata["static_first_dm"] = "done"
-                self.lead.save(update_fields=['metadata'])
+                await self.lead.asave(update_fields=['metadata'])
                 
                 print("Static DM reply sent to user for company", self.company.id)
             else:
@@ -211,54 +292,76 @@ class InstagramWebHookView(View):
             print("Inactive or invalid subscription for company to generate ai reply", self.company.id)
             return {}
 
-        # Prevent automatic reply a new lead when quota is 0
-        if subscription.lead_quota_exceeded():
-            print(f"Lead quota exhausted for company {self.company.id}")
-            return {}
-
         # Initialize the custom session
-        session = MyCustomSession(conversation_id, self.lead)
-        # Store the user's message via session abstraction
-        async_to_sync(session.add_items)(
-            [
-                {
-                    "sender_type": "user",
-                    "message_text": str(data["message"]),
-                    "message_type": "initial_inquiry",
-                    "extracted_data": {},
-                    "confidence_score": None,
-                    "is_from_instagram": True,
-                    "instagram_message_id": message_id,
-                }
-            ]
-        )
-        reply_message = self.get_reply_from_llm(conversation_id, data["message"])
+        session = MyCustomSession.for_company(conversation_id, self.lead, self.company)
+        # Store the user's message(s) via session abstraction; a retry only
+        # adds those the failed attempt had not stored yet
+        if new_items:
+            await session.add_items(
+                [
+                    {
+                        "sender_type": "user",
+                        "message_text": str(item["message"]),
+                        "message_type": "initial_inquiry",
+                        "extracted_data": {},
+                        "confidence_score": None,
+                        "is_from_instagram": True,
+                        "instagram_message_id": item["message_id"],
+                    }
+                    for item in new_items
+                ]
+            )
+        reply_message = await self.get_reply_from_llm_async(conversation_id, data["message"])
 
         # Send reply via Instagram API
-        response_to_user = self.reply_to_message(
+        response_to_user = await self.reply_to_message(
             recipient_ig_id=data["sender"],
             company_business_ig_id=data["recipient"],
             message=reply_message,
             access_token=company_instagram_account.instagram_data["access_token"],
         )
         print("Response to user", response_to_user)
-        threading.Thread(
-            target=extract_lead_data_async, args=(self.lead.id,), daemon=True
-        ).start()
         # Store assistant reply
-        async_to_sync(session.add_items)(
+        await session.add_items(
             [
                 {
                     "sender_type": "assistant",
                     "message_text": reply_message,
                     "message_type": "follow_up",
-                    "extracted_data": {},
+                    "extracted_data": {
+                        key: value for key, value in self.retrieval.items() if key != "snippets"
+                    },
                     "confidence_score": 1.0,
                     "is_from_instagram": True,
                     "instagram_message_id": response_to_user.get("message_id"),
                 }
             ]
         )
+        if self.lead_update is not None:
+            # Merged mode: the reply call already extracted the lead fields
+            through_message_id = await (
+                ConversationMessage.objects.filter(conversation_id=conversation_id)
+                .order_by("-id")
+                .values_list("id", flat=True)
+                .afirst()
+            )
+            changed = await sync_to_async(self.update_lead_from_ai)(
+                self.lead, self.lead_update, through_message_id
+            )
+            if changed:
+                print(f"✅ Lead {self.lead.id} updated from the reply: {', '.join(changed)}")
+        elif self.retrieval["retrieval_reason"] == SMALL_TALK and not NAME_INTRO.search(data["message"]):
+            # Greetings and contact details only, already parsed locally. The
+            # next extraction run still reads these messages.
+            print("Skipping lead extraction for small talk / contact details", self.lead.id)
+        else:
+            # Debounced per lead; only messages after the last extraction are sent
+            schedule_lead_extraction(self.lead.id)
+        try:
+            await session.compact()
+        except Exception as e:
+            # The reply is already out; a failed summary must not retry the job
+            print("Error compacting conversation history", e)
 
     async def get_reply_from_llm_async_for_cmments(
         self, user_message, property_context
@@ -271,70 +374,32 @@ class InstagramWebHookView(View):
             instructions=AGENT_2.format(property_context=property_context),
         )
         result = await Runner.run(agent, input=user_message)
+        log_llm_usage(f"comment company {self.company.id}", result)
         return result.final_output
         # return """{
         #     "comment_reply" : "Please check message",
         #     "first_dm" : "Thanks for message us", 
         #     "context_for_dm_handler" : "user commented"}"""
 
-    def reply_to_instagram_comment(self, comment_id, message, access_token):
+    async def reply_to_instagram_comment(self, comment_id, message, access_token):
         """Reply to an Instagram comment using the Graph API."""
-        url = f"https://graph.instagram.com/v24.0/{comment_id}/replies"
-
-        headers = {"Content-Type": "application/json"}
-
-        payload = {"message": message, "access_token": access_token}
-
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response_data = response.json()
-
-            if response.status_code == 200:
-                print(f"Successfully replied to comment {comment_id}")
-                return response_data
-            else:
-                print(f"Failed to reply to comment: {response_data}")
-                return None
-
-        except Exception as e:
-            print(f"Error replying to comment: {str(e)}")
-            return None
+        return await graph.areply_to_comment(comment_id, message, access_token)
 
-    def send_dm_to_commenter(
+    async def send_dm_to_commenter(
         self, comment_id, message, ig_business_account_id, access_token
     ):
         """
         Send a DM to the person who commented.
         Uses comment_id to identify the recipient.
         """
-        url = f"https://graph.instagram.com/v24.0/{ig_business_account_id}/messages"
-
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {access_token}",
-        }
-
-        payload = {
-            "recipient": {"comment_id": comment_id},
-            "message": {"text": message},
-        }
-
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response_data = response.json()
-
-            if response.status_code == 200:
-                print(f"✅ Successfully sent DM via comment {comment_id}")
-                return response_data
-            else:
-                print(f"❌ Failed to send DM: {response_data}")
-                return None
-
-        except Exception as e:
-            print(f"❌ Error sending DM: {str(e)}")
-            return None
+        return await graph.asend_dm_to_commenter(
+            comment_id, message, ig_business_account_id, access_token
+        )
 
     def handle_comments(self, data: dict):
+        return graph.run_sync(self.handle_comments_async, data)
+
+    async def handle_comments_async(self, data: dict):
         print("Comment data", data)
         post_id = data.get("post_id", "")
         comment_id = data["comment_id"]
@@ -344,45 +409,49 @@ class InstagramWebHookView(View):
             return {}
         if not comment_id:
             return {}
-        event = EventRegister.objects.filter(event_id=comment_id).first()
-        if event:
-            print("Comment event already processed", comment_id)
-            return {}
-        EventRegister.objects.create(
-            event_id=comment_id, event_type="instagram_comment", payload=data
-        )
         if not post_id:
             return {}
-        try:
-            company_instagram_account = InstagramAccount.objects.get(
-                fb_data__instagram_business_account_id=data["recipient"]
-            )
-        except InstagramAccount.DoesNotExist:
+        tenant = await aget_tenant(data["recipient"])
+        if tenant is None:
             return {}
+        company_instagram_account = tenant.account
         self.company = company_instagram_account.company
         if not self.company.detail.get('enable_comment_reply', True): 
             print("Comment auto response feature not enabled for company", self.company.id)
             return {}
+        # Private replies are limited per hour; reschedule before replying or
+        # filtering rather than failing halfway
+        graph.check_rate_limit(
+            company_instagram_account.fb_data["instagram_business_account_id"], "private_replies"
+        )
+
+        verdict, reason = classify_event(self.company, "comment", data["sender"], comment_text, comment_id)
+        if verdict != "actionable":
+            print(f"Skipping {verdict} comment ({reason}) from", data["sender"])
+            await sync_to_async(record_skip)(self.company.id, "comment", verdict, reason)
+            return {}
 
         conversation_id = str(data["recipient"]) + "_" + str(data["sender"])
         self.company = company_instagram_account.company
         # Lookup by BOTH conversation_id AND company to ensure lead isolation per company
-        existing_lead = Lead.objects.filter(
+        existing_lead = await Lead.objects.filter(
             instagram_conversation_id=conversation_id,
             company=self.company
-        ).first()
+        ).afirst()
         new_lead = None
-        subscription = Subscription.objects.filter(company=self.company).first()
+        subscription = tenant.subscription
+        entitlements = await aget_entitlements(self.company.id)
         if (
             not subscription
-            or not subscription.is_active()
-            or subscription.has_permission("instagram_comment_auto_response") is False
+            or not entitlements
+            or not entitlements.is_active()
+            or not entitlements.has_permission("instagram_comment_auto_response")
         ):
             print("Comment auto response feature not enabled")
             return {}
         if not existing_lead:
             # Create new lead with company - ensures isolation per company
-            new_lead = Lead.objects.create(
+            new_lead = await Lead.objects.acreate(
                 instagram_conversation_id=conversation_id,
                 company=self.company,
                 source_type="instagram_comment",
@@ -394,16 +463,16 @@ class InstagramWebHookView(View):
             )
         
         if new_lead:
-            # Increment leads_used count
-            subscription.leads_used += 1
-            subscription.save()
+            has_quota = await subscription.areserve_lead()
             print("New lead created from Instagram comment:", new_lead.id)
+        else:
+            has_quota = await subscription.ahas_lead_quota()
             
             
         company_listing_of_post_id = None
         property_context = ""
         try:
-            company_listing_of_post_id = PropertyListing.objects.get(
+            company_listing_of_post_id = await PropertyListing.objects.select_related("company").aget(
                 instagram_post_id=post_id
             )
             property_context = company_listing_of_post_id.summarize_property()
@@ -412,20 +481,25 @@ class InstagramWebHookView(View):
             if self.company.detail.get('enable_comment_reply_only_on_linked_instagram_post_on_property_listing', True): 
                 print("Comment auto response feature not enabled for company if post not linked", self.company.id)
                 return {}
-        lisiting_specific_comment_reply = ""
-        listing_specific_dm_reply = ""
-        if company_listing_of_post_id and company_listing_of_post_id.metadata:
-            trigger_keywords : str = company_listing_of_post_id.metadata.get("instagram_comment_dm_reply_trigger_keyword", "")
-            trigger_keywords_list = [kw.strip().lower() for kw in trigger_keywords.split(",")] if trigger_keywords else []
-            if comment_text.lower() in trigger_keywords_list:
-                lisiting_specific_comment_reply = company_listing_of_post_id.metadata.get("instagram_comment_reply", "")
-                listing_specific_dm_reply = company_listing_of_post_id.metadata.get("instagram_comment_dm_reply", "")
-                
-                
+        # Listing trigger keywords first, then the company's default rules
+        trigger_rule = None
+        trigger_matcher = get_trigger_matcher(self.company, company_listing_of_post_id)
+        if trigger_matcher.rules:
+            trigger_rule, trigger_keyword = trigger_matcher.match(comment_text)
+            await sync_to_async(record_trigger_result)(
+                self.company.id,
+                company_listing_of_post_id.id if company_listing_of_post_id else None,
+                trigger_rule is not None,
+            )
+            if trigger_rule:
+                print(f"Comment matched {trigger_rule.source} trigger rule ({trigger_rule.mode}): {trigger_keyword}")
+        lisiting_specific_comment_reply = trigger_rule.comment_reply if trigger_rule else ""
+        listing_specific_dm_reply = trigger_rule.dm_reply if trigger_rule else ""
+
         lead = existing_lead or new_lead
         
         if company_listing_of_post_id and lead:
-            LeadListing.objects.get_or_create(
+            await LeadListing.objects.aget_or_create(
                 lead=lead,
                 listing=company_listing_of_post_id,
                 defaults={
@@ -434,18 +508,21 @@ class InstagramWebHookView(View):
             )   
         
         if (
-            not subscription
-            or not subscription.is_active()
-            or subscription.has_permission("instagram_comment_ai_response") is False
-            or subscription.lead_quota_exceeded()
+            trigger_rule
+            or not entitlements.is_active()
+            or not entitlements.has_permission("instagram_comment_ai_response")
+            or not has_quota
         ):
-            print("Inactive or invalid ai subscription for company", self.company.id)
-            comment_reply_response = self.reply_to_instagram_comment(
+            if trigger_rule:
+                print("Comment answered by trigger rule, skipping LLM")
+            else:
+                print("Inactive or invalid ai subscription for company", self.company.id)
+            comment_reply_response = await self.reply_to_instagram_comment(
             comment_id=data["comment_id"],
             message=lisiting_specific_comment_reply or self.company.detail.get("static_comment_reply", "Please check your DM"),
             access_token=company_instagram_account.instagram_data["access_token"],
         )
-            send_dm_response = self.send_dm_to_commenter(
+            send_dm_response = await self.send_dm_to_commenter(
             comment_id=comment_id,
             message=listing_specific_dm_reply or self.company.detail.get("static_comment_followup_dm_reply", "Hi, Thanks for commenting on our post. How can we assit you further on your property searchinh journey?"),
             ig_business_account_id=company_instagram_account.fb_data[
@@ -453,31 +530,52 @@ class InstagramWebHookView(View):
             ],
             access_token=company_instagram_account.instagram_data["access_token"],
         )
+            if trigger_rule and new_lead and listing_specific_dm_reply:
+                await ConversationMessage.objects.acreate(
+                    lead=lead,
+                    conversation_id=conversation_id,
+                    sender_type="assistant",
+                    message_text=listing_specific_dm_reply,
+                    message_type="initial_inquiry"
+                )
             return {}
         
-        if subscription.lead_quota_exceeded():
-            print(f"Lead quota exhausted for company {self.company.id}")
-            return {}
-
-        response = async_to_sync(self.get_reply_from_llm_async_for_cmments)(
-            data["comment_text"], property_context
-        )
-        print("LLM comment reply response", response)
-        try:
-            response = json.loads(response)
-        except json.JSONDecodeError:
-            print("❌ Failed to parse LLM comment reply response as JSON:", response)
-            return {}
+        # Stock comments ("price", "dm", "location?") on a listing share cached replies
+        cache_minutes, cache_variations = cache_settings(self.company)
+        cache_key = None
+        if company_listing_of_post_id and cache_minutes:
+            cache_key = comment_cache_key(comment_text)
+        response = None
+        if cache_key:
+            response = await sync_to_async(get_cached_reply)(
+                company_listing_of_post_id.id, property_context, *cache_key, cache_variations
+            )
+            if response:
+                print("Comment reply served from cache", cache_key)
+        if response is None:
+            response = await self.get_reply_from_llm_async_for_cmments(
+                data["comment_text"], property_context
+            )
+            print("LLM comment reply response", response)
+            try:
+                response = json.loads(response)
+            except json.JSONDecodeError:
+                print("❌ Failed to parse LLM comment reply response as JSON:", response)
+                return {}
+            if cache_key:
+                await sync_to_async(store_reply)(
+                    company_listing_of_post_id.id, property_context, *cache_key, response, cache_minutes
+                )
 
         # Extract and store detected language
         detected_language = response.get("detected_language", "english")
         if lead and detected_language:
             lead.preferred_language = detected_language
-            lead.save(update_fields=['preferred_language'])
+            await lead.asave(update_fields=['preferred_language'])
             print(f"Detected language for lead {lead.id}: {detected_language}")
 
         comment_reply = response.get("comment_reply", "Please check your DM")
-        comment_reply_response = self.reply_to_instagram_comment(
+        comment_reply_response = await self.reply_to_instagram_comment(
             comment_id=data["comment_id"],
             message=comment_reply,
             access_token=company_instagram_account.instagram_data["access_token"],
@@ -487,7 +585,7 @@ class InstagramWebHookView(View):
                 "first_dm",
                 "Hi, Thanks for commenting on our post. How can we assit you further on your property searchinh journey?",
             )
-        send_dm_response = self.send_dm_to_commenter(
+        send_dm_response = await self.send_dm_to_commenter(
             comment_id=comment_id,
             message=dm_message,
             ig_business_account_id=company_instagram_account.fb_data[
@@ -496,7 +594,7 @@ class InstagramWebHookView(View):
             access_token=company_instagram_account.instagram_data["access_token"],
         )
         if new_lead:
-            ConversationMessage.objects.create(
+            await ConversationMessage.objects.acreate(
                 lead=lead,
                 conversation_id=conversation_id,
                 sender_type="assistant",
@@ -509,7 +607,7 @@ class InstagramWebHookView(View):
                 ),
                 message_type="initial_inquiry"
             )
-            ConversationMessage.objects.create(
+            await ConversationMessage.objects.acreate(
                 lead=lead,
                 conversation_id=conversation_id,
                 sender_type="assistant",
@@ -519,14 +617,53 @@ class InstagramWebHookView(View):
         print("First dm response", send_dm_response)
         return {}
 
+    def parse_events(self, request):
+        """Return the webhook's events grouped per conversation, or None if invalid."""
+        try:
+            payload = json.loads(request.body)
+        except json.JSONDecodeError:
+            return None
+        return [
+            event
+            for events in group_events_by_conversation(parse_instagram_payload(payload)).values()
+            for event in events
+        ]
+
     def post(self, request):
+        """Validate and enqueue the event; workers run the handlers."""
         print("Webhook data", request.body)
-        data = parse_instagram_payload(json.loads(request.body))
-        if data["webhook_type"] == "message":
-            response = self.handle_message(data=data)
-        if data["webhook_type"] == "comment":
-            response = self.handle_comments(data=data)
-        return JsonResponse({"status": "received"})
+        events = self.parse_events(request)
+        if events is None:
+            return JsonResponse({"status": "invalid payload"}, status=400)
+        if events:
+            enqueue_events(events)
+        return JsonResponse({"status": "received", "events": len(events)})
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncInstagramWebHookView(InstagramWebHookView):
+    """Async webhook endpoint for ASGI deployments (``maedix_core.asgi``).
+
+    Events are still persisted to the job queue first, so nothing is lost if
+    the process dies, but the same process then drains the queue on its event
+    loop. LLM and Graph API waits no longer hold a worker each, so one
+    process can carry hundreds of conversations at once.
+    """
+
+    async def get(self, request):
+        return super().get(request)
+
+    async def post(self, request):
+        print("Webhook data", request.body)
+        events = self.parse_events(request)
+        if events is None:
+            return JsonResponse({"status": "invalid payload"}, status=400)
+        if events:
+            await aenqueue_events(events)
+            # Under WSGI the loop ends with the request; leave it to the workers
+            if "asgi" in getattr(request, "scope", {}):
+                schedule_drain()
+        return JsonResponse({"status": "received", "events": len(events)})
 
 
 class InstagramWebHookSubscribe(View):
@@ -556,7 +693,7 @@ class InstagramWebHookSubscribe(View):
                     {"success": False, "error": "Invalid page data"}, status=400
                 )
 
-            url = f"https://graph.instagram.com/v24.0/{user_id}/subscribed_apps"
+            url = f"{user_id}/subscribed_apps"
 
             params = {
                 "subscribed_fields": "comments,messages",
@@ -567,7 +704,7 @@ class InstagramWebHookSubscribe(View):
                 f"Subscribing to message events for Instagram account: {user_id}"
             )
 
-            response = requests.post(url, params=params, timeout=10)
+            response = graph.post(url, params=params)
             response_data = response.json()
 
             logger.info(f"Instagram subscription response: {response_data}")
@@ -728,7 +865,7 @@ def get_long_lived_toke(short_token):
         "fb_exchange_token": short_token,
     }
 
-    response = requests.get(url, params=params)
+    response = graph.get(url, params=params)
 
     if response.ok:
         data = response.json()
@@ -752,7 +889,7 @@ def instagram_save_token(request):
             "access_token": short_token,
         }
 
-        response = requests.get(url, params=params)
+        response = graph.get(url, params=params)
         user_data = response.json()
         print("Facebook page data", user_data)
         company = get_object_or_404(Company, id=company_id)
@@ -779,8 +916,10 @@ def instagram_save_token(request):
         }
         instagram_account, created = InstagramAccount.objects.update_or_create(
             company=company,
-            instagram_business_account_id=str(fb_data.get("instagram_business_account_id", "")),
-            defaults={"fb_data": fb_data},
+            defaults={
+                "fb_data": fb_data,
+                "instagram_business_account_id": str(fb_data.get("instagram_business_account_id", "")),
+            },
         )
         return JsonResponse({"status": "ok"})
     except Exception as e:
@@ -831,7 +970,7 @@ class InstagramCallbackView(LoginRequiredMixin, View):
 
         try:
             # ---- Step 1: Exchange code for short-lived token ----
-            token_response = requests.post(
+            token_response = graph.post(
                 "https://api.instagram.com/oauth/access_token",
                 data={
                     "client_id": config_data["instagram_app_id"],
@@ -853,7 +992,7 @@ class InstagramCallbackView(LoginRequiredMixin, View):
             short_lived_token = token_data["access_token"]
             user_id = token_data.get("user_id")
             # ---- Step 2: Exchange for long-lived token ----
-            long_lived_response = requests.get(
+            long_lived_response = graph.get(
                 "https://graph.instagram.com/access_token",
                 params={
                     "grant_type": "ig_exchange_token",
@@ -874,7 +1013,7 @@ class InstagramCallbackView(LoginRequiredMixin, View):
             token_expires_at = datetime.now() + timedelta(seconds=expires_in)
 
             # ---- Step 3: Fetch IG user details ----
-            user_info_response = requests.get(
+            user_info_response = graph.get(
                 "https://graph.instagram.com/v21.0/me",
                 params={
                     "fields": "id,username",
@@ -966,7 +1105,9 @@ class FBDisconnectView(LoginRequiredMixin, View):
             if hasattr(company, "instagram_account"):
                 instagram_account = company.instagram_account
                 instagram_account.fb_data = {}
-                instagram_account.save(update_fields=["fb_data"])
+                # Stop routing this account's webhooks to the company
+                instagram_account.instagram_business_account_id = None
+                instagram_account.save(update_fields=["fb_data", "instagram_business_account_id"])
 
                 messages.success(request, "FB account disconnected successfully.")
                 return JsonResponse(
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Serve with an ASGI server to use the async Instagram webhook
+(``/instagram/webhook/async/``), e.g.::
+
+    uvicorn maedix_core.asgi:application --workers 2
 """
 
 import os
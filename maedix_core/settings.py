@@ -43,6 +43,8 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # GinIndex/SearchVector (listing_search_gin) and the HNSW index need it
+    'django.contrib.postgres',
     'rest_framework',
     'core',
     'users',
@@ -137,3 +139,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Listing embeddings
+# text-embedding-3-large vectors are shortened to this many dimensions for the
+# HNSW index (pgvector indexes at most 2000). It must equal
+# realestate.models.EMBEDDING_SMALL_DIMENSIONS (checked at startup); changing
+# both needs a migration and `manage.py backfill_listing_embeddings --dimensions`.
+LISTING_EMBEDDING_DIMENSIONS = int(os.getenv('LISTING_EMBEDDING_DIMENSIONS', '1024'))
+# "hnsw" (approximate, indexed) or "exact" (full 3072-d scan)
+LISTING_VECTOR_SEARCH = os.getenv('LISTING_VECTOR_SEARCH', 'hnsw')
+LISTING_HNSW_EF_SEARCH = int(os.getenv('LISTING_HNSW_EF_SEARCH', '100'))
+# Companies with at most this many embedded listings are searched with an
+# in-process NumPy index instead of pgvector
+LISTING_MEMORY_INDEX = os.getenv('LISTING_MEMORY_INDEX', 'true').lower() == 'true'
+LISTING_MEMORY_INDEX_MAX_ROWS = int(os.getenv('LISTING_MEMORY_INDEX_MAX_ROWS', '2000'))
+LISTING_MEMORY_INDEX_COMPANIES = int(os.getenv('LISTING_MEMORY_INDEX_COMPANIES', '200'))
+LISTING_MEMORY_INDEX_TTL = int(os.getenv('LISTING_MEMORY_INDEX_TTL', '300'))
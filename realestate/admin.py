@@ -1,7 +1,7 @@
 #pylint:disable=all
 from django.contrib import admin
 
-from .models import Company, Membership, PropertyListing, Lead, ConversationMessage, CompanyInvitation, LeadListing, LeadShare
+from .models import Company, Membership, PropertyListing, Lead, ConversationMessage, ConversationSummary, CompanyInvitation, LeadListing, LeadShare
 
 
 @admin.register(LeadShare)
@@ -20,6 +20,9 @@ class LeadAdmin(admin.ModelAdmin):
 @admin.register(ConversationMessage)
 class ConversationMessageAdmin(admin.ModelAdmin):
     pass
+@admin.register(ConversationSummary)
+class ConversationSummaryAdmin(admin.ModelAdmin):
+    pass
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
     pass
@@ -32,4 +35,6 @@ class MembershipAdmin(admin.ModelAdmin):
 
 @admin.register(PropertyListing)
 class PropertyListingAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+    list_display = ("title", "company", "status", "embedding_status", "embedded_at")
+    list_filter = ("status", "embedding_status")
+    exclude = ("embedding", "embedding_small")
\ No newline at end of file
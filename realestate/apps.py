@@ -1,4 +1,21 @@
 from django.apps import AppConfig
+from django.core import checks
+
+
+def check_embedding_dimensions(app_configs, **kwargs):
+    from django.conf import settings
+    from realestate.models import EMBEDDING_SMALL_DIMENSIONS
+
+    if settings.LISTING_EMBEDDING_DIMENSIONS != EMBEDDING_SMALL_DIMENSIONS:
+        return [
+            checks.Error(
+                f"LISTING_EMBEDDING_DIMENSIONS is {settings.LISTING_EMBEDDING_DIMENSIONS} but "
+                f"PropertyListing.embedding_small has {EMBEDDING_SMALL_DIMENSIONS} dimensions.",
+                hint="Set LISTING_EMBEDDING_DIMENSIONS to match, or change the model and migrate.",
+                id="realestate.E001",
+            )
+        ]
+    return []
 
 
 class RealestateConfig(AppConfig):
@@ -8,3 +25,4 @@ class RealestateConfig(AppConfig):
     
     def ready(self):
         import realestate.signals  # noqa
+        checks.register(check_embedding_dimensions)
@@ -13,12 +13,17 @@ from django.db.models import (
     ForeignKey,
     FloatField
 )
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 import secrets
 from datetime import timedelta
 
+# Size of PropertyListing.embedding_small; changing it needs a migration
+EMBEDDING_SMALL_DIMENSIONS = 1024
+
 class PropertyListing(models.Model):
     PROPERTY_TYPES = [
         ("residential", "Residential"),
@@ -52,10 +57,34 @@ class PropertyListing(models.Model):
         ("per_unit", "Per Unit Rate"),
     ]
 
+    EMBEDDING_STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+
     company = models.ForeignKey(
         "Company", on_delete=models.CASCADE, related_name="properties"
     )
     embedding = VectorField(dimensions=3072, null=True)
+    # Shortened, re-normalized copy of ``embedding`` that fits an HNSW index;
+    # settings.LISTING_EMBEDDING_DIMENSIONS must equal EMBEDDING_SMALL_DIMENSIONS
+    embedding_small = VectorField(dimensions=EMBEDDING_SMALL_DIMENSIONS, null=True)
+    # Embedding queue state, see instagram.listing_embeddings
+    embedding_status = models.CharField(max_length=20, choices=EMBEDDING_STATUS_CHOICES, default="pending")
+    # sha256 of the text the stored embedding was built from
+    embedding_hash = models.CharField(max_length=64, blank=True)
+    # Separate marker for embedding_small (text and size), which
+    # ``backfill_listing_embeddings --dimensions`` rewrites on its own
+    embedding_small_hash = models.CharField(max_length=64, blank=True)
+    # Model the stored vectors came from; blank predates this field
+    embedding_model = models.CharField(max_length=100, blank=True)
+    embedding_attempts = models.PositiveSmallIntegerField(default=0)
+    embedding_error = models.TextField(blank=True)
+    # Earliest retry while pending, lease expiry while processing
+    embedding_run_after = models.DateTimeField(default=timezone.now)
+    embedded_at = models.DateTimeField(null=True, blank=True)
     # Core property details
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -107,6 +136,22 @@ class PropertyListing(models.Model):
         verbose_name = "Property Listing"
         verbose_name_plural = "Property Listings"
         ordering = ["-created_at"]
+        indexes = [
+            # Hybrid retrieval pre-filters on these before ranking
+            models.Index(fields=["company", "status", "price"], name="listing_company_status_price"),
+            models.Index(fields=["embedding_status", "embedding_run_after"], name="listing_embedding_queue"),
+            GinIndex(
+                SearchVector("title", "location", "description", "amenities", config="simple"),
+                name="listing_search_gin",
+            ),
+            HnswIndex(
+                name="listing_embedding_small_hnsw",
+                fields=["embedding_small"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
 
     @property
     def is_instagram_connected(self):
@@ -291,6 +336,11 @@ class Lead(models.Model):
         max_length=50, default="greeting"
     )  # greeting, budget, timeline, etc.
 
+    # Incremental AI extraction (instagram.lead_extraction)
+    extracted_state = JSONField(default=dict, blank=True)  # Last extractor output
+    extracted_through_message_id = IntegerField(default=0)  # High-water mark
+    extraction_locked_until = DateTimeField(null=True, blank=True)
+
     # Human Agent Handoff
     requires_human = BooleanField(default=False)
     human_agent_assigned = ForeignKey(CustomUser, on_delete=models.SET_NULL,null=True, blank=True)
@@ -371,6 +421,22 @@ class ConversationMessage(models.Model):
     def __str__(self):
         return "Unknown"
 
+
+class ConversationSummary(models.Model):
+    """Rolling summary of the messages of a conversation that are no longer sent verbatim to the LLM"""
+
+    lead = ForeignKey(Lead, related_name="history_summaries", null=True, on_delete=models.SET_NULL)
+    conversation_id = CharField(max_length=255, unique=True)
+    summary = TextField(blank=True)
+    # Messages with an id up to this one are covered by the summary
+    through_message_id = IntegerField(default=0)
+    summarized_messages = IntegerField(default=0)
+    token_estimate = IntegerField(default=0)
+    updated_at = DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.conversation_id
+
 class QualificationQuestion(models.Model):
     """Questions AI asks to qualify leads"""
 
@@ -5,6 +5,7 @@ from django.views.decorators.http import require_POST, require_GET
 from users.models import CustomUser
 from .models import Membership, Company, PropertyListing, Lead, ConversationMessage, CompanyInvitation, LeadListing, LeadShare, Owner, PropertyOwner
 from core.models import Subscription
+from core.entitlements import get_entitlements
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.http import JsonResponse
 from django.contrib import messages
@@ -15,10 +16,8 @@ from django.db.models import Q, Count, Sum, Avg
 from django.utils import timezone
 from datetime import timedelta
 from instagram.models import InstagramAccount
-
-
-from django.utils import timezone
-from datetime import timedelta
+from instagram import graph
+from instagram.prefilter import prefilter_summary
 
 
 def calculate_lead_score(lead: Lead) -> int:
@@ -262,8 +261,8 @@ class MyInvitationsView(LoginRequiredMixin, View):
 class InvitationsView(LoginRequiredMixin, View):
     def get(self, request, company_id):
         membership = get_object_or_404(Membership, user=request.user, company_id=company_id)
-        subscription = Subscription.objects.filter(company_id=company_id).first()
-        if not subscription or not subscription.is_active() or not subscription.has_permission("multi_agent_collaboration"):
+        entitlements = get_entitlements(int(company_id))
+        if not entitlements or not entitlements.is_active() or not entitlements.has_permission("multi_agent_collaboration"):
             messages.warning(request, "Your company subscription is inactive or do not have permissions to manage invitations. Please renew or upgrade to manage invitations.")
             return redirect('company-detail', company_id=company_id)
         if membership.role not in ['admin', 'manager']:
@@ -647,6 +646,9 @@ class ReportsView(LoginRequiredMixin, View):
         leads_with_response = all_leads.exclude(last_interaction_at__isnull=True).count()
         response_rate = round((leads_with_response / total_leads * 100), 1) if total_leads > 0 else 0
 
+        # Comments / DMs the spam and noise filter kept away from the AI
+        prefilter = prefilter_summary(company.id, days=30)
+
         context = {
             'company': company,
             'membership': membership,
@@ -705,6 +707,9 @@ class ReportsView(LoginRequiredMixin, View):
             'days_active': days_active,
             'avg_leads_per_day': avg_leads_per_day,
             'response_rate': response_rate,
+
+            # Spam / noise filter
+            'prefilter': prefilter,
         }
 
         return render(request, 'realestate/reports.html', context)
@@ -873,18 +878,9 @@ class SendMessageView(LoginRequiredMixin, View):
             }, status=400)
 
         # Send message via Instagram API
-        url = f"https://graph.instagram.com/v24.0/{business_account_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "recipient": {"id": recipient_id},
-            "message": {"text": message_text}
-        }
-
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
+            # Fail fast rather than hold the request thread for a rate-limit slot
+            response = graph.send_message(business_account_id, recipient_id, message_text, access_token, max_rate_wait=0)
             response_data = response.json()
 
             if response.status_code == 200:
@@ -916,6 +912,11 @@ class SendMessageView(LoginRequiredMixin, View):
                     'error': error_msg
                 }, status=400)
 
+        except graph.RateLimited as e:
+            return JsonResponse({
+                'success': False,
+                'error': f'Instagram message limit reached, try again in {max(1, round(e.retry_after))} seconds'
+            }, status=429)
         except requests.RequestException as e:
             return JsonResponse({
                 'success': False,
@@ -1062,12 +1063,12 @@ class LeadDetailView(LoginRequiredMixin, View):
 class ListingCreateView(LoginRequiredMixin, View):
     def post(self, request, company_id):
         company = get_object_or_404(Company, id=company_id)
-        subscription = Subscription.objects.filter(company=company).first()
-        if not subscription or not subscription.is_active() or subscription.has_permission("property_listing_integration") is False:
+        entitlements = get_entitlements(company.id)
+        if not entitlements or not entitlements.is_active() or not entitlements.has_permission("property_listing_integration"):
             messages.warning(request, "Your company subscription is inactive or do not have permissions to create property listings. Please renew or upgrade to create listings.")
             return redirect('listings', company_id=company_id)
         listing_count = PropertyListing.objects.filter(company=company).count()
-        feature = subscription.get_feature("property_listing_integration")
+        feature = entitlements.get_feature("property_listing_integration")
         if feature and feature.get("limit") is not None and listing_count >= feature.get("limit"):
             messages.warning(request, f"You have reached the listing limit of your current plan ({feature.get('limit')} listings). Please upgrade your plan to add more listings.")
             return redirect('listings', company_id=company_id)
@@ -1103,6 +1104,7 @@ class ListingCreateView(LoginRequiredMixin, View):
             instagram_comment_reply = request.POST.get('instagram_comment_reply', '')
             instagram_comment_dm_reply = request.POST.get('instagram_comment_dm_reply', '')
             instagram_comment_dm_reply_trigger_keyword = request.POST.get('instagram_comment_dm_reply_trigger_keyword', '')
+            instagram_comment_trigger_match_mode = request.POST.get('instagram_comment_trigger_match_mode', 'word')
             
             # Validate required fields
             if not all([title, property_type, status, location]):
@@ -1137,6 +1139,7 @@ class ListingCreateView(LoginRequiredMixin, View):
                     "instagram_comment_reply": instagram_comment_reply,
                     "instagram_comment_dm_reply": instagram_comment_dm_reply,
                     "instagram_comment_dm_reply_trigger_keyword": instagram_comment_dm_reply_trigger_keyword,
+                    "instagram_comment_trigger_match_mode": instagram_comment_trigger_match_mode,
                 }
             )
 
@@ -1238,6 +1241,7 @@ class ListingEditView(LoginRequiredMixin, View):
             listing.metadata["instagram_comment_reply"] = request.POST.get('instagram_comment_reply', '')
             listing.metadata["instagram_comment_dm_reply"] = request.POST.get('instagram_comment_dm_reply', '')
             listing.metadata["instagram_comment_dm_reply_trigger_keyword"] = request.POST.get('instagram_comment_dm_reply_trigger_keyword', '')
+            listing.metadata["instagram_comment_trigger_match_mode"] = request.POST.get('instagram_comment_trigger_match_mode', 'word')
             
             # Validate required fields
             if not all([listing.title, listing.property_type, listing.status, listing.location]):
@@ -1300,14 +1304,14 @@ def get_instagram_posts(request, company_id):
         })
     try:
         # Fetch media from Instagram Graph API
-        media_url = f"https://graph.instagram.com/v24.0/{instagram_business_account_id}/media"
+        media_url = f"{instagram_business_account_id}/media"
         params = {
             'fields': 'id,media_type,media_url,thumbnail_url,timestamp,caption',
             'access_token': access_token,
             'limit': 50  # Get last 50 posts
         }
         
-        response = requests.get(media_url, params=params)
+        response = graph.get(media_url, params=params)
         data = response.json()
         
         if 'error' in data:
@@ -1359,8 +1363,43 @@ class CompanyManageView(LoginRequiredMixin, View):
         company.detail["static_comment_reply"] = request.POST.get('static_comment_reply', company.detail.get("static_comment_reply", ""))
         company.detail["static_comment_followup_dm_reply"] = request.POST.get('static_comment_followup_dm_reply', company.detail.get("static_comment_followup_dm_reply", ""))
         company.detail["enable_dm_response"] = 'enable_dm_response' in request.POST
+        company.detail["dm_merged_lead_extraction"] = 'dm_merged_lead_extraction' in request.POST
         company.detail["enable_comment_reply"] = 'enable_comment_reply' in request.POST
         company.detail["enable_comment_reply_only_on_linked_instagram_post_on_property_listing"] = 'enable_comment_reply_only_on_linked_instagram_post_on_property_listing' in request.POST
+        try:
+            company.detail["dm_debounce_seconds"] = max(0, int(request.POST.get('dm_debounce_seconds', company.detail.get("dm_debounce_seconds", 0)) or 0))
+        except ValueError:
+            messages.warning(request, "DM grouping window must be a whole number of seconds.")
+        try:
+            company.detail["history_recent_messages"] = max(1, int(request.POST.get('history_recent_messages', company.detail.get("history_recent_messages", 12)) or 12))
+            company.detail["history_token_budget"] = max(500, int(request.POST.get('history_token_budget', company.detail.get("history_token_budget", 3000)) or 3000))
+        except ValueError:
+            messages.warning(request, "Conversation memory settings must be whole numbers.")
+        try:
+            company.detail["comment_reply_cache_minutes"] = max(0, int(request.POST.get('comment_reply_cache_minutes', company.detail.get("comment_reply_cache_minutes", 360)) or 0))
+            company.detail["comment_reply_variations"] = max(1, int(request.POST.get('comment_reply_variations', company.detail.get("comment_reply_variations", 3)) or 3))
+        except ValueError:
+            messages.warning(request, "Comment reply cache settings must be whole numbers.")
+        company.detail["prefilter_enabled"] = 'prefilter_enabled' in request.POST
+        company.detail["prefilter_skip_noise"] = 'prefilter_skip_noise' in request.POST
+        company.detail["prefilter_blocked_words"] = request.POST.get('prefilter_blocked_words', company.detail.get("prefilter_blocked_words", ""))
+        try:
+            company.detail["prefilter_comment_limit_per_hour"] = max(0, int(request.POST.get('prefilter_comment_limit_per_hour', company.detail.get("prefilter_comment_limit_per_hour", 5)) or 0))
+            company.detail["prefilter_dm_limit_per_hour"] = max(0, int(request.POST.get('prefilter_dm_limit_per_hour', company.detail.get("prefilter_dm_limit_per_hour", 30)) or 0))
+        except ValueError:
+            messages.warning(request, "Spam filter limits must be whole numbers.")
+        # The form edits the first default trigger rule; further rules (set in the admin) are kept
+        if 'comment_trigger_keywords' in request.POST:
+            trigger_rules = list(company.detail.get("comment_trigger_rules") or [])[1:]
+            trigger_keywords = request.POST.get('comment_trigger_keywords', '').strip()
+            if trigger_keywords:
+                trigger_rules.insert(0, {
+                    "keywords": trigger_keywords,
+                    "mode": request.POST.get('comment_trigger_mode', 'word'),
+                    "comment_reply": request.POST.get('comment_trigger_reply', ''),
+                    "dm_reply": request.POST.get('comment_trigger_dm_reply', ''),
+                })
+            company.detail["comment_trigger_rules"] = trigger_rules
         
         company.save()
         
@@ -1402,10 +1441,6 @@ def create_company(request):
 
 
 
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.contrib.auth.decorators import login_required
-
 @login_required
 @require_POST
 def add_lead_to_listing(request, company_id, listing_id):